@@ -0,0 +1,136 @@
+#!/bin/bash -v
+
+# Prepares the log and data volumes, using the per role settings the CLI reads from
+# cloud-formation/<flavour>/disk-layout.json:
+#   PNDA_LOG_DISK      volume mounted on /var/log/panda
+#   PNDA_DATA_DISKS    candidate data volumes, the ones attached are used
+#                      instance types that attach EBS volumes as NVMe devices are handled too
+#   PNDA_DISK_LAYOUT   separate: each volume on its own /dataN
+#                      raid0 or lvm: all volumes striped into a single /data0
+#   PNDA_DISK_TEST_MB  MB to write to each data mount to measure throughput, 0 to skip
+
+set -e
+export DEBIAN_FRONTEND=noninteractive
+
+LOG_DISK=${PNDA_LOG_DISK:-xvdc}
+DATA_DISKS=${PNDA_DATA_DISKS:-"xvdd xvde xvdf xvdg xvdh xvdi xvdj xvdk"}
+LAYOUT=${PNDA_DISK_LAYOUT:-separate}
+TEST_MB=${PNDA_DISK_TEST_MB:-0}
+START=$(date +%s)
+
+# Prints the device a volume attached as e.g. xvdd is at. NVMe devices give the name
+# they were attached as in their vendor specific controller data
+device_for() {
+  if [ -b /dev/$1 ]; then
+    echo /dev/$1
+    return
+  fi
+  ls /dev/nvme[0-9]*n1 > /dev/null 2>&1 || return 0
+  command -v nvme > /dev/null || apt-get -y install --no-install-recommends nvme-cli > /dev/null
+  for NVME in /dev/nvme[0-9]*n1; do
+    NAME=$(nvme id-ctrl --raw-binary $NVME 2> /dev/null | cut -c3073-3104 | tr -d ' \000' | sed 's#^/dev/##')
+    if [ "$NAME" = "$1" ] || [ "$NAME" = "sd${1#xvd}" ]; then
+      echo $NVME
+      return
+    fi
+  done
+}
+
+# NVMe devices can be numbered differently after a reboot, so are mounted by UUID
+fstab_source() {
+  case $1 in
+    /dev/nvme*) echo "UUID=$(blkid -s UUID -o value $1)" ;;
+    *) echo $1 ;;
+  esac
+}
+
+LOG_DEVICE=$(device_for $LOG_DISK)
+LOG_DEVICE=${LOG_DEVICE:-/dev/$LOG_DISK}
+ATTACHED=""
+for DISK in $DATA_DISKS; do
+  DEVICE=$(device_for $DISK)
+  if [ -n "$DEVICE" ]; then
+    ATTACHED="$ATTACHED $DEVICE"
+  fi
+done
+DISK_COUNT=$(echo $ATTACHED | wc -w)
+if [ $DISK_COUNT -lt 2 ]; then
+  LAYOUT=separate
+fi
+
+umount /var/log/panda || echo 'not mounted'
+for MOUNT in $(awk '$2 ~ /^\/data[0-9]+$/ {print $2}' /etc/fstab); do
+  umount $MOUNT || echo 'not mounted'
+done
+sed -i '/ \/var\/log\/panda /d' /etc/fstab
+sed -i '/ \/data[0-9]* /d' /etc/fstab
+mdadm --stop /dev/md0 > /dev/null 2>&1 || true
+vgremove -f pnda-data > /dev/null 2>&1 || true
+
+# -K skips discarding every block, which on EBS takes far longer than building the filesystem,
+# and every volume is formatted at the same time
+# an instance type without instance storage has no log volume unless the template gives it an EBS one
+PIDS=""
+if [ -b $LOG_DEVICE ]; then
+  mkfs.xfs -f -K $LOG_DEVICE &
+  PIDS="$PIDS $!"
+else
+  echo "No log volume at $LOG_DEVICE, /var/log/panda stays on the root volume"
+fi
+
+DEVICES=$ATTACHED
+
+case $LAYOUT in
+  raid0)
+    command -v mdadm > /dev/null || apt-get -y install --no-install-recommends mdadm
+    mdadm --create /dev/md0 --level=0 --chunk=256 --raid-devices=$DISK_COUNT --run --force $DEVICES
+    sed -i '/^ARRAY \/dev\/md0 /d' /etc/mdadm/mdadm.conf
+    mdadm --detail --scan | grep '/dev/md0 ' >> /etc/mdadm/mdadm.conf
+    DATA_DEVICES=/dev/md0
+    ;;
+  lvm)
+    command -v lvcreate > /dev/null || apt-get -y install --no-install-recommends lvm2
+    pvcreate -ff -y $DEVICES
+    vgcreate pnda-data $DEVICES
+    lvcreate -y -i $DISK_COUNT -I 256 -l 100%FREE -n data pnda-data
+    DATA_DEVICES=/dev/pnda-data/data
+    ;;
+  *)
+    DATA_DEVICES=$DEVICES
+    ;;
+esac
+
+for DEVICE in $DATA_DEVICES; do
+  mkfs.xfs -f -K $DEVICE &
+  PIDS="$PIDS $!"
+done
+for PID in $PIDS; do
+  wait $PID
+done
+
+mkdir -p /var/log/panda
+if [ -b $LOG_DEVICE ]; then
+  echo "$(fstab_source $LOG_DEVICE) /var/log/panda auto defaults,nobootwait,comment=cloudconfig 0 2" >> /etc/fstab
+fi
+DATA_IDX=0
+for DEVICE in $DATA_DEVICES; do
+  mkdir -p /data$DATA_IDX
+  echo "$(fstab_source $DEVICE) /data$DATA_IDX auto defaults,nobootwait,comment=cloudconfig 0 2" >> /etc/fstab
+  DATA_IDX=$((DATA_IDX+1))
+done
+cat /etc/fstab
+mount -a
+
+# Lines starting PNDA_DISK_ are picked up from the output by the CLI
+if [ $TEST_MB -gt 0 ]; then
+  DATA_IDX=0
+  for DEVICE in $DATA_DEVICES; do
+    TEST_START=$(date +%s.%N)
+    dd if=/dev/zero of=/data$DATA_IDX/.pnda-throughput bs=1M count=$TEST_MB oflag=direct 2> /dev/null
+    TEST_END=$(date +%s.%N)
+    rm -f /data$DATA_IDX/.pnda-throughput
+    echo "PNDA_DISK_THROUGHPUT /data$DATA_IDX $LAYOUT $(awk "BEGIN {printf \"%.0f\", $TEST_MB / ($TEST_END - $TEST_START)}")"
+    DATA_IDX=$((DATA_IDX+1))
+  done
+fi
+echo "PNDA_DISK_PREP_SECONDS $(( $(date +%s) - START ))"
@@ -0,0 +1,7 @@
+#!/bin/bash -v
+
+set -e
+
+cat > /etc/salt/minion <<EOF
+master: $PNDA_SALTMASTER_IP
+EOF
@@ -0,0 +1,25 @@
+#!/bin/bash
+
+# Works out the .deb files each set of packages needs on a host that is still as the image
+# left it, printing a line for each file that the CLI picks up:
+#   PNDA_PACKAGE <set> '<url>' <file> <size> <hash>
+# or PNDA_PACKAGES_UNAVAILABLE when salt has already been installed here
+# Usage: packages.sh <apt source line> <source key url> <set>=<package>,<package> ...
+
+set -e
+export DEBIAN_FRONTEND=noninteractive
+
+if dpkg -s salt-common > /dev/null 2>&1 ; then
+  echo "PNDA_PACKAGES_UNAVAILABLE salt is already installed, so what a new host needs cannot be worked out here"
+  exit 0
+fi
+
+echo "$1" > /etc/apt/sources.list.d/pnda-packages.list
+wget -q -O - $2 | apt-key add -
+apt-get update > /dev/null
+shift 2
+
+for SET in "$@"; do
+  NAME=${SET%%=*}
+  apt-get -qq --print-uris --no-install-recommends install $(echo ${SET#*=} | tr ',' ' ') | sed "s/^/PNDA_PACKAGE $NAME /"
+done
@@ -7,40 +7,48 @@ echo "Host $PACKAGES_SERVER_IP" >> /root/.ssh/config
 echo "  IdentityFile /tmp/git.pem" >> /root/.ssh/config
 echo "  StrictHostKeyChecking no" >> /root/.ssh/config
 
-apt-get update
-apt-get -y install xfsprogs
-
-echo "Mounting xvdc for logs"
-umount /dev/xvdc || echo 'not mounted' 
-mkfs.xfs -f /dev/xvdc
-mkdir -p /var/log/panda  
-sed -i "/xvdc/d" /etc/fstab
-echo "/dev/xvdc /var/log/panda auto defaults,nobootwait,comment=cloudconfig 0 2" >> /etc/fstab
-
-DISKS="xvdd xvde xvdf"
-DISK_IDX=0
-for DISK in $DISKS; do
-   echo $DISK
-   if [ -b /dev/$DISK ];
-   then
-      echo "Mounting $DISK"
-      umount /dev/$DISK || echo 'not mounted' 
-      mkfs.xfs -f /dev/$DISK
-      mkdir -p /data$DISK_IDX  
-      sed -i "/$DISK/d" /etc/fstab
-      echo "/dev/$DISK /data$DISK_IDX auto defaults,nobootwait,comment=cloudconfig 0 2" >> /etc/fstab
-      DISK_IDX=$((DISK_IDX+1))
-   fi
-done
-cat /etc/fstab
-mount -a
+if [ "x$PNDA_ARTIFACTS_URI" != "x" ] ; then
+  # salt installer and packages from the artifact cache this saltmaster serves, checked against its SHA256SUMS
+  mkdir -p /tmp/pnda-artifacts/debs
+  cd /tmp/pnda-artifacts
+  wget -q -O SHA256SUMS $PNDA_ARTIFACTS_URI/SHA256SUMS
+  # the saltmaster package set, plus any other .deb files added to the manifest under debs/
+  grep -E '  (install_salt.sh|debs/saltmaster/|debs/[^/]+$)' SHA256SUMS > SHA256SUMS.node || true
+  for ARTIFACT in $(awk '{print $2}' SHA256SUMS.node); do
+    mkdir -p $(dirname $ARTIFACT)
+    wget -q -O $ARTIFACT $PNDA_ARTIFACTS_URI/$ARTIFACT
+  done
+  sha256sum -c SHA256SUMS.node
+  cd -
+fi
 
 export DEBIAN_FRONTEND=noninteractive
-apt-get update && apt-get -y install python-pip
-apt-get -y install python-git
-wget -O install_salt.sh https://bootstrap.saltstack.com
-sh install_salt.sh -D -U -M stable 2015.8.10
-apt-get -y install unzip
+DEBS=$(find /tmp/pnda-artifacts/debs -name '*.deb' 2> /dev/null || true)
+if [ "x$DEBS" != "x" ] ; then
+  dpkg -i $DEBS
+else
+  apt-get update
+  apt-get -y install xfsprogs
+fi
+
+bash /tmp/disks.sh
+
+if [ "x$DEBS" = "x" ] ; then
+  apt-get update && apt-get -y install python-pip
+  apt-get -y install python-git
+fi
+# salt-master is already installed when the cached packages include it
+if ! dpkg -s salt-master > /dev/null 2>&1 ; then
+  if [ -f /tmp/pnda-artifacts/install_salt.sh ] ; then
+    cp /tmp/pnda-artifacts/install_salt.sh install_salt.sh
+  else
+    wget -O install_salt.sh https://bootstrap.saltstack.com
+  fi
+  sh install_salt.sh -D -U -M stable 2015.8.10
+fi
+if [ "x$DEBS" = "x" ] ; then
+  apt-get -y install unzip
+fi
 
 cat << EOF > /etc/salt/master
 ## specific PNDA saltmaster config
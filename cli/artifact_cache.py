@@ -0,0 +1,167 @@
+#   Copyright (c) 2016 Cisco and/or its affiliates.
+#   This software is licensed to you under the terms of the Apache License, Version 2.0
+#   (the "License").
+#   You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   Unless required by applicable law or agreed to separately in writing, software distributed
+#   under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+#   ANY KIND, either express or implied.
+#
+#   Purpose: Keep a local, versioned copy of the artifacts nodes download while bootstrapping
+
+import os
+import json
+import string
+import hashlib
+
+import requests
+
+import bundle
+
+SUMS_FILE = 'SHA256SUMS'
+
+
+def load_manifest(filepath, pnda_env):
+    """
+    Reads the artifact manifest, a json object mapping the path of each artifact in the
+    cache to {"url": ..., "sha256": ..., "env": ...}. Only url is required. Variables in
+    urls, e.g. $JAVA_MIRROR, are filled in from pnda_env and entries that still refer to
+    an unset variable are left out. "env" names a variable that nodes should be given the
+    cached copy's url in, in place of the original.
+    """
+    with open(filepath, 'r') as manifest_file:
+        manifest = json.load(manifest_file)
+    artifacts = {}
+    for name, entry in manifest.items():
+        url = string.Template(entry['url']).safe_substitute(pnda_env)
+        if url == '' or '$' in url:
+            continue
+        artifacts[name] = dict(entry, url=url)
+    return artifacts
+
+
+def packages_path(cache_dir, packages, image_id):
+    """ Where the .deb files worked out for the package sets in packages.json on image_id are kept """
+    digest = hashlib.sha256(json.dumps(packages, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(cache_dir, 'packages-%s-%s.json' % (image_id, digest))
+
+
+def resolve_args(packages):
+    """ Arguments for packages.sh to work out the .deb files for the package sets in packages.json """
+    return [packages['source'], packages['key']] + \
+        ['%s=%s' % (name, ','.join(names)) for name, names in sorted(packages['sets'].items())]
+
+
+def parse_packages(output):
+    """
+    Reads the PNDA_PACKAGE lines packages.sh prints into {set: [{"url": ..., "name": ...,
+    "sha256": ...}]}. apt only gives a sha256 for some sources, an md5 being no use here.
+    """
+    sets = {}
+    for line in output:
+        parts = line.split()
+        if len(parts) != 6 or parts[0] != 'PNDA_PACKAGE':
+            continue
+        # apt quotes the url and escapes characters such as the : of an epoch in the file name
+        entry = {'url': parts[2].strip("'"), 'name': parts[3].replace('%', '_')}
+        if parts[5].startswith('SHA256:'):
+            entry['sha256'] = parts[5][len('SHA256:'):]
+        sets.setdefault(parts[1], []).append(entry)
+    return sets
+
+
+def package_artifacts(sets):
+    """ Manifest entries that put the .deb files of each package set under debs/<set>/ """
+    artifacts = {}
+    for set_name, entries in sets.items():
+        for entry in entries:
+            artifact = {'url': entry['url']}
+            if 'sha256' in entry:
+                artifact['sha256'] = entry['sha256']
+            artifacts['debs/%s/%s' % (set_name, entry['name'])] = artifact
+    return artifacts
+
+
+class ArtifactCache(object):
+    """
+    Downloads are stored once under cache_dir, named by the sha256 of their contents.
+    An index maps each url to the digest last fetched from it, so in offline mode the
+    cache can be used without touching the network at all.
+    """
+    def __init__(self, cache_dir, logger):
+        self.cache_dir = cache_dir
+        self.logger = logger
+        self.index_path = os.path.join(cache_dir, 'index.json')
+        try:
+            with open(self.index_path, 'r') as index_file:
+                self.index = json.load(index_file)
+        except (IOError, ValueError):
+            self.index = {}
+
+    def _save_index(self):
+        tmp_path = '%s.tmp' % self.index_path
+        with open(tmp_path, 'w') as index_file:
+            json.dump(self.index, index_file, indent=2, sort_keys=True)
+        os.rename(tmp_path, self.index_path)
+
+    def _path(self, digest):
+        return os.path.join(self.cache_dir, digest)
+
+    def _download(self, url):
+        tmp_path = os.path.join(self.cache_dir, 'download.tmp')
+        sha = hashlib.sha256()
+        response = requests.get(url, stream=True, timeout=60)
+        response.raise_for_status()
+        with open(tmp_path, 'wb') as download_file:
+            for chunk in response.iter_content(65536):
+                sha.update(chunk)
+                download_file.write(chunk)
+        digest = sha.hexdigest()
+        os.rename(tmp_path, self._path(digest))
+        return digest
+
+    def fetch(self, name, entry, offline):
+        """ Returns the local path of the artifact, downloading it unless a good copy is cached """
+        digest = entry.get('sha256') or self.index.get(entry['url'])
+        if digest is not None and os.path.isfile(self._path(digest)):
+            self.logger.debug('Artifact %s is cached as %s', name, digest)
+            return self._path(digest)
+        if offline:
+            raise Exception('Artifact %s (%s) is not in the local cache and cannot be fetched in offline mode'
+                            % (name, entry['url']))
+
+        self.logger.info('Downloading %s from %s', name, entry['url'])
+        digest = self._download(entry['url'])
+        if entry.get('sha256') not in (None, digest):
+            os.remove(self._path(digest))
+            raise Exception('Artifact %s from %s has sha256 %s, expected %s' % (name, entry['url'], digest, entry['sha256']))
+        self.index[entry['url']] = digest
+        self._save_index()
+        return self._path(digest)
+
+    def sync(self, artifacts, offline=False):
+        """
+        Makes sure every artifact is cached and returns the files for a bundle of them:
+        the artifacts under their names plus a SHA256SUMS file that nodes check against.
+        """
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        files = {}
+        for name in sorted(artifacts):
+            files[name] = self.fetch(name, artifacts[name], offline)
+
+        sums = ''.join(['%s  %s\n' % (os.path.basename(files[name]), name) for name in sorted(files)])
+        sums_path = os.path.join(self.cache_dir, '%s-%s' % (SUMS_FILE, hashlib.sha256(sums.encode('utf-8')).hexdigest()[:16]))
+        with open(sums_path, 'w') as sums_file:
+            sums_file.write(sums)
+        files[SUMS_FILE] = sums_path
+        return files
+
+
+def build(artifacts, cache, out_dir, offline=False):
+    """
+    Returns (path, sha256, version) of the bundle of artifacts. The version is taken
+    from the bundle's content hash, so it changes whenever any artifact does.
+    """
+    bundle_path, digest = bundle.build_bundle(cache.sync(artifacts, offline), out_dir, prefix='pnda-artifacts')
+    version = os.path.basename(bundle_path)[:-len('.tar.gz')]
+    return bundle_path, digest, version
@@ -0,0 +1,142 @@
+#   Copyright (c) 2016 Cisco and/or its affiliates.
+#   This software is licensed to you under the terms of the Apache License, Version 2.0
+#   (the "License").
+#   You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   Unless required by applicable law or agreed to separately in writing, software distributed
+#   under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+#   ANY KIND, either express or implied.
+#
+#   Purpose: Shared AWS connections that stay inside API rate limits and retry throttled calls
+
+import time
+import random
+import socket
+import logging
+import threading
+
+import boto.cloudformation
+import boto.ec2
+import boto.s3
+import boto.exception
+
+SERVICES = {
+    'cloudformation': boto.cloudformation,
+    'ec2': boto.ec2,
+    's3': boto.s3
+}
+
+THROTTLING_CODES = ['Throttling', 'ThrottlingException', 'RequestLimitExceeded', 'RequestThrottled',
+                    'TooManyRequestsException', 'SlowDown']
+TRANSIENT_CODES = ['InternalError', 'InternalFailure', 'ServiceUnavailable', 'Unavailable']
+# Calls that change something are only retried when AWS turned them away unprocessed
+MUTATING_PREFIXES = ('create_', 'update_', 'delete_', 'run_', 'terminate_', 'modify_')
+
+LOG = logging.getLogger('everything')
+
+
+class TokenBucket(object):
+    """ Allows rate calls per second on average, with bursts of up to burst calls """
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self._tokens = self.burst
+        self._updated = time.time()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.time()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def _retry_kind(error):
+    """ Returns 'throttled', 'transient' or None for an exception raised by a boto call """
+    if isinstance(error, boto.exception.BotoServerError):
+        if error.error_code in THROTTLING_CODES or error.status == 429:
+            return 'throttled'
+        if error.error_code in TRANSIENT_CODES or error.status in (500, 502, 503, 504):
+            return 'transient'
+        return None
+    if isinstance(error, (socket.error, socket.timeout)):
+        return 'transient'
+    return None
+
+
+class _Client(object):
+    """ Proxy for a boto connection that sends every method call through the registry """
+    def __init__(self, registry, service, connection):
+        self._registry = registry
+        self._service = service
+        self._connection = connection
+
+    def __getattr__(self, name):
+        attribute = getattr(self._connection, name)
+        if not callable(attribute):
+            return attribute
+        def call(*args, **kwargs):
+            return self._registry.call('%s.%s' % (self._service, name), attribute, args, kwargs)
+        return call
+
+
+class ClientRegistry(object):
+    """
+    Hands out one connection per (service, region), created on first use. Calls through
+    them share a token bucket of rate calls per second and are retried with jittered
+    exponential backoff, up to max_attempts times, when AWS throttles them or fails in a
+    way that is worth another try.
+    """
+    def __init__(self, rate=5, burst=10, max_attempts=8, base_delay=0.5, max_delay=20.0):
+        self.bucket = TokenBucket(rate, burst)
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._clients = {}
+        self._lock = threading.Lock()
+        self.calls = {}
+        self.retries = {}
+
+    def get(self, service, region):
+        with self._lock:
+            client = self._clients.get((service, region))
+            if client is None:
+                connection = SERVICES[service].connect_to_region(region)
+                if connection is None:
+                    raise Exception('Could not connect to %s in region %s' % (service, region))
+                client = _Client(self, service, connection)
+                self._clients[(service, region)] = client
+            return client
+
+    def cloudformation(self, region):
+        return self.get('cloudformation', region)
+
+    def ec2(self, region):
+        return self.get('ec2', region)
+
+    def _count(self, counter, name):
+        with self._lock:
+            counter[name] = counter.get(name, 0) + 1
+
+    def call(self, name, method, args, kwargs):
+        mutating = name.split('.', 1)[1].startswith(MUTATING_PREFIXES)
+        attempt = 0
+        while True:
+            self.bucket.acquire()
+            self._count(self.calls, name)
+            try:
+                return method(*args, **kwargs)
+            except Exception as error:
+                kind = _retry_kind(error)
+                attempt += 1
+                if kind is None or (mutating and kind != 'throttled') or attempt >= self.max_attempts:
+                    raise
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                self._count(self.retries, name)
+                LOG.warning('%s was %s (%s), retrying in %.1fs', name, kind, error, delay)
+                time.sleep(delay)
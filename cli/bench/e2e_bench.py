@@ -0,0 +1,408 @@
+#   Copyright (c) 2016 Cisco and/or its affiliates.
+#   This software is licensed to you under the terms of the Apache License, Version 2.0
+#   (the "License").
+#   You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   Unless required by applicable law or agreed to separately in writing, software distributed
+#   under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+#   ANY KIND, either express or implied.
+#
+#   Purpose: Measure the CLI's orchestration overhead for create, expand and destroy without AWS or real hosts
+#
+#   Usage: python cli/bench/e2e_bench.py [--nodes 5 20 100 500] [--latency-ms 50] [--jitter-ms 20]
+#                                        [--failure-rate 0] [--parallel 10] [--json]
+#
+#   Cloud formation and ec2 are replaced by in-process fakes that build their instances
+#   from the generated template, and ssh and scp by fake_ssh.sh. Each cluster size runs in
+#   its own process so peak memory and thread counts are not carried over between sizes.
+
+from __future__ import print_function
+
+import os
+import sys
+import imp
+import json
+import time
+import shutil
+import logging
+import argparse
+import resource
+import tempfile
+import threading
+import subprocess
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+CLI_DIR = os.path.join(BENCH_DIR, '..')
+ROOT = os.path.join(CLI_DIR, '..')
+sys.path.insert(0, CLI_DIR)
+
+CLUSTER = 'bench'
+FLAVOUR = 'standard'
+EVENT_PAGE_SIZE = 100
+
+
+class _Page(list):
+    next_token = None
+
+
+class _Record(object):
+    def __init__(self, **attributes):
+        self.__dict__.update(attributes)
+
+
+def _resolve(value, parameters):
+    if isinstance(value, dict):
+        if 'Ref' in value:
+            return parameters.get(value['Ref'], value['Ref'])
+        if 'Fn::Join' in value:
+            separator, parts = value['Fn::Join']
+            return separator.join([_resolve(part, parameters) for part in parts])
+    return value
+
+
+def _load_template(template_body, template_url):
+    if template_body is not None:
+        return template_body
+    with open(template_url[len('file://'):], 'r') as template_file:
+        return template_file.read()
+
+
+class FakeCloud(object):
+    """
+    Cloud formation and ec2 for one region. A stack's instances are the
+    AWS::EC2::Instance resources of its template, nested stacks included, and each
+    operation completes stack_seconds after it is started. Resources complete one after
+    another over that time and instances are only listed once theirs has.
+    """
+    def __init__(self, stack_seconds, minions_file):
+        self.stack_seconds = stack_seconds
+        self.minions_file = minions_file
+        self.stacks = {}
+        self.addresses = {}
+        self.lock = threading.Lock()
+
+    def connect_to_region(self, region):
+        return self
+
+    # cloud formation
+
+    def _instances(self, template, parameters, resource_name=None):
+        """ Returns the tags of each instance by name, with the top level resource it belongs to """
+        instances = {}
+        for name, resource in template['Resources'].items():
+            properties = resource.get('Properties', {})
+            if resource['Type'] == 'AWS::EC2::Instance':
+                tags = dict([(tag['Key'], _resolve(tag['Value'], parameters)) for tag in properties['Tags']])
+                instances[tags['Name']] = (resource_name or name, tags)
+            elif resource['Type'] == 'AWS::CloudFormation::Stack':
+                child = json.loads(_load_template(None, properties['TemplateURL']))
+                child_parameters = dict([(key, _resolve(value, parameters))
+                                         for key, value in properties.get('Parameters', {}).items()])
+                instances.update(self._instances(child, child_parameters, resource_name or name))
+        return instances
+
+    def _start(self, stack_name, operation, template_body=None, template_url=None, parameters=None):
+        with self.lock:
+            stack = self.stacks.get(stack_name)
+            if stack is None:
+                stack = {'id': 'arn:aws:cloudformation:bench:stack/%s/%s' % (stack_name, time.time()), 'events': []}
+                self.stacks[stack_name] = stack
+            stack['operation'] = operation
+            if operation != 'DELETE':
+                stack['body'] = _load_template(template_body, template_url)
+                stack['parameters'] = dict(parameters)
+                template = json.loads(stack['body'])
+                resources = sorted(template['Resources'].items())
+                instances = self._instances(template, stack['parameters'])
+            else:
+                resources = []
+                instances = {}
+            previous = stack.get('instances', {})
+            stack['instances'] = dict([(name, tags) for name, (_, tags) in instances.items()])
+            with open(self.minions_file, 'w') as minions:
+                minions.write(''.join(['%s\n' % name for other in self.stacks.values()
+                                       for name in sorted(other['instances']) if 'saltmaster' not in name]))
+
+            start = time.time()
+            completes = {}
+            for idx, (name, resource) in enumerate(resources):
+                completes[name] = start + self.stack_seconds * idx / max(1, len(resources))
+                stack['events'].append((completes[name], name, resource['Type'], name, '%s_COMPLETE' % operation))
+            stack['ready_at'] = dict([(name, 0 if name in previous else completes[resource_name])
+                                      for name, (resource_name, _) in instances.items()])
+            stack['finishes_at'] = start + self.stack_seconds
+            stack['events'].append((stack['finishes_at'], stack_name, 'AWS::CloudFormation::Stack',
+                                    stack['id'], '%s_COMPLETE' % operation))
+
+    def create_stack(self, stack_name, template_body=None, template_url=None, parameters=None):
+        self._start(stack_name, 'CREATE', template_body, template_url, parameters)
+
+    def update_stack(self, stack_name, template_body=None, template_url=None, parameters=None):
+        self._start(stack_name, 'UPDATE', template_body, template_url, parameters)
+
+    def delete_stack(self, stack_name):
+        self._start(stack_name, 'DELETE')
+
+    def _find(self, stack_name_or_id):
+        for stack_name, stack in self.stacks.items():
+            if stack_name_or_id in (stack_name, stack['id']):
+                return stack_name, stack
+        raise Exception('Stack with id %s does not exist' % stack_name_or_id)
+
+    def describe_stack_events(self, stack_name_or_id, next_token=None):
+        with self.lock:
+            _, stack = self._find(stack_name_or_id)
+            now = time.time()
+            visible = [event for event in stack['events'] if event[0] <= now]
+        visible.reverse()
+        offset = int(next_token or 0)
+        page = _Page([_Record(event_id='%s-%s' % (stack['id'], len(visible) - offset - idx),
+                              logical_resource_id=logical_id, resource_type=resource_type,
+                              physical_resource_id=physical_id, stack_id=stack['id'],
+                              resource_status=status, resource_status_reason=None)
+                      for idx, (_, logical_id, resource_type, physical_id, status)
+                      in enumerate(visible[offset:offset + EVENT_PAGE_SIZE])])
+        if offset + EVENT_PAGE_SIZE < len(visible):
+            page.next_token = str(offset + EVENT_PAGE_SIZE)
+        return page
+
+    def describe_stacks(self, stack_name):
+        with self.lock:
+            stack_name, stack = self._find(stack_name)
+            if stack.get('body') is None:
+                raise Exception('Stack with id %s does not exist' % stack_name)
+            parameters = [_Record(key=key, value=value) for key, value in stack['parameters'].items()]
+            done = time.time() >= stack['finishes_at']
+            status = '%s_%s' % (stack['operation'], 'COMPLETE' if done else 'IN_PROGRESS')
+        return [_Record(stack_id=stack['id'], stack_status=status, parameters=parameters)]
+
+    def get_template(self, stack_name):
+        with self.lock:
+            _, stack = self._find(stack_name)
+        return {'GetTemplateResponse': {'GetTemplateResult': {'TemplateBody': stack['body']}}}
+
+    # ec2
+
+    def _address(self, name):
+        if name not in self.addresses:
+            idx = len(self.addresses) + 1
+            self.addresses[name] = '10.0.%s.%s' % (idx // 250, idx % 250 + 1)
+        return self.addresses[name]
+
+    def get_all_reservations(self, filters=None, max_results=None, next_token=None):
+        with self.lock:
+            instances = []
+            now = time.time()
+            for stack in self.stacks.values():
+                for name, tags in sorted(stack['instances'].items()):
+                    if tags.get('pnda_cluster') == filters['tag:pnda_cluster'] and stack['ready_at'][name] <= now:
+                        address = self._address(name)
+                        instances.append(_Record(private_ip_address=address, ip_address=address,
+                                                 public_dns_name=None, tags=tags))
+        offset = int(next_token or 0)
+        page = _Page([_Record(instances=instances[offset:offset + max_results])])
+        if offset + max_results < len(instances):
+            page.next_token = str(offset + max_results)
+        return page
+
+
+class ThreadSampler(object):
+    """ Records the highest number of live threads seen while running """
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.peak = threading.active_count()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, threading.active_count())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        return False
+
+
+def node_counts(nodes):
+    """ Splits nodes between the scalable roles, roughly as a real cluster would be """
+    zookeepers = 1 if nodes < 10 else 3
+    remaining = max(3, nodes - zookeepers)
+    kafkas = max(1, remaining // 4)
+    opentsdbs = max(1, remaining * 3 // 20)
+    return {'datanodes': max(1, remaining - kafkas - opentsdbs), 'opentsdb': opentsdbs,
+            'kafka': kafkas, 'zk': zookeepers}
+
+
+def run_worker(args):
+    work_dir = tempfile.mkdtemp(prefix='pnda-bench-')
+    bin_dir = os.path.join(work_dir, 'bin')
+    os.makedirs(bin_dir)
+    for tool in ['ssh', 'scp']:
+        os.symlink(os.path.join(BENCH_DIR, 'fake_ssh.sh'), os.path.join(bin_dir, tool))
+    minions_file = os.path.join(work_dir, 'minions')
+    os.environ.update({'PATH': '%s:%s' % (bin_dir, os.environ['PATH']),
+                       'PNDA_BENCH_LATENCY_MS': str(args.latency_ms),
+                       'PNDA_BENCH_JITTER_MS': str(args.jitter_ms),
+                       'PNDA_BENCH_FAILURE_RATE': str(int(args.failure_rate * 10000)),
+                       'PNDA_BENCH_OUTPUT_LINES': str(args.output_lines),
+                       'PNDA_BENCH_MINIONS': minions_file})
+    for name, value in [('AWS_REGION', 'bench-region'), ('AWS_IMAGE_ID', 'ami-bench'), ('OS_USER', 'ubuntu'),
+                        ('AWS_ACCESS_WHITELIST', '0.0.0.0/0')]:
+        os.environ.setdefault(name, value)
+
+    import aws_clients
+    cloud = FakeCloud(args.stack_seconds, minions_file)
+    aws_clients.SERVICES = {'cloudformation': cloud, 'ec2': cloud}
+
+    cli = imp.load_source('pnda_cli', os.path.join(CLI_DIR, 'pnda-cli.py'))
+    os.chdir(ROOT)
+    if not args.verbose:
+        cli.CONSOLE.setLevel(logging.WARNING)
+    cli.INVENTORY.cache_dir = os.path.join(work_dir, 'cache')
+    cli.JOURNAL_DIR = os.path.join(work_dir, 'journal')
+    cli.LOG_STORE_DIR = os.path.join(work_dir, 'logs')
+    # ssh config and the socks proxy script go in the work directory rather than cli/
+    state = cli.cluster_context.DEFAULT
+    state.state_dir = os.path.join(work_dir, 'state')
+    state.ssh_config = os.path.join(state.state_dir, 'ssh_config')
+    state.socks_proxy = os.path.join(state.state_dir, 'socks_proxy')
+    real_waiter = cli.StackWaiter
+    cli.StackWaiter = lambda conn, stack, logger: real_waiter(conn, stack, logger, min_interval=args.poll_seconds,
+                                                              max_interval=args.poll_seconds)
+    made_git_key = not os.path.isfile('git.pem')
+    if made_git_key:
+        with open('git.pem', 'w') as git_key_file:
+            git_key_file.write('placeholder key for the benchmark\n')
+
+    counts = node_counts(args.nodes)
+    options = argparse.Namespace(parallel=args.parallel, keep_going=False, distribution='direct', minion_timeout=60,
+                                 template_store=os.path.join(work_dir, 'templates'), nested_stacks=False,
+                                 plan_only=False, batch_size=None, artifact_cache=False, offline=False,
+                                 preflight_ttl=0, stream_bootstrap=args.stream_bootstrap)
+    result = {'nodes': args.nodes, 'node_counts': counts, 'phases': {}, 'api_calls': {}, 'ok': True}
+
+    def measure(phase, target, *target_args):
+        calls_before = sum(cli.AWS.calls.values())
+        spans_before = len(cli.TRACER.spans)
+        start = time.time()
+        try:
+            return target(*target_args)
+        except BaseException as exception:
+            result['ok'] = False
+            result['error'] = '%s: %s' % (phase, exception)
+            raise
+        finally:
+            commands = [span for span in cli.TRACER.spans[spans_before:] if span.category == 'command']
+            result['phases'][phase] = {'seconds': time.time() - start,
+                                       'api_calls': sum(cli.AWS.calls.values()) - calls_before,
+                                       'ssh_calls': len(commands)}
+
+    def render(datanodes, kafkas):
+        template_data = cli.generate_template_file(cli.template_path(FLAVOUR), datanodes, counts['opentsdb'],
+                                                   kafkas, counts['zk'])
+        options.nested_stacks = len(template_data['Resources']) > cli.template_engine.RESOURCE_LIMIT
+        return template_data
+
+    expanded_datanodes = counts['datanodes'] + max(1, counts['datanodes'] // 10)
+    with ThreadSampler() as sampler:
+        try:
+            template_data = measure('generate_template_file', render, counts['datanodes'], counts['kafka'])
+            journal = cli.Journal(cli.Journal.path_for(cli.JOURNAL_DIR, CLUSTER))
+            journal.start('create', {})
+            cli.start_log_store(CLUSTER)
+            measure('create', cli.create, template_data, CLUSTER, FLAVOUR, 'bench', True, options, journal)
+            measure('get_instance_map', cli.get_instance_map, CLUSTER, True)
+
+            template_data = render(expanded_datanodes, counts['kafka'] + 1)
+            journal.start('expand', {})
+            measure('expand', cli.expand, template_data, CLUSTER, FLAVOUR, counts['datanodes'], counts['kafka'],
+                    'bench', options, journal)
+            measure('destroy', cli.destroy, CLUSTER)
+        except (Exception, SystemExit):
+            pass
+
+    result['api_calls'] = dict(cli.AWS.calls)
+    result['api_retries'] = dict(cli.AWS.retries)
+    result['peak_threads'] = sampler.peak
+    # ru_maxrss is in KB on linux and bytes on os x
+    result['peak_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024.0 * (1024 if sys.platform == 'darwin' else 1))
+
+    # nothing to tidy up at exit, and no log or trace files for the benchmark's own runs
+    context = cli.cluster_context.DEFAULT
+    context.ssh_hosts.clear()
+    if context.logs is not None:
+        context.logs.close()
+        context.logs = None
+    del cli.TRACER.spans[:]
+    if made_git_key:
+        os.remove('git.pem')
+    if not args.verbose:
+        logging.shutdown()
+        os.remove(os.path.join(CLI_DIR, cli.LOG_FILE_NAME))
+    shutil.rmtree(work_dir, ignore_errors=True)
+    print(json.dumps(result))
+
+
+def run_sizes(args):
+    """ Runs a worker for each size and reports on them, returning whether every size succeeded """
+    results = []
+    for nodes in args.nodes_list:
+        cmd = [sys.executable, os.path.abspath(__file__), '--worker', '--nodes', str(nodes),
+               '--latency-ms', str(args.latency_ms), '--jitter-ms', str(args.jitter_ms),
+               '--failure-rate', str(args.failure_rate), '--output-lines', str(args.output_lines),
+               '--parallel', str(args.parallel), '--stack-seconds', str(args.stack_seconds),
+               '--poll-seconds', str(args.poll_seconds)] + (['--verbose'] if args.verbose else []) + \
+              (['--stream-bootstrap'] if args.stream_bootstrap else [])
+        output = subprocess.check_output(cmd).decode('utf-8')
+        results.append(json.loads([line for line in output.splitlines() if line.startswith('{')][-1]))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return all(result['ok'] for result in results)
+
+    phases = ['generate_template_file', 'create', 'get_instance_map', 'expand', 'destroy']
+    print('%6s %8s %8s %8s %8s %8s %9s %9s %8s %8s  %s' % ('nodes', 'template', 'create', 'inventory', 'expand', 'destroy',
+                                                          'api calls', 'ssh calls', 'threads', 'rss MB', 'result'))
+    for result in results:
+        seconds = [result['phases'].get(phase, {}).get('seconds') for phase in phases]
+        print('%6s %8s %8s %8s %8s %8s %9s %9s %8s %8.1f  %s' % tuple(
+            [result['nodes']] +
+            ['-' if value is None else '%.2fs' % value for value in seconds] +
+            [sum(result['api_calls'].values()),
+             sum([phase.get('ssh_calls', 0) for phase in result['phases'].values()]),
+             result['peak_threads'], result['peak_rss_mb'],
+             'ok' if result['ok'] else result.get('error')]))
+    return all(result['ok'] for result in results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark create, expand and destroy against simulated AWS and hosts')
+    parser.add_argument('--nodes', dest='nodes_list', type=int, nargs='+', default=[5, 20, 100, 500],
+                        help='Numbers of scalable nodes (datanodes, kafka, opentsdb and zookeeper) to benchmark')
+    parser.add_argument('--latency-ms', type=int, default=50, help='Delay of each fake ssh or scp call')
+    parser.add_argument('--jitter-ms', type=int, default=20, help='Random variation either side of the delay')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='Fraction of ssh and scp calls that fail')
+    parser.add_argument('--output-lines', type=int, default=20, help='Log lines written by each ssh or scp call')
+    parser.add_argument('--parallel', type=int, default=10, help='Value of the CLI --parallel option')
+    parser.add_argument('--stack-seconds', type=float, default=1.0, help='Time each fake stack operation takes')
+    parser.add_argument('--poll-seconds', type=float, default=0.2, help='Stack event poll interval')
+    parser.add_argument('--stream-bootstrap', action='store_true', help='Value of the CLI --stream-bootstrap option')
+    parser.add_argument('--json', action='store_true', help='Print the full results as json')
+    parser.add_argument('--verbose', action='store_true', help='Show the CLI console output')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        args.nodes = args.nodes_list[0]
+        run_worker(args)
+    elif not run_sizes(args):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+#!/bin/bash
+#   Copyright (c) 2016 Cisco and/or its affiliates.
+#   This software is licensed to you under the terms of the Apache License, Version 2.0
+#   (the "License").
+#   You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   Unless required by applicable law or agreed to separately in writing, software distributed
+#   under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+#   ANY KIND, either express or implied.
+#
+#   Purpose: Stand-in for ssh and scp used by e2e_bench.py, which links it onto the PATH under both names
+#
+#   PNDA_BENCH_LATENCY_MS    delay of every call
+#   PNDA_BENCH_JITTER_MS     random variation either side of the delay
+#   PNDA_BENCH_FAILURE_RATE  calls in 10000 that fail as if the host could not be reached
+#   PNDA_BENCH_OUTPUT_LINES  lines of log output written by each call
+#   PNDA_BENCH_MINIONS       file with the name of every minion, one per line, for salt-key
+
+TOOL=$(basename $0)
+LATENCY_MS=${PNDA_BENCH_LATENCY_MS:-50}
+JITTER_MS=${PNDA_BENCH_JITTER_MS:-0}
+
+# requests to a master connection, e.g. ssh -O exit, return straight away
+for ARG in "$@"; do
+  if [ "$ARG" = "-O" ]; then
+    exit 0
+  fi
+done
+
+DELAY=$((LATENCY_MS + RANDOM % (2 * JITTER_MS + 1) - JITTER_MS))
+if [ $DELAY -lt 0 ]; then
+  DELAY=0
+fi
+sleep $(printf '%d.%03d' $((DELAY / 1000)) $((DELAY % 1000)))
+
+if [ $((RANDOM % 10000)) -lt ${PNDA_BENCH_FAILURE_RATE:-0} ]; then
+  echo "$TOOL: connect to host: Connection timed out" >&2
+  exit 255
+fi
+
+for LINE in $(seq 1 ${PNDA_BENCH_OUTPUT_LINES:-20}); do
+  echo "$TOOL output line $LINE" >&2
+done
+
+if [ "$TOOL" = "scp" ]; then
+  exit 0
+fi
+
+CMD="${@: -1}"
+case "$CMD" in
+  *"salt-key -L"*)
+    echo "{\"minions\": [$(sed 's/.*/"&"/' $PNDA_BENCH_MINIONS | paste -sd, -)], \"minions_pre\": []}"
+    ;;
+  *"test.ping"*)
+    MINIONS=$(echo "$CMD" | sed 's/.* -L \([^ ]*\) test\.ping.*/\1/')
+    echo "{$(echo $MINIONS | tr ',' '\n' | sed 's/.*/"&": true/' | paste -sd, -)}"
+    ;;
+  *"cmd.run"*"PNDA_FSTAB"*)
+    PROBE='PNDA_FSTAB\\n/dev/xvdc /var/log/panda auto defaults 0 2\\nPNDA_MOUNTS\\n/dev/xvdc /var/log/panda xfs rw 0 0\\nPNDA_LISTEN\\nLISTEN 0 128 *:22 *:*'
+    echo "{$(sed "s|.*|\"&\": \"$PROBE\"|" $PNDA_BENCH_MINIONS | paste -sd, -)}"
+    ;;
+  *"PNDA_FSTAB"*)
+    printf 'PNDA_FSTAB\n/dev/xvdc /var/log/panda auto defaults 0 2\nPNDA_MOUNTS\n/dev/xvdc /var/log/panda xfs rw 0 0\n'
+    printf 'PNDA_LISTEN\nLISTEN 0 128 *:22 *:*\nPNDA_MINION\n'
+    ;;
+  *"base.sh"*)
+    echo "PNDA_DISK_PREP_SECONDS 0"
+    ;;
+esac
+exit 0
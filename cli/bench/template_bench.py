@@ -0,0 +1,66 @@
+#   Copyright (c) 2016 Cisco and/or its affiliates.
+#   This software is licensed to you under the terms of the Apache License, Version 2.0
+#   (the "License").
+#   You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   Unless required by applicable law or agreed to separately in writing, software distributed
+#   under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+#   ANY KIND, either express or implied.
+#
+#   Purpose: Benchmark template generation against the original string replace and re-parse approach
+#
+#   Usage: python cli/bench/template_bench.py [flavour] [nodes per role ...]
+
+from __future__ import print_function
+
+import os
+import sys
+import json
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import template_engine
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')
+
+
+def legacy_render(filepath, node_counts):
+    with open(filepath, 'r') as template_file:
+        template_data = json.loads(template_file.read())
+    with open(os.path.join(os.path.dirname(filepath), template_engine.INDEXED_ROLES_FILE), 'r') as roles_file:
+        indexed_roles = json.load(roles_file)
+    for resource_name, count_name in indexed_roles.items():
+        resource = json.dumps(template_data['Resources'].pop(resource_name))
+        for node_idx in range(1, node_counts[count_name] + 1):
+            resource_n = resource.replace(template_engine.PLACEHOLDER, str(node_idx))
+            template_data['Resources']['%s%s' % (resource_name, node_idx)] = json.loads(resource_n)
+    return template_data
+
+
+def timed(func, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        result = func()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    flavour = sys.argv[1] if len(sys.argv) > 1 else 'standard'
+    sizes = [int(size) for size in sys.argv[2:]] or [10, 100, 1000, 2000]
+    filepath = os.path.join(ROOT, 'cloud-formation', flavour, 'cf-tmpl.json')
+
+    print('%8s %12s %12s %12s %8s' % ('nodes', 'legacy (s)', 'cold (s)', 'warm (s)', 'speedup'))
+    for size in sizes:
+        node_counts = {'datanodes': size, 'opentsdb-nodes': size, 'kafka-nodes': size, 'zk-nodes': size}
+        legacy_time, legacy_data = timed(lambda: legacy_render(filepath, node_counts))
+        cold_time, _ = timed(lambda: template_engine.CompiledTemplate(filepath).render(node_counts))
+        warm_time, data = timed(lambda: template_engine.load(filepath).render(node_counts))
+        if json.dumps(data, sort_keys=True) != json.dumps(legacy_data, sort_keys=True):
+            raise Exception('Generated templates differ at %s nodes per role' % size)
+        print('%8s %12.4f %12.4f %12.4f %7.1fx' % (size, legacy_time, cold_time, warm_time, legacy_time / warm_time))
+
+
+if __name__ == '__main__':
+    main()
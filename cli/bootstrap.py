@@ -0,0 +1,335 @@
+#   Copyright (c) 2016 Cisco and/or its affiliates.
+#   This software is licensed to you under the terms of the Apache License, Version 2.0
+#   (the "License").
+#   You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   Unless required by applicable law or agreed to separately in writing, software distributed
+#   under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+#   ANY KIND, either express or implied.
+#
+#   Purpose: Bootstrap hosts, with their files sent directly or through a relay, as a graph of host steps
+
+import os
+import json
+import time
+import pipes
+import threading
+import subprocess
+
+import bundle
+import artifact_cache
+import env_file
+import cluster_context
+import tracer
+from task_graph import TaskGraph
+from worker_pool import WorkerPool
+from hosts import LOG, CONSOLE, TRACER, cluster_env, in_context, scp, ssh
+
+ARTIFACT_CACHE_DIR = 'cli/cache/artifacts'
+ARTIFACT_MANIFEST = 'bootstrap-scripts/artifacts.json'
+PACKAGES_FILE = 'bootstrap-scripts/packages.json'
+RELAY_DIR = '/tmp/pnda-relay'
+RELAY_PORT = 8099
+# Bundles and the artifact cache are shared by every cluster, so build them one at a time
+BUILD_LOCK = threading.Lock()
+# Seconds a new instance has to start accepting ssh connections
+BOOT_TIMEOUT = 600
+
+
+def serve_relay_cmds():
+    # [S] stops pgrep matching this shell's own command line
+    return ['cd %s' % RELAY_DIR,
+            'pgrep -f "[S]impleHTTPServer %s" || nohup python -m SimpleHTTPServer %s > /dev/null 2>&1 < /dev/null &'
+            % (RELAY_PORT, RELAY_PORT)]
+
+
+def read_pnda_env():
+    try:
+        pnda_env = dict(os.environ)
+        pnda_env.update(env_file.parse('pnda_env.sh', os.environ))
+        return pnda_env
+    except ValueError as exception:
+        CONSOLE.debug('Sourcing pnda_env.sh with bash: %s', exception)
+    settings_file_contents = subprocess.Popen(['bash', '-c', 'source pnda_env.sh && env'], stdout=subprocess.PIPE).stdout
+    return {entry_parts[0].strip(): entry_parts[1].strip() for entry_parts in [entry.strip().split('=', 1) for entry in settings_file_contents]}
+
+
+def publish_bundle(flavour, relay):
+    with BUILD_LOCK:
+        bundle_path, digest = bundle.build_bundle(bundle.flavour_files(flavour), 'cli/cache/bundles')
+    name = os.path.basename(bundle_path)
+    CONSOLE.debug('Publishing bootstrap bundle %s on relay %s', name, relay)
+    scp([bundle_path], relay)
+    ssh(['mkdir -p %s' % RELAY_DIR,
+         'mv /tmp/%s %s/' % (name, RELAY_DIR)] +
+        serve_relay_cmds(), relay)
+    return {'name': name,
+            'sha256': digest,
+            'path': '%s/%s' % (RELAY_DIR, name),
+            'url': 'http://%s:%s/%s' % (relay, RELAY_PORT, name)}
+
+
+def package_sets(relay, offline):
+    """
+    The .deb files of each package set in packages.json, which hosts install salt and
+    the other packages they need from. They are worked out on the relay while it is
+    still as the image left it and kept in the local cache for that image.
+    """
+    with open(PACKAGES_FILE, 'r') as packages_file:
+        packages = json.load(packages_file)
+    sets_path = artifact_cache.packages_path(ARTIFACT_CACHE_DIR, packages, cluster_env('AWS_IMAGE_ID'))
+    if os.path.isfile(sets_path):
+        with open(sets_path, 'r') as sets_file:
+            return json.load(sets_file)
+    if offline:
+        raise Exception('The packages for image %s are not in the local cache, run with --artifact-cache once to fetch them'
+                        % cluster_env('AWS_IMAGE_ID'))
+
+    CONSOLE.info('Working out the packages to cache from %s', relay)
+    scp(['bootstrap-scripts/packages.sh'], relay)
+    output = []
+    ssh(['sudo bash /tmp/packages.sh %s' % ' '.join([pipes.quote(arg) for arg in artifact_cache.resolve_args(packages)])],
+        relay, output)
+    if any([line.startswith('PNDA_PACKAGES_UNAVAILABLE') for line in output]):
+        CONSOLE.warning('The packages to cache cannot be worked out from %s, which already has salt installed, '
+                        'so hosts will download them', relay)
+        return {}
+    sets = artifact_cache.parse_packages(output)
+    if not os.path.isdir(ARTIFACT_CACHE_DIR):
+        os.makedirs(ARTIFACT_CACHE_DIR)
+    with open(sets_path, 'w') as sets_file:
+        json.dump(sets, sets_file, indent=2, sort_keys=True)
+    return sets
+
+
+def publish_artifacts(relay, offline):
+    """
+    Brings the local artifact cache up to date, unless offline, and serves the
+    artifacts from the relay under a directory named after their version. Returns the
+    base url of that directory and the environment variables that point nodes at it.
+    """
+    artifacts = artifact_cache.load_manifest(ARTIFACT_MANIFEST, read_pnda_env())
+    artifacts.update(artifact_cache.package_artifacts(package_sets(relay, offline)))
+    with BUILD_LOCK:
+        cache = artifact_cache.ArtifactCache(ARTIFACT_CACHE_DIR, CONSOLE)
+        bundle_path, _, version = artifact_cache.build(artifacts, cache, 'cli/cache/bundles', offline)
+    name = os.path.basename(bundle_path)
+    artifacts_dir = '%s/artifacts/%s' % (RELAY_DIR, version)
+    CONSOLE.info('Serving bootstrap artifacts %s from %s', version, relay)
+    scp([bundle_path], relay)
+    ssh(['test -d %s || (mkdir -p %s.tmp && tar -xzf /tmp/%s -C %s.tmp && mv %s.tmp %s)'
+         % (artifacts_dir, artifacts_dir, name, artifacts_dir, artifacts_dir, artifacts_dir),
+         'rm -f /tmp/%s' % name] +
+        serve_relay_cmds(), relay)
+
+    uri = 'http://%s:%s/artifacts/%s' % (relay, RELAY_PORT, version)
+    env = {'PNDA_ARTIFACTS_URI': uri}
+    for artifact, entry in artifacts.items():
+        if 'env' in entry:
+            env[entry['env']] = '%s/%s' % (uri, artifact)
+    return env
+
+
+def fetch_bundle_cmds(bootstrap_bundle):
+    local_path = '/tmp/%s' % bootstrap_bundle['name']
+    check = 'echo "%s  %s" | sha256sum -c --status -' % (bootstrap_bundle['sha256'], local_path)
+    return ['%s || wget -q -O %s %s' % (check, local_path, bootstrap_bundle['url']),
+            '%s || exit 1' % check,
+            'tar -xzf %s -C /tmp' % local_path]
+
+
+def get_type_script(flavour, node_type):
+    type_script = 'bootstrap-scripts/%s/%s.sh' % (flavour, node_type)
+    if not os.path.isfile(type_script):
+        type_script = 'bootstrap-scripts/%s.sh' % (node_type)
+    return type_script
+
+
+def node_env_cmds(saltmaster, cluster, flavour, artifacts_env=None):
+    return (['source /tmp/pnda_env.sh',
+             'export PNDA_SALTMASTER_IP=%s' % saltmaster,
+             'export PNDA_CLUSTER=%s' % cluster,
+             'export PNDA_FLAVOR=%s' % flavour] +
+            ['export %s=%s' % (name, value) for name, value in sorted((artifacts_env or {}).items())])
+
+
+def disk_layout_cmds(flavour, node_type):
+    """ Exports the disk settings for node_type from the flavour's disk-layout.json for disks.sh """
+    layout_file = 'cloud-formation/%s/disk-layout.json' % flavour
+    if not os.path.isfile(layout_file):
+        return []
+    with open(layout_file, 'r') as layout_json:
+        layouts = json.load(layout_json)
+    layout = dict(layouts.get('default', {}))
+    layout.update(layouts.get(node_type, {}))
+    settings = [('PNDA_LOG_DISK', layout.get('log_disk')),
+                ('PNDA_DATA_DISKS', ' '.join(layout['data_disks']) if 'data_disks' in layout else None),
+                ('PNDA_DISK_LAYOUT', layout.get('layout')),
+                ('PNDA_DISK_TEST_MB', layout.get('throughput_test_mb'))]
+    return ['export %s="%s"' % (name, value) for name, value in settings if value is not None]
+
+
+def record_disk_report(host, node_type, output):
+    report = {'node_type': node_type, 'seconds': None, 'throughput': []}
+    for line in output:
+        parts = line.split()
+        if len(parts) == 4 and parts[0] == 'PNDA_DISK_THROUGHPUT':
+            report['throughput'].append((parts[1], parts[2], int(parts[3])))
+        elif len(parts) == 2 and parts[0] == 'PNDA_DISK_PREP_SECONDS':
+            report['seconds'] = int(parts[1])
+    CONSOLE.debug('Disk preparation on %s: %s', host, report)
+    cluster_context.current().disk_report[host] = report
+
+
+def report_disk_throughput():
+    disk_report = cluster_context.current().disk_report
+    by_role = {}
+    for report in disk_report.values():
+        by_role.setdefault(report['node_type'], []).append(report)
+    for node_type in sorted(by_role):
+        reports = by_role[node_type]
+        rates = [rate for report in reports for _, _, rate in report['throughput']]
+        layouts = sorted(set([layout for report in reports for _, layout, _ in report['throughput']]))
+        seconds = [report['seconds'] for report in reports if report['seconds'] is not None]
+        if rates:
+            CONSOLE.info('Disks on %d %s hosts (%s): prepared in up to %ss, write throughput min %d, mean %d MiB/s',
+                         len(reports), node_type, ', '.join(layouts), max(seconds) if seconds else '?',
+                         min(rates), sum(rates) / len(rates))
+    disk_report.clear()
+
+
+def bootstrap_saltmaster(saltmaster, cluster, flavour, bootstrap_bundle=None, artifacts_env=None):
+    if bootstrap_bundle is not None:
+        # secrets in client_env.sh and git.pem go to the saltmaster only, never into the shared bundle
+        scp(['client_env.sh', 'git.pem'], saltmaster)
+        unpack_cmds = ['tar -xzf %s -C /tmp' % bootstrap_bundle['path']]
+    else:
+        scp(['bootstrap-scripts/saltmaster.sh', 'bootstrap-scripts/disks.sh', 'pnda_env.sh', 'client_env.sh', 'git.pem'],
+            saltmaster)
+        unpack_cmds = []
+    ssh(unpack_cmds +
+        ['source /tmp/client_env.sh'] +
+        node_env_cmds(saltmaster, cluster, flavour, artifacts_env) +
+        disk_layout_cmds(flavour, 'saltmaster') +
+        ['sudo chmod a+x /tmp/saltmaster.sh',
+         'sudo -E /tmp/saltmaster.sh'],
+        saltmaster)
+
+
+def bootstrap_base(instance, saltmaster, cluster, flavour, bootstrap_bundle=None, artifacts_env=None):
+    # disks and packages only, nothing in base.sh needs the saltmaster to be up
+    ip_address = instance['private_ip_address']
+    CONSOLE.debug('bootstrapping %s', ip_address)
+    node_type = instance['node_type']
+    # the bastion sits outside pndaSg and cannot reach the relay's http port
+    if node_type == 'bastion':
+        artifacts_env = None
+    if bootstrap_bundle is None or node_type == 'bastion':
+        fetch_cmds = []
+        scp(['pnda_env.sh', 'bootstrap-scripts/base.sh', 'bootstrap-scripts/disks.sh', 'bootstrap-scripts/minion.sh',
+             get_type_script(flavour, node_type)], ip_address)
+    else:
+        fetch_cmds = fetch_bundle_cmds(bootstrap_bundle)
+    output = []
+    ssh(fetch_cmds +
+        node_env_cmds(saltmaster, cluster, flavour, artifacts_env) +
+        disk_layout_cmds(flavour, node_type) +
+        ['sudo chmod a+x /tmp/base.sh',
+         'sudo -E /tmp/base.sh'], ip_address, output)
+    record_disk_report(instance['name'], node_type, output)
+
+
+def bootstrap_minion(instance, saltmaster, cluster, flavour):
+    node_type = instance['node_type']
+    ssh(node_env_cmds(saltmaster, cluster, flavour) +
+        ['sudo chmod a+x /tmp/minion.sh /tmp/%s.sh' % node_type,
+         'sudo -E /tmp/minion.sh',
+         'sudo -E /tmp/%s.sh %s' % (node_type, instance['node_idx'])], instance['private_ip_address'])
+
+
+def wait_for_ssh(host, timeout, cancelled=None):
+    """
+    Waits for a new instance to accept ssh connections, which it does some time after it
+    is running. Gives up early once cancelled, an Event, is set.
+    """
+    cancelled = cancelled or threading.Event()
+    deadline = time.time() + timeout
+    interval = 2
+    while True:
+        try:
+            ssh(['true'], host, timeout=10)
+            return
+        except Exception:
+            if time.time() > deadline:
+                raise Exception('%s did not accept ssh connections within %s seconds' % (host, timeout))
+        if cancelled.wait(interval):
+            raise Exception('Stopped waiting for %s to accept ssh connections' % host)
+        interval = min(interval * 2, 15)
+
+
+def after_boot(target, host, cancelled):
+    def run(*args):
+        wait_for_ssh(host, BOOT_TIMEOUT, cancelled)
+        return target(*args)
+    return run
+
+
+def journaled_step(journal, host, step, digest, target, args):
+    with TRACER.span(step, tracer.STEP, host=host):
+        target(*args)
+    journal.mark_host(host, step, digest)
+
+
+def bootstrap_graph(instances, saltmaster, cluster, flavour, journal, bootstrap_bundle=None, artifacts_env=None,
+                    with_saltmaster=False, graph=None, wait_for_boot=None):
+    """
+    Each host is bootstrapped in two tasks. base:<host> prepares disks and packages and
+    can run straight away, minion:<host> points salt-minion at the saltmaster and so also
+    waits for the saltmaster task when the saltmaster is being built in the same run.
+
+    Steps the journal shows were already done with the current bootstrap files are left
+    out of the graph. The tasks are added to graph when given, which may already be
+    running. With wait_for_boot, an Event set to stop waiting, hosts that may still be
+    booting are waited for first.
+    """
+    graph = graph or TaskGraph()
+    files = bundle.flavour_files(flavour)
+    digest = bundle.content_hash(files)
+
+    def add_step(name, host, step, step_digest, target, args, depends_on):
+        if journal.host_done(host, step, step_digest):
+            CONSOLE.debug('Skipping %s, already done', name)
+            return
+        graph.add(name, in_context(journaled_step), [journal, host, step, step_digest, target, args],
+                  depends_on=[dependency for dependency in depends_on if dependency in graph.tasks])
+
+    if with_saltmaster:
+        files.update({'client_env.sh': 'client_env.sh', 'git.pem': 'git.pem'})
+        add_step('saltmaster', '%s-saltmaster' % cluster, 'saltmaster', bundle.content_hash(files),
+                 after_boot(bootstrap_saltmaster, saltmaster, wait_for_boot) if wait_for_boot else bootstrap_saltmaster,
+                 [saltmaster, cluster, flavour, bootstrap_bundle, artifacts_env], [])
+    for instance in instances:
+        base_task = 'base:%s' % instance['name']
+        add_step(base_task, instance['name'], 'base', digest,
+                 after_boot(bootstrap_base, instance['private_ip_address'], wait_for_boot) if wait_for_boot else bootstrap_base,
+                 [instance, saltmaster, cluster, flavour, bootstrap_bundle, artifacts_env], [])
+        add_step('minion:%s' % instance['name'], instance['name'], 'minion', digest,
+                 bootstrap_minion, [instance, saltmaster, cluster, flavour], ['saltmaster', base_task])
+    return graph
+
+
+def run_graph(graph, parallel, keep_going, all_added=None):
+    pool = WorkerPool(parallel, fail_fast=not keep_going)
+    graph.run(pool, all_added)
+
+    CONSOLE.info('Bootstrap summary:')
+    for line in pool.summary():
+        CONSOLE.info(line)
+    for name in graph.skipped():
+        CONSOLE.info('  %-40s %-10s', name, 'SKIPPED')
+
+    failures = [future for future in pool.failures() if future.error is not None]
+    for future in failures:
+        LOG.error('Error for task %s. %s', future.key, future.error)
+    if pool.failures() or graph.skipped():
+        raise Exception("Error bootstrapping hosts, failed tasks: %s. See pnda-cli.py logs for details."
+                        % ', '.join([future.key for future in failures]))
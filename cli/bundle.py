@@ -0,0 +1,74 @@
+#   Copyright (c) 2016 Cisco and/or its affiliates.
+#   This software is licensed to you under the terms of the Apache License, Version 2.0
+#   (the "License").
+#   You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   Unless required by applicable law or agreed to separately in writing, software distributed
+#   under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+#   ANY KIND, either express or implied.
+#
+#   Purpose: Build content addressed bundles of the files needed to bootstrap a node
+
+import os
+import gzip
+import glob
+import tarfile
+import hashlib
+
+
+def flavour_files(flavour):
+    """
+    Files every node may need during bootstrap, keyed by the name they get in /tmp on
+    the node. Scripts in the flavour directory take precedence over the generic ones.
+    """
+    files = {'pnda_env.sh': 'pnda_env.sh'}
+    for script in glob.glob('bootstrap-scripts/*.sh') + glob.glob('bootstrap-scripts/%s/*.sh' % flavour):
+        files[os.path.basename(script)] = script
+    return files
+
+
+def digest_of(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as bundle_file:
+        for chunk in iter(lambda: bundle_file.read(65536), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def content_hash(files):
+    """ sha256 over the names and contents of files (name -> local path) """
+    sha = hashlib.sha256()
+    for name in sorted(files):
+        sha.update(name.encode('utf-8'))
+        with open(files[name], 'rb') as member_file:
+            for chunk in iter(lambda: member_file.read(65536), b''):
+                sha.update(chunk)
+    return sha.hexdigest()
+
+
+def build_bundle(files, out_dir, prefix='pnda-bootstrap'):
+    """
+    Writes files (name in bundle -> local path) to a tar.gz named after the hash of its
+    contents and returns (path, sha256). Timestamps and ownership are fixed so the same
+    inputs always produce the same bundle, and an existing bundle is reused as is.
+    """
+    if not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+
+    bundle_path = os.path.join(out_dir, '%s-%s.tar.gz' % (prefix, content_hash(files)[:16]))
+
+    if not os.path.isfile(bundle_path):
+        tmp_path = '%s.tmp' % bundle_path
+        with open(tmp_path, 'wb') as raw_file:
+            gzip_file = gzip.GzipFile(filename='', mode='wb', fileobj=raw_file, mtime=0)
+            with tarfile.open(fileobj=gzip_file, mode='w') as tar:
+                for name in sorted(files):
+                    info = tar.gettarinfo(files[name], arcname=name)
+                    info.mtime = 0
+                    info.uid = info.gid = 0
+                    info.uname = info.gname = 'root'
+                    with open(files[name], 'rb') as member_file:
+                        tar.addfile(info, member_file)
+            gzip_file.close()
+        os.rename(tmp_path, bundle_path)
+
+    return bundle_path, digest_of(bundle_path)
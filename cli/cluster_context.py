@@ -0,0 +1,87 @@
+#   Copyright (c) 2016 Cisco and/or its affiliates.
+#   This software is licensed to you under the terms of the Apache License, Version 2.0
+#   (the "License").
+#   You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   Unless required by applicable law or agreed to separately in writing, software distributed
+#   under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+#   ANY KIND, either express or implied.
+#
+#   Purpose: State that belongs to one cluster, so several clusters can be worked on in one process
+
+import os
+import logging
+import threading
+
+_LOCAL = threading.local()
+_LOCK = threading.Lock()
+_CONTEXTS = []
+
+
+class ClusterContext(object):
+    """
+    Everything the CLI keeps about the cluster it is working on: where its ssh config
+    and socks proxy script go, the hosts it has ssh master connections to, its log store
+    and so on. region and environ override the AWS_REGION and other settings taken from
+    the environment, for clusters that live elsewhere.
+    """
+    def __init__(self, cluster=None, state_dir='cli', region=None, environ=None):
+        self.cluster = cluster
+        self.state_dir = state_dir
+        self.ssh_config = os.path.join(state_dir, 'ssh_config')
+        self.socks_proxy = os.path.join(state_dir, 'socks_proxy')
+        self.cache_dir = os.path.join(state_dir, 'cache')
+        self.environ = dict(environ or {})
+        if region is not None:
+            self.environ['AWS_REGION'] = region
+        self.ssh_hosts = set()
+        # instance names by private IP, for naming log segments
+        self.host_names = {}
+        # disk preparation results from base.sh, keyed by host
+        self.disk_report = {}
+        self.validation_rules = None
+        self.logs = None
+        with _LOCK:
+            _CONTEXTS.append(self)
+
+    def env(self, name):
+        return self.environ[name] if name in self.environ else os.environ[name]
+
+
+DEFAULT = ClusterContext()
+
+
+def current():
+    """ The context activated on this thread, or the default one """
+    return getattr(_LOCAL, 'context', None) or DEFAULT
+
+
+def activate(context):
+    _LOCAL.context = context
+
+
+def all_contexts():
+    with _LOCK:
+        return list(_CONTEXTS)
+
+
+def bind(target, context=None):
+    """ Wraps target to run in context, by default the one current where bind is called """
+    context = context or current()
+    def run(*args, **kwargs):
+        previous = getattr(_LOCAL, 'context', None)
+        activate(context)
+        try:
+            return target(*args, **kwargs)
+        finally:
+            activate(previous)
+    return run
+
+
+class ClusterPrefix(logging.Filter):
+    """ Starts each message with the name of the cluster it was logged for """
+    def filter(self, record):
+        cluster = current().cluster
+        if cluster is not None and not getattr(record, 'cluster_prefixed', False):
+            record.msg = '[%s] %s' % (cluster, record.msg)
+            record.cluster_prefixed = True
+        return True
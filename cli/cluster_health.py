@@ -0,0 +1,165 @@
+#   Copyright (c) 2016 Cisco and/or its affiliates.
+#   This software is licensed to you under the terms of the Apache License, Version 2.0
+#   (the "License").
+#   You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   Unless required by applicable law or agreed to separately in writing, software distributed
+#   under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+#   ANY KIND, either express or implied.
+#
+#   Purpose: Check every host of a cluster for its disks, service ports and salt minion
+
+from __future__ import print_function
+
+import os
+import sys
+import json
+import time
+
+import cluster_context
+from worker_pool import WorkerPool
+from hosts import CONSOLE, cluster_env, get_instance_map, write_ssh_config, ssh
+from salt_runs import salt_json
+
+# Run on each host by status, printing the pnda mounts base.sh put in fstab, what is mounted and listening ports
+STATUS_PROBE = ['echo PNDA_FSTAB', 'grep cloudconfig /etc/fstab', 'echo PNDA_MOUNTS', 'cat /proc/mounts',
+                'echo PNDA_LISTEN', 'ss -ltn']
+
+
+def service_ports(flavour, node_type):
+    """ Ports that services of node_type listen on, from the flavour's service-ports.json """
+    ports_file = 'cloud-formation/%s/service-ports.json' % flavour
+    if not os.path.isfile(ports_file):
+        return []
+    with open(ports_file, 'r') as ports_json:
+        return json.load(ports_json).get(node_type, [])
+
+
+def parse_probe(output):
+    """ Splits the output of STATUS_PROBE into the pnda mounts in fstab, mounted paths, listening ports and minion process """
+    probe = {'fstab': [], 'mounts': set(), 'ports': set(), 'minion_process': None}
+    section = None
+    for line in output:
+        line = line.strip()
+        if line.startswith('PNDA_'):
+            section = line
+            if section == 'PNDA_MINION':
+                probe['minion_process'] = False
+            continue
+        parts = line.split()
+        if section == 'PNDA_FSTAB' and len(parts) > 1:
+            probe['fstab'].append(parts[1])
+        elif section == 'PNDA_MOUNTS' and len(parts) > 1:
+            probe['mounts'].add(parts[1])
+        elif section == 'PNDA_LISTEN' and len(parts) > 3 and parts[0] == 'LISTEN':
+            port = parts[3].rsplit(':', 1)[-1]
+            if port.isdigit():
+                probe['ports'].add(int(port))
+        elif section == 'PNDA_MINION' and parts:
+            probe['minion_process'] = True
+    return probe
+
+
+def probe_host(address, timeout):
+    output = []
+    ssh(STATUS_PROBE + ['echo PNDA_MINION', 'pgrep -x salt-minion', 'true'], address, output, timeout)
+    return parse_probe(output)
+
+
+def host_health(instance, flavour, probe, minion):
+    """
+    Checks the probe of one host against what it should have: the mounts base.sh put in
+    fstab, the service ports for its role and, minion being 'responding', 'not responding',
+    'stopped' or None for the saltmaster, a working salt-minion
+    """
+    health = {'role': instance['node_type'], 'address': instance['private_ip_address'], 'minion': minion,
+              'reachable': probe is not None, 'missing_mounts': [], 'closed_ports': [], 'problems': []}
+    if probe is None:
+        health['problems'].append('unreachable')
+    else:
+        if '/var/log/panda' not in probe['fstab']:
+            health['problems'].append('no disks set up by base.sh')
+        health['missing_mounts'] = [mount for mount in probe['fstab'] if mount not in probe['mounts']]
+        health['closed_ports'] = [port for port in service_ports(flavour, instance['node_type']) if port not in probe['ports']]
+        health['problems'].extend(['%s not mounted' % mount for mount in health['missing_mounts']])
+        health['problems'].extend(['port %s closed' % port for port in health['closed_ports']])
+    if minion not in (None, 'responding'):
+        health['problems'].append('salt-minion %s' % minion)
+    health['healthy'] = len(health['problems']) == 0
+    return health
+
+
+def cluster_status(cluster, flavour, timeout, parallel):
+    """
+    Probes every host in cluster. The saltmaster runs the probe on every minion at once
+    with cmd.run, so only the saltmaster and minions that do not answer salt are probed
+    with ssh of their own, parallel at a time, each within timeout seconds.
+    """
+    instance_map = get_instance_map(cluster, refresh=True)
+    saltmaster = instance_map['%s-saltmaster' % cluster]
+    minions = sorted([name for name in instance_map if name != saltmaster['name']])
+
+    results = {}
+    try:
+        results = salt_json('sudo salt -t %s --static -L %s cmd.run "%s"' % (timeout, ','.join(minions), '; '.join(STATUS_PROBE)),
+                            saltmaster['private_ip_address'], timeout * 2)
+    except Exception as exception:
+        CONSOLE.debug('Could not probe through salt: %s', exception)
+
+    probes = {}
+    for name in minions:
+        if isinstance(results.get(name), basestring) and 'PNDA_FSTAB' in results[name]:
+            probes[name] = (parse_probe(results[name].splitlines()), 'responding')
+
+    def probe_directly(instance):
+        address = instance['ip_address'] if instance['node_type'] == 'bastion' else instance['private_ip_address']
+        probe = probe_host(address, timeout)
+        if instance is saltmaster:
+            return probe, None
+        return probe, 'not responding' if probe['minion_process'] else 'stopped'
+
+    pool = WorkerPool(parallel, initial_workers=parallel, fail_fast=False)
+    futures = [pool.submit(name, probe_directly, instance_map[name])
+               for name in sorted(instance_map) if name not in probes]
+    pool.wait()
+    for future in futures:
+        probes[future.key] = future.result() if future.error is None else (None, None if future.key == saltmaster['name'] else 'unknown')
+
+    return dict([(name, host_health(instance_map[name], flavour, probes[name][0], probes[name][1])) for name in instance_map])
+
+
+def show_status(cluster, flavour, keyname, timeout, parallel, as_json):
+    """ Shows the health of every host in cluster grouped by role, exiting with 1 if any is unhealthy """
+    context = cluster_context.current()
+    if keyname is not None:
+        instance_map = get_instance_map(cluster)
+        write_ssh_config(cluster, instance_map[cluster+'-bastion']['ip_address'], cluster_env('OS_USER'),
+                         os.path.abspath('%s.pem' % keyname))
+    elif not os.path.isfile(context.ssh_config):
+        CONSOLE.error('No ssh config in %s, give the keypair name with -s to create one', context.ssh_config)
+        sys.exit(1)
+
+    start = time.time()
+    hosts = cluster_status(cluster, flavour, timeout, parallel)
+    healthy = all([health['healthy'] for health in hosts.values()])
+    roles = {}
+    for name, health in hosts.items():
+        role = roles.setdefault(health['role'], {'hosts': 0, 'healthy': 0})
+        role['hosts'] += 1
+        role['healthy'] += 1 if health['healthy'] else 0
+
+    if as_json:
+        print(json.dumps({'cluster': cluster, 'healthy': healthy, 'seconds': round(time.time() - start, 1),
+                          'roles': roles, 'hosts': hosts}, indent=2, sort_keys=True))
+    else:
+        CONSOLE.info('%-12s %6s %8s  %s', 'Role', 'Hosts', 'Healthy', 'Problems')
+        for role_name in sorted(roles):
+            problems = ['%s: %s' % (name, ', '.join(health['problems'])) for name, health in sorted(hosts.items())
+                        if health['role'] == role_name and not health['healthy']]
+            CONSOLE.info('%-12s %6s %8s  %s', role_name, roles[role_name]['hosts'], roles[role_name]['healthy'],
+                         problems[0] if problems else '')
+            for problem in problems[1:]:
+                CONSOLE.info('%-12s %6s %8s  %s', '', '', '', problem)
+        CONSOLE.info('%s of %s hosts healthy, checked in %.1fs', len([health for health in hosts.values() if health['healthy']]),
+                     len(hosts), time.time() - start)
+    if not healthy:
+        sys.exit(1)
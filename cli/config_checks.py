@@ -0,0 +1,101 @@
+#   Copyright (c) 2016 Cisco and/or its affiliates.
+#   This software is licensed to you under the terms of the Apache License, Version 2.0
+#   (the "License").
+#   You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   Unless required by applicable law or agreed to separately in writing, software distributed
+#   under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+#   ANY KIND, either express or implied.
+#
+#   Purpose: Checks of the local configuration and what it points at, run before creating a cluster
+
+import os
+import sys
+
+import requests
+
+import preflight
+import cluster_context
+import tracer
+from hosts import AWS, CONSOLE, TRACER, cluster_env
+from bootstrap import read_pnda_env
+
+PREFLIGHT_CACHE_FILE = 'preflight.json'
+PREFLIGHT_DEADLINE = 20
+
+
+def check_environment_variables():
+    try:
+        region = cluster_env('AWS_REGION')
+        CONSOLE.debug('AWS region is %s', region)
+        CONSOLE.info('Env variables.... OK')
+    except:
+        CONSOLE.info('Env variables.... ERROR')
+        CONSOLE.error('Missing required environment variables, run "source ../client_env.sh" and try again.')
+        sys.exit(1)
+
+
+def check_keypair(region, keyname, keyfile):
+    if not os.path.isfile(keyfile):
+        raise preflight.CheckFailed('Did not find local file named %s' % keyfile)
+    try:
+        stored_key = AWS.ec2(region).get_key_pair(keyname)
+    except Exception as exception:
+        raise preflight.CheckFailed('Failed to look up key %s in ec2: %s' % (keyname, exception))
+    if stored_key is None:
+        raise preflight.CheckFailed('Failed to find key %s in ec2.' % keyname)
+
+
+def check_aws_connection(region):
+    try:
+        AWS.cloudformation(region).list_stacks()
+    except Exception as exception:
+        raise preflight.CheckFailed('Failed to query cloud formation API, verify config in "client_env.sh" and try again. %s'
+                                    % exception)
+
+
+def check_java_mirror(http, pnda_env, timeout):
+    if 'JAVA_MIRROR' not in pnda_env:
+        raise preflight.CheckWarning('Java mirror was not defined in pnda_env.sh,' +
+                                     ' provisioning will be more reliable and quicker if you host this in the same AWS availability zone.')
+    java_mirror = pnda_env['JAVA_MIRROR']
+    try:
+        response = http.head(java_mirror, timeout=timeout)
+        response.raise_for_status()
+    except Exception as exception:
+        raise preflight.CheckFailed('Failed to connect to java mirror. Verify connection to %s, update config in pnda_env.sh if required and try again. %s'
+                                    % (java_mirror, exception))
+
+
+def check_package_server(http, pnda_env, timeout):
+    package_uri = '%s/%s' % (pnda_env.get('PACKAGES_SERVER_URI'), 'platform/releases/')
+    try:
+        response = http.head(package_uri, timeout=timeout)
+        if response.status_code != 403 and response.status_code != 200:
+            raise Exception("Unexpected status code from %s: %s" % (package_uri, response.status_code))
+    except Exception as exception:
+        raise preflight.CheckFailed('Failed to connect to package server. Verify connection to %s, update URL in pnda_env.sh if required and try again. %s'
+                                    % (package_uri, exception))
+
+
+def run_preflight(keyname, keyfile, ttl):
+    """
+    Runs the configuration checks that need AWS or the network at the same time, sharing
+    the AWS connections and one http session. Checks that passed within the last ttl seconds, against
+    the same config files, key and credentials, are not repeated.
+    """
+    region = cluster_env('AWS_REGION')
+    pnda_env = read_pnda_env()
+    http = requests.Session()
+    key = preflight.cache_key(['client_env.sh', 'pnda_env.sh', keyfile],
+                              [keyname, region, os.environ.get('AWS_ACCESS_KEY_ID')])
+    cache_path = os.path.join(cluster_context.current().cache_dir, PREFLIGHT_CACHE_FILE)
+    checks = preflight.Preflight(CONSOLE, cache_path, key, ttl)
+    checks.add('AWS connection', check_aws_connection, [region], PREFLIGHT_DEADLINE)
+    checks.add('Keyfile', check_keypair, [region, keyname, keyfile], PREFLIGHT_DEADLINE)
+    checks.add('Package server', check_package_server, [http, pnda_env, PREFLIGHT_DEADLINE], PREFLIGHT_DEADLINE)
+    checks.add('Java mirror', check_java_mirror, [http, pnda_env, PREFLIGHT_DEADLINE], PREFLIGHT_DEADLINE)
+    with TRACER.span('preflight', tracer.PHASE):
+        checks_passed = checks.run()
+    if not checks_passed:
+        CONSOLE.error('Configuration checks failed, correct the problems above and try again.')
+        sys.exit(1)
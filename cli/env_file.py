@@ -0,0 +1,52 @@
+#   Copyright (c) 2016 Cisco and/or its affiliates.
+#   This software is licensed to you under the terms of the Apache License, Version 2.0
+#   (the "License").
+#   You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   Unless required by applicable law or agreed to separately in writing, software distributed
+#   under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+#   ANY KIND, either express or implied.
+#
+#   Purpose: Read shell files of variable assignments, such as pnda_env.sh, without starting a shell
+
+import re
+
+ASSIGNMENT = re.compile(r'^(?:export\s+)?([A-Za-z_][A-Za-z0-9_]*)=(.*)$')
+REFERENCE = re.compile(r'\$(?:\{([A-Za-z_][A-Za-z0-9_]*)\}|([A-Za-z_][A-Za-z0-9_]*))')
+# a $ that does not start a plain $NAME or ${NAME}: ${NAME:-default}, ${#NAME}, $(command), $1, $$ and so on
+OTHER_EXPANSION = re.compile(r'\$(?!\{[A-Za-z_][A-Za-z0-9_]*\}|[A-Za-z_])')
+
+
+def parse(path, environ):
+    """
+    Returns the variables assigned in path, with $NAME and ${NAME} filled in from
+    earlier assignments or environ, or left empty, as sourcing the file would. Raises ValueError on
+    any line other than a comment or a plain [export] NAME=value assignment, and on any
+    other expansion, command substitution or escape in a value, so callers can fall back
+    to a real shell for anything more elaborate.
+    """
+    variables = {}
+    with open(path, 'r') as env_file:
+        for line in env_file:
+            line = line.strip()
+            if line == '' or line.startswith('#'):
+                continue
+            match = ASSIGNMENT.match(line)
+            if match is None:
+                raise ValueError('%s: cannot parse "%s"' % (path, line))
+            name, value = match.groups()
+            if len(value) >= 2 and value[0] == value[-1] and value[0] in '\'"':
+                quote, value = value[0], value[1:-1]
+                if quote in value:
+                    raise ValueError('%s: cannot parse "%s"' % (path, line))
+            else:
+                quote = None
+                if re.search(r'[\s;|&<>()\'"]', value):
+                    raise ValueError('%s: cannot parse "%s"' % (path, line))
+            if quote != "'":
+                if re.search(r'[`\\]', value) or OTHER_EXPANSION.search(value):
+                    raise ValueError('%s: cannot parse "%s"' % (path, line))
+                scope = dict(environ)
+                scope.update(variables)
+                value = REFERENCE.sub(lambda reference: scope.get(reference.group(1) or reference.group(2), ''), value)
+            variables[name] = value
+    return variables
@@ -0,0 +1,124 @@
+#   Copyright (c) 2016 Cisco and/or its affiliates.
+#   This software is licensed to you under the terms of the Apache License, Version 2.0
+#   (the "License").
+#   You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   Unless required by applicable law or agreed to separately in writing, software distributed
+#   under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+#   ANY KIND, either express or implied.
+#
+#   Purpose: Create, expand, destroy or resume many clusters at once from a manifest
+
+import os
+import sys
+import json
+import argparse
+
+import template_engine
+import instance_profiles
+import cluster_context
+from cluster_context import ClusterContext
+from worker_pool import WorkerPool
+from journal import JOURNALED_OPTIONS
+from hosts import LOG, CONSOLE
+from validation import name_string, node_limit, load_validation_rules
+from config_checks import check_environment_variables
+
+# ssh config and other files for each cluster of a fleet command go in here
+FLEET_STATE_DIR = 'cli/clusters'
+# Commands a fleet manifest can give for each cluster
+FLEET_COMMANDS = ['create', 'expand', 'destroy', 'resume']
+
+
+def fleet_context(cluster, environ):
+    return ClusterContext(cluster, os.path.join(FLEET_STATE_DIR, cluster), environ=environ)
+
+
+def manifest_value(entry, name):
+    if name not in entry:
+        raise Exception('Manifest entry for %s needs a value for %s' % (entry.get('pnda_cluster'), name))
+    return entry[name]
+
+
+def prepare_fleet(manifest_path, args, expand_settings):
+    """
+    Reads a fleet manifest and checks every entry in it before any cluster is touched.
+    Returns the cluster, command, context, settings and options for each entry.
+    expand_settings works out the settings for an expand from the running cluster.
+    """
+    with open(manifest_path, 'r') as manifest_file:
+        manifest = json.load(manifest_file)
+
+    prepared = []
+    for entry in manifest['clusters']:
+        cluster = name_string(manifest_value(entry, 'pnda_cluster'))
+        command = manifest_value(entry, 'command')
+        if command not in FLEET_COMMANDS:
+            raise Exception('Manifest entry for %s has command %s, expected one of %s' % (cluster, command, ', '.join(FLEET_COMMANDS)))
+        if cluster in [item[0] for item in prepared]:
+            raise Exception('Manifest has more than one entry for %s' % cluster)
+
+        options = argparse.Namespace(**vars(args))
+        for overrides in (manifest.get('options', {}), entry.get('options', {})):
+            for name, value in overrides.items():
+                if name not in JOURNALED_OPTIONS + ['plan_only']:
+                    raise Exception('Manifest entry for %s sets unknown option %s' % (cluster, name))
+                setattr(options, name, value)
+
+        environ = dict(entry.get('environment', {}))
+        if 'region' in entry:
+            environ['AWS_REGION'] = entry['region']
+        context = fleet_context(cluster, environ)
+        settings = None
+        cluster_context.activate(context)
+        try:
+            if command in ('create', 'expand'):
+                flavour = manifest_value(entry, 'flavour')
+                keyname = manifest_value(entry, 'keyname')
+                load_validation_rules(flavour)
+                profiles = None
+                if 'profiles' in entry:
+                    profiles = instance_profiles.check(entry['profiles'], template_engine.load(template_engine.template_path(flavour)).roles.values())
+            if command == 'create':
+                settings = {'flavour': flavour, 'keyname': keyname, 'no_config_check': args.no_config_check,
+                            'datanodes': node_limit('datanodes', manifest_value(entry, 'datanodes')),
+                            'opentsdb_nodes': node_limit('opentsdb-nodes', manifest_value(entry, 'opentsdb_nodes')),
+                            'kafka_nodes': node_limit('kafka-nodes', manifest_value(entry, 'kafka_nodes')),
+                            'zk_nodes': node_limit('zk-nodes', manifest_value(entry, 'zk_nodes')),
+                            'profiles': profiles}
+            elif command == 'expand':
+                settings = expand_settings(cluster, flavour, keyname, entry.get('datanodes'), entry.get('kafka_nodes'), profiles)
+            if settings is not None:
+                settings['environment'] = environ
+        finally:
+            cluster_context.activate(None)
+        prepared.append((cluster, command, context, settings, options))
+    return prepared
+
+
+def run_fleet(manifest_path, args, expand_settings, run_entry):
+    """
+    Runs the command for every cluster in a manifest at the same time, up to max_clusters
+    at once. Each cluster has its own ssh config, logs and settings while they all share
+    the rate limited AWS connections. run_entry runs one command for one cluster.
+    """
+    check_environment_variables()
+    prepared = prepare_fleet(manifest_path, args, expand_settings)
+    for handler in CONSOLE.handlers:
+        handler.addFilter(cluster_context.ClusterPrefix())
+
+    max_clusters = args.max_clusters or len(prepared)
+    pool = WorkerPool(max_clusters, initial_workers=max_clusters, fail_fast=False)
+    for cluster, command, context, settings, options in prepared:
+        CONSOLE.info('Starting %s of %s', command, cluster)
+        pool.submit(cluster, cluster_context.bind(run_entry, context), cluster, command, settings, options)
+    pool.wait()
+
+    CONSOLE.info('Fleet summary:')
+    for line in pool.summary():
+        CONSOLE.info(line)
+    for future in pool.failures():
+        LOG.error('Error for cluster %s. %s', future.key, future.error)
+    if pool.failures():
+        CONSOLE.error('Failed for: %s, see pnda-cli.py logs -e <cluster> for details',
+                      ', '.join([future.key for future in pool.failures()]))
+        sys.exit(1)
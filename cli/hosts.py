@@ -0,0 +1,168 @@
+#   Copyright (c) 2016 Cisco and/or its affiliates.
+#   This software is licensed to you under the terms of the Apache License, Version 2.0
+#   (the "License").
+#   You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   Unless required by applicable law or agreed to separately in writing, software distributed
+#   under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+#   ANY KIND, either express or implied.
+#
+#   Purpose: Access to the cluster being worked on, shared by every command: its AWS connections, instances and hosts
+
+import os
+import time
+import atexit
+import logging
+
+import subprocess_to_log
+import cluster_context
+import tracer
+from tracer import Tracer
+from aws_clients import ClientRegistry
+from inventory_cache import InventoryCache
+
+# relative to the cli directory, where pnda-cli.py sets up logging
+LOG_FILE_NAME = 'logs/pnda-cli.%s.log' % time.time()
+LOG = logging.getLogger('everything')
+CONSOLE = logging.getLogger('console')
+INVENTORY = InventoryCache('cli/cache', 300)
+# every AWS call goes through these shared, rate limited connections
+AWS = ClientRegistry()
+TRACER = Tracer()
+
+
+def host_log(host):
+    """
+    Returns the logger and log id for output from host: its segment for the current phase
+    or host step when there is a log store, otherwise the debug log
+    """
+    context = cluster_context.current()
+    if context.logs is None:
+        return LOG, host, LOG_FILE_NAME
+    span = TRACER.current()
+    segment = context.logs.segment(context.host_names.get(host, host), span.name if span is not None else 'other')
+    return segment, None, os.path.join(context.logs.run_dir, '%s.*' % segment.name)
+
+
+def cluster_env(name):
+    """ A setting from the environment, or the override for the cluster being worked on """
+    return cluster_context.current().env(name)
+
+
+def in_context(target):
+    """ Wraps target to run on another thread with the cluster and trace span current here """
+    return cluster_context.bind(TRACER.bind(target))
+
+
+def get_instance_map(cluster, refresh=False):
+    region = cluster_env('AWS_REGION')
+    if not refresh:
+        instance_map = INVENTORY.get(region, cluster)
+        if instance_map is not None:
+            CONSOLE.debug('Using cached details of instances')
+            cluster_context.current().host_names.update([(instance['private_ip_address'], name) for name, instance in instance_map.iteritems()])
+            return instance_map
+
+    CONSOLE.debug('Checking details of created instances')
+    ec2 = AWS.ec2(region)
+    filters = {'tag:pnda_cluster': cluster, 'instance-state-name': 'running'}
+    instance_map = {}
+    next_token = None
+    while True:
+        reservations = ec2.get_all_reservations(filters=filters, max_results=500, next_token=next_token)
+        for reservation in reservations:
+            for instance in reservation.instances:
+                CONSOLE.debug('%s %s', instance.private_ip_address, instance.tags['Name'])
+                instance_map[instance.tags['Name']] = {
+                    "public_dns": instance.public_dns_name,
+                    "ip_address": instance.ip_address,
+                    "private_ip_address":instance.private_ip_address,
+                    "name": instance.tags['Name'],
+                    "node_idx": instance.tags['node_idx'],
+                    "node_type": instance.tags['node_type']
+                }
+        next_token = reservations.next_token
+        if next_token is None:
+            break
+
+    INVENTORY.put(region, cluster, instance_map)
+    cluster_context.current().host_names.update([(instance['private_ip_address'], name) for name, instance in instance_map.iteritems()])
+    return instance_map
+
+
+def get_current_node_counts(cluster):
+    CONSOLE.debug('Counting existing instances')
+    node_counts = {}
+    for _, instance in get_instance_map(cluster).iteritems():
+        if instance['node_type'] in node_counts:
+            current_count = node_counts[instance['node_type']]
+        else:
+            current_count = 0
+        node_counts[instance['node_type']] = current_count + 1
+    return node_counts
+
+
+def scp(files, host):
+    context = cluster_context.current()
+    context.ssh_hosts.add(host)
+    cmd = "scp -F %s %s %s:%s" % (context.ssh_config, ' '.join(files), host, '/tmp')
+    CONSOLE.debug(cmd)
+    logger, log_id, log_path = host_log(host)
+    with TRACER.span('scp', tracer.COMMAND, host=host, cmd=cmd) as span:
+        ret_val = subprocess_to_log.call(cmd.split(' '), logger, log_id, stats=span.args)
+    if ret_val != 0:
+        raise Exception("Error transfering files to new host %s via SCP. See log (%s) for details." % (host, log_path))
+
+
+def ssh(cmds, host, output=None, timeout=None):
+    context = cluster_context.current()
+    context.ssh_hosts.add(host)
+    cmd = "ssh -F %s %s" % (context.ssh_config, host)
+    parts = cmd.split(' ')
+    if timeout is not None:
+        parts[1:1] = ['-o', 'ConnectTimeout=%s' % timeout]
+    parts.append(';'.join(cmds))
+    CONSOLE.debug(parts)
+    logger, log_id, log_path = host_log(host)
+    with TRACER.span('ssh', tracer.COMMAND, host=host, cmd=parts[-1]) as span:
+        ret_val = subprocess_to_log.call(parts, logger, log_id, scan_for_errors=['lost connection'], output=output,
+                                         timeout=timeout, stats=span.args)
+    if ret_val != 0:
+        raise Exception("Error running ssh commands on host %s. See log (%s) for details." % (host, log_path))
+
+
+@atexit.register
+def close_ssh_masters():
+    for context in cluster_context.all_contexts():
+        if not os.path.isfile(context.ssh_config):
+            continue
+        for host in context.ssh_hosts:
+            subprocess_to_log.call(['ssh', '-F', context.ssh_config, '-O', 'exit', host], LOG, host)
+
+
+def write_ssh_config(cluster, bastion_ip, os_user, keyfile):
+    # Connections to the bastion and to each host are multiplexed over persistent
+    # master connections, so repeated scp/ssh calls skip the tcp and ssh handshakes.
+    control_options = ['    ControlMaster auto\n',
+                       '    ControlPath /tmp/pnda-%s-%%r@%%h:%%p\n' % cluster,
+                       '    ControlPersist 10m\n',
+                       '    ServerAliveInterval 30\n']
+    context = cluster_context.current()
+    context.ssh_hosts.add(bastion_ip)
+    if not os.path.isdir(context.state_dir):
+        os.makedirs(context.state_dir)
+    with open(context.ssh_config, 'w') as config_file:
+        config_file.write('host %s\n' % bastion_ip)
+        config_file.write('    ProxyCommand none\n')
+        config_file.writelines(control_options)
+        config_file.write('host *\n')
+        config_file.write('    User %s\n' % os_user)
+        config_file.write('    IdentityFile %s\n' % keyfile)
+        config_file.write('    StrictHostKeyChecking no\n')
+        config_file.write('    UserKnownHostsFile /dev/null\n')
+        config_file.writelines(control_options)
+        config_file.write('    ProxyCommand ssh -F %s -W %%h:%%p %s\n' % (os.path.abspath(context.ssh_config), bastion_ip))
+
+    with open(context.socks_proxy, 'w') as config_file:
+        config_file.write('eval `ssh-agent`\n')
+        config_file.write('ssh-add %s\n' % keyfile)
+        config_file.write('ssh -i %s -o StrictHostKeyChecking=no -o UserKnownHostsFile=/dev/null -A -D 9999 %s@%s\n' % (keyfile, os_user, bastion_ip))
@@ -0,0 +1,97 @@
+#   Copyright (c) 2016 Cisco and/or its affiliates.
+#   This software is licensed to you under the terms of the Apache License, Version 2.0
+#   (the "License").
+#   You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   Unless required by applicable law or agreed to separately in writing, software distributed
+#   under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+#   ANY KIND, either express or implied.
+#
+#   Purpose: Hand over the instances of a stack as they come up, while the rest of the stack is still being built
+
+import threading
+
+from stack_waiter import STACK_RESOURCE_TYPE
+
+INSTANCE_RESOURCE_TYPE = 'AWS::EC2::Instance'
+
+
+class InstanceFeed(object):
+    """
+    Give on_event to StackWaiter.wait(). Once every resource in prerequisites has
+    completed, each instance or nested stack that completes leads to a lookup() of the
+    cluster's instances, and every one not seen before is passed to on_ready in a dict
+    of instances by name. Nothing is passed on until the instances named in required
+    are all there, so on_ready can rely on them from its first call.
+
+    Lookups happen on a thread of their own, at most one every min_interval seconds,
+    so a burst of completions costs a single lookup.
+    """
+    def __init__(self, lookup, on_ready, prerequisites, required, logger, min_interval=2.0):
+        self.lookup = lookup
+        self.on_ready = on_ready
+        self.required = set(required)
+        self.logger = logger
+        self.min_interval = min_interval
+        self.delivered = set()
+        self.lookups = 0
+        self.error = None
+        self._waiting_on = set(prerequisites)
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+        if len(self._waiting_on) == 0:
+            self._wake.set()
+
+    def on_event(self, event):
+        if not event.resource_status.endswith('_COMPLETE'):
+            return
+        if event.logical_resource_id in self._waiting_on:
+            self._waiting_on.discard(event.logical_resource_id)
+            if len(self._waiting_on) == 0:
+                self.logger.info('Network is ready, bootstrapping instances as they come up')
+                self._wake.set()
+        elif event.resource_type in (INSTANCE_RESOURCE_TYPE, STACK_RESOURCE_TYPE):
+            self._wake.set()
+
+    def _deliver(self):
+        self.lookups += 1
+        instances = self.lookup()
+        if not self.required.issubset(instances):
+            return
+        ready = dict([(name, instance) for name, instance in instances.items()
+                      if name not in self.delivered and instance.get('private_ip_address')])
+        if len(ready) > 0:
+            self.delivered.update(ready)
+            self.on_ready(ready)
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            if self._stopping.is_set():
+                return
+            try:
+                if len(self._waiting_on) == 0:
+                    self._deliver()
+            except Exception as exception:
+                self.error = exception
+                return
+            self._stopping.wait(self.min_interval)
+
+    def stop(self):
+        self._stopping.set()
+        self._wake.set()
+        self._thread.join()
+
+    def finish(self):
+        """ Once the stack is complete, stops and hands over any instances not yet passed on """
+        self.stop()
+        if self.error is not None:
+            raise self.error
+        self._waiting_on.clear()
+        self._deliver()
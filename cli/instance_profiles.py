@@ -0,0 +1,158 @@
+#   Copyright (c) 2016 Cisco and/or its affiliates.
+#   This software is licensed to you under the terms of the Apache License, Version 2.0
+#   (the "License").
+#   You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   Unless required by applicable law or agreed to separately in writing, software distributed
+#   under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+#   ANY KIND, either express or implied.
+#
+#   Purpose: Instance types and EBS data volumes for each role, or range of nodes of a role
+
+import json
+import hashlib
+
+# block devices used for data volumes, which bootstrap finds as xvdd onwards, see disk-layout.json
+DATA_DEVICES = ['/dev/sd%s' % letter for letter in 'defghijk']
+VOLUME_TYPES = ['standard', 'gp2', 'gp3', 'io1', 'io2', 'st1', 'sc1']
+IOPS_VOLUME_TYPES = ['gp3', 'io1', 'io2']
+THROUGHPUT_VOLUME_TYPES = ['gp3']
+PROFILE_KEYS = ['nodes', 'instance_type', 'volumes']
+# the log volume, which is instance storage on some roles, and the template parameter giving the size of the EBS ones
+LOG_DEVICE = '/dev/sdc'
+LOG_VOLUME_SIZE = {'Ref': 'logVolumeSizeGb'}
+# the template Metadata entry holding the profiles a stack was built with, so they can be read back from it
+METADATA_KEY = 'PndaInstanceProfiles'
+VOLUME_KEYS = ['count', 'size_gb', 'type', 'iops', 'throughput']
+
+
+def _in_ranges(ranges, node_idx):
+    """ Whether node_idx is in ranges such as "1-10" or "3,5,7-9" """
+    for part in ranges.split(','):
+        if '-' in part:
+            low, high = part.split('-')
+            if int(low) <= node_idx <= int(high):
+                return True
+        elif int(part) == node_idx:
+            return True
+    return False
+
+
+def check(profiles, roles=None):
+    """
+    Checks profiles, which map each role to a profile or to a list of them, and returns
+    them. A profile may give an instance_type and volumes, with the count, size_gb,
+    type, iops and throughput of the data volumes. Profiles in a list that give nodes,
+    e.g. "11-20", only apply to those nodes of the role. Later ones take precedence.
+    Every role must be one of roles, when given.
+    """
+    for role, entries in profiles.items():
+        if roles is not None and role not in roles:
+            raise Exception('Profile for %s is not for any role in the template, expected one of %s' % (role, ', '.join(sorted(roles))))
+        for entry in entries if isinstance(entries, list) else [entries]:
+            unknown = [key for key in entry if key not in PROFILE_KEYS]
+            unknown += [key for key in entry.get('volumes', {}) if key not in VOLUME_KEYS]
+            if len(unknown) > 0:
+                raise Exception('Profile for %s has unknown settings %s' % (role, ', '.join(sorted(unknown))))
+            if 'nodes' in entry:
+                try:
+                    _in_ranges(entry['nodes'], 1)
+                except ValueError:
+                    raise Exception('Profile for %s has nodes "%s", expected ranges like "1-10,12"' % (role, entry['nodes']))
+            volumes = entry.get('volumes', {})
+            if not 1 <= volumes.get('count', 1) <= len(DATA_DEVICES):
+                raise Exception('Profile for %s has %s volumes, between 1 and %s can be attached'
+                                % (role, volumes['count'], len(DATA_DEVICES)))
+            if volumes.get('type', 'gp2') not in VOLUME_TYPES:
+                raise Exception('Profile for %s has volume type %s, expected one of %s' % (role, volumes['type'], ', '.join(VOLUME_TYPES)))
+    return profiles
+
+
+def load(path, roles=None):
+    with open(path, 'r') as profiles_file:
+        return check(json.load(profiles_file), roles)
+
+
+def merge(base, override):
+    """ Profiles with the entries for each role in override after, so taking precedence over, those in base """
+    merged = {}
+    for profiles in (base or {}, override or {}):
+        for role, entries in profiles.items():
+            merged.setdefault(role, []).extend(entries if isinstance(entries, list) else [entries])
+    return merged
+
+
+def for_node(profiles, role, node_idx=None):
+    """ The profile for one node, combining every entry for its role that applies to it """
+    entries = profiles.get(role, [])
+    profile = {}
+    for entry in entries if isinstance(entries, list) else [entries]:
+        if 'nodes' in entry and (node_idx is None or not _in_ranges(entry['nodes'], node_idx)):
+            continue
+        volumes = dict(profile.get('volumes', {}))
+        volumes.update(entry.get('volumes', {}))
+        profile.update(entry)
+        profile.pop('nodes', None)
+        if len(volumes) > 0:
+            profile['volumes'] = volumes
+    return profile
+
+
+def _volume_mappings(volumes):
+    ebs = {'VolumeSize': str(volumes['size_gb'])}
+    if 'type' in volumes:
+        ebs['VolumeType'] = volumes['type']
+    if 'iops' in volumes:
+        ebs['Iops'] = str(volumes['iops'])
+    if 'throughput' in volumes:
+        ebs['Throughput'] = str(volumes['throughput'])
+    return [{'DeviceName': device, 'Ebs': dict(ebs)} for device in DATA_DEVICES[:volumes.get('count', 1)]]
+
+
+def apply(resource_name, resource, profile, description):
+    """
+    Returns a copy of an instance resource with profile applied, and a dict of any
+    other resources it needs. The instance's data volumes are replaced by the ones in
+    the profile. Instances cannot set volume throughput themselves, so when the profile
+    does their volumes go in a launch template, named after its content so that it is
+    only ever at version 1. description names the node in errors.
+
+    The new instance type may have no instance storage, so when the profile gives one
+    an instance storage log volume becomes an EBS one sized like the other roles' and
+    instance storage data volumes are left out, unless the profile gives volumes.
+    """
+    properties = dict(resource['Properties'])
+    needed = {}
+    if 'instance_type' in profile:
+        properties['InstanceType'] = profile['instance_type']
+        mappings = []
+        for mapping in properties.get('BlockDeviceMappings', []):
+            if 'VirtualName' not in mapping:
+                mappings.append(mapping)
+            elif mapping['DeviceName'] == LOG_DEVICE:
+                mappings.append({'DeviceName': LOG_DEVICE, 'Ebs': {'VolumeSize': LOG_VOLUME_SIZE}})
+        properties['BlockDeviceMappings'] = mappings
+    volumes = profile.get('volumes')
+    if volumes is not None:
+        if 'size_gb' not in volumes:
+            raise Exception('Profile for %s gives no size_gb for its volumes' % description)
+        volume_type = volumes.get('type', 'gp2')
+        if 'iops' in volumes and volume_type not in IOPS_VOLUME_TYPES:
+            raise Exception('Profile for %s sets iops for %s volumes, only %s have them provisioned'
+                            % (description, volume_type, ', '.join(IOPS_VOLUME_TYPES)))
+        if 'throughput' in volumes and volume_type not in THROUGHPUT_VOLUME_TYPES:
+            raise Exception('Profile for %s sets throughput for %s volumes, only %s have it provisioned'
+                            % (description, volume_type, ', '.join(THROUGHPUT_VOLUME_TYPES)))
+        mappings = [mapping for mapping in properties.get('BlockDeviceMappings', []) if mapping['DeviceName'] not in DATA_DEVICES]
+        mappings = sorted(mappings + _volume_mappings(volumes), key=lambda mapping: mapping['DeviceName'])
+        if 'throughput' in volumes:
+            digest = hashlib.sha1(json.dumps(mappings, sort_keys=True).encode('utf-8')).hexdigest()[:10]
+            template_name = 'launchTemplate%s%s%s' % (resource_name[0].upper(), resource_name[1:], digest)
+            needed[template_name] = {'Type': 'AWS::EC2::LaunchTemplate',
+                                     'Properties': {'LaunchTemplateData': {'BlockDeviceMappings': mappings}}}
+            properties.pop('BlockDeviceMappings', None)
+            properties['LaunchTemplate'] = {'LaunchTemplateId': {'Ref': template_name}, 'Version': '1'}
+        else:
+            properties['BlockDeviceMappings'] = mappings
+    profiled = dict(resource)
+    profiled['Properties'] = properties
+    return profiled, needed
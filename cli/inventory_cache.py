@@ -0,0 +1,56 @@
+#   Copyright (c) 2016 Cisco and/or its affiliates.
+#   This software is licensed to you under the terms of the Apache License, Version 2.0
+#   (the "License").
+#   You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   Unless required by applicable law or agreed to separately in writing, software distributed
+#   under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+#   ANY KIND, either express or implied.
+#
+#   Purpose: On disk cache of the instances that make up each cluster
+
+import os
+import json
+import time
+import threading
+
+
+class InventoryCache(object):
+    """
+    Keeps the instance map for each cluster in a json file under cache_dir, stamped
+    with the time it was fetched. Clusters are keyed by region as well as name, since
+    clusters of the same name can run in different regions. Entries older than ttl
+    seconds are treated as missing. Anything that adds or removes instances must call
+    invalidate().
+    """
+    def __init__(self, cache_dir, ttl):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self._lock = threading.Lock()
+
+    def _path(self, region, cluster):
+        return os.path.join(self.cache_dir, 'inventory-%s-%s.json' % (region, cluster))
+
+    def get(self, region, cluster):
+        with self._lock:
+            try:
+                with open(self._path(region, cluster), 'r') as cache_file:
+                    entry = json.load(cache_file)
+            except (IOError, ValueError):
+                return None
+            if time.time() - entry['fetched'] > self.ttl:
+                return None
+            return entry['instances']
+
+    def put(self, region, cluster, instance_map):
+        with self._lock:
+            if not os.path.isdir(self.cache_dir):
+                os.makedirs(self.cache_dir)
+            tmp_path = '%s.tmp' % self._path(region, cluster)
+            with open(tmp_path, 'w') as cache_file:
+                json.dump({'fetched': time.time(), 'instances': instance_map}, cache_file)
+            os.rename(tmp_path, self._path(region, cluster))
+
+    def invalidate(self, region, cluster):
+        with self._lock:
+            if os.path.isfile(self._path(region, cluster)):
+                os.remove(self._path(region, cluster))
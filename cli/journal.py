@@ -0,0 +1,92 @@
+#   Copyright (c) 2016 Cisco and/or its affiliates.
+#   This software is licensed to you under the terms of the Apache License, Version 2.0
+#   (the "License").
+#   You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   Unless required by applicable law or agreed to separately in writing, software distributed
+#   under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+#   ANY KIND, either express or implied.
+#
+#   Purpose: Record the progress of a create or expand run so an interrupted run can be resumed
+
+import os
+import json
+import time
+import threading
+
+# Command line options saved in the journal, so that resume runs with the same ones
+JOURNALED_OPTIONS = ['parallel', 'keep_going', 'distribution', 'minion_timeout', 'template_store',
+                     'nested_stacks', 'batch_size', 'artifact_cache', 'offline', 'preflight_ttl', 'stream_bootstrap', 'yes']
+
+
+class Journal(object):
+    """
+    Per cluster record of the phases of the last create or expand run, saved to a json
+    file after every change. Host steps are recorded with the digest of the bootstrap
+    files they ran, so a resumed run repeats a step whenever those files have changed.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.data = None
+
+    @staticmethod
+    def path_for(journal_dir, cluster):
+        return os.path.join(journal_dir, '%s.json' % cluster)
+
+    def load(self):
+        """ Returns True if there was a journal to load """
+        try:
+            with open(self.path, 'r') as journal_file:
+                self.data = json.load(journal_file)
+            return True
+        except (IOError, ValueError):
+            return False
+
+    def start(self, command, settings):
+        """ Begins a new journal for command, settings being what resume needs to run it again """
+        with self._lock:
+            self.data = {'command': command,
+                         'settings': settings,
+                         'started': time.time(),
+                         'phases': {},
+                         'hosts': {}}
+            self._save()
+
+    def _save(self):
+        if not os.path.isdir(os.path.dirname(self.path)):
+            os.makedirs(os.path.dirname(self.path))
+        tmp_path = '%s.tmp' % self.path
+        with open(tmp_path, 'w') as journal_file:
+            json.dump(self.data, journal_file, indent=2, sort_keys=True)
+        os.rename(tmp_path, self.path)
+
+    def command(self):
+        return self.data['command']
+
+    def settings(self):
+        return self.data['settings']
+
+    def phase_done(self, phase, digest=None):
+        with self._lock:
+            entry = self.data['phases'].get(phase)
+            return entry is not None and (digest is None or entry.get('digest') == digest)
+
+    def mark_phase(self, phase, digest=None):
+        with self._lock:
+            self.data['phases'][phase] = {'at': time.time(), 'digest': digest}
+            self._save()
+
+    def host_done(self, host, step, digest):
+        with self._lock:
+            entry = self.data['hosts'].get(host, {}).get(step)
+            return entry is not None and entry.get('digest') == digest
+
+    def mark_host(self, host, step, digest):
+        with self._lock:
+            self.data['hosts'].setdefault(host, {})[step] = {'at': time.time(), 'digest': digest}
+            self._save()
+
+    def remove(self):
+        with self._lock:
+            if os.path.isfile(self.path):
+                os.remove(self.path)
@@ -0,0 +1,232 @@
+#   Copyright (c) 2016 Cisco and/or its affiliates.
+#   This software is licensed to you under the terms of the Apache License, Version 2.0
+#   (the "License").
+#   You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   Unless required by applicable law or agreed to separately in writing, software distributed
+#   under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+#   ANY KIND, either express or implied.
+#
+#   Purpose: Per host and per phase log segments with an index of the lines worth looking at
+
+import os
+import re
+import glob
+import gzip
+import json
+import time
+import shutil
+import logging
+import threading
+
+INDEX_FILE = 'index.json'
+MAX_PART_BYTES = 8 * 1024 * 1024
+INDEX_INTERVAL = 5.0
+MAX_ENTRY_TEXT = 500
+TAIL_BLOCK = 64 * 1024
+
+ERROR = 'error'
+WARNING = 'warning'
+SALT_FAILURE = 'salt'
+
+# checked in order, the first match decides the kind of line
+PATTERNS = [(SALT_FAILURE, re.compile(r'Result:\s*False|^\s*Failed:\s*[1-9]')),
+            (ERROR, re.compile(r'\berror\b|\bfatal\b|Traceback \(most recent call last\)', re.IGNORECASE)),
+            (WARNING, re.compile(r'\bwarn(ing)?\b', re.IGNORECASE))]
+# salt output names each minion on a line of its own, followed by the results of its states
+SALT_MINION = re.compile(r'^([A-Za-z0-9][A-Za-z0-9_.-]*):$')
+SALT_STATE = re.compile(r'^\s*ID:\s*(\S+)')
+SAFE_NAME = re.compile(r'[^A-Za-z0-9_.-]')
+
+
+class Segment(object):
+    """
+    Output of one host during one phase. Written in parts of up to MAX_PART_BYTES, each
+    full part being gzipped in the background. Parts are only open while a line is
+    appended, as a large cluster has thousands of segments. Has the log() method of a
+    logger, so it can be handed to subprocess_to_log.call() in place of one.
+    """
+    def __init__(self, store, host, phase):
+        self.store = store
+        self.host = host
+        self.phase = phase
+        self.name = '%s.%s' % (SAFE_NAME.sub('_', host), SAFE_NAME.sub('_', phase))
+        self.parts = []
+        self.lines = 0
+        self.last_minion = None
+        self.last_state = None
+        self._lock = threading.Lock()
+        self._path = None
+        self._offset = 0
+
+    def _open_part(self):
+        part = {'file': '%s.%s.log' % (self.name, len(self.parts)), 'bytes': 0, 'compressed': False}
+        self.parts.append(part)
+        self._path = os.path.join(self.store.run_dir, part['file'])
+        self._offset = 0
+
+    def _rotate(self):
+        self._path = None
+        part = self.parts[-1]
+        thread = threading.Thread(target=self.store.compress, args=(part,))
+        thread.daemon = True
+        thread.start()
+
+    def log(self, level, msg):
+        data = ('%s %s %s\n' % (time.strftime('%H:%M:%S'), logging.getLevelName(level), msg)).encode('utf-8')
+        with self._lock:
+            if self._path is None:
+                self._open_part()
+            offset = self._offset
+            with open(self._path, 'ab') as part_file:
+                part_file.write(data)
+            self._offset += len(data)
+            self.parts[-1]['bytes'] = self._offset
+            self.lines += 1
+            line = self.lines
+            entry = None
+
+            minion = SALT_MINION.match(msg)
+            if minion is not None:
+                self.last_minion = minion.group(1)
+                self.last_state = None
+            state = SALT_STATE.match(msg)
+            if state is not None:
+                self.last_state = state.group(1)
+            for kind, pattern in PATTERNS:
+                if pattern.search(msg):
+                    entry = {'segment': self.name, 'host': self.host, 'phase': self.phase,
+                             'part': len(self.parts) - 1, 'offset': offset, 'line': line, 'kind': kind,
+                             'minion': self.last_minion if kind == SALT_FAILURE else None,
+                             'state': self.last_state if kind == SALT_FAILURE else None,
+                             'text': msg[:MAX_ENTRY_TEXT]}
+                    break
+
+            if self._offset >= MAX_PART_BYTES:
+                self._rotate()
+        # outside the lock, as writing the index describes this segment
+        if entry is not None:
+            self.store.add_entry(entry)
+
+    def describe(self):
+        with self._lock:
+            return {'host': self.host, 'phase': self.phase, 'lines': self.lines,
+                    'parts': [dict(part) for part in self.parts]}
+
+
+class LogStore(object):
+    """
+    Log segments for one run of the CLI, in their own directory under root together with
+    an index.json. The index lists every segment and part, and the position and text of
+    each error, warning and salt failure line, so they can be shown without reading the
+    segments. It is rewritten at most every INDEX_INTERVAL seconds and on close().
+    """
+    def __init__(self, root, run_id):
+        self.run_id = run_id
+        self.run_dir = os.path.join(root, run_id)
+        if not os.path.isdir(self.run_dir):
+            os.makedirs(self.run_dir)
+        self.segments = {}
+        self.entries = []
+        self._lock = threading.Lock()
+        self._written = 0
+
+    def segment(self, host, phase):
+        with self._lock:
+            key = (host, phase)
+            if key not in self.segments:
+                self.segments[key] = Segment(self, host, phase)
+            return self.segments[key]
+
+    def add_entry(self, entry):
+        with self._lock:
+            self.entries.append(entry)
+            due = time.time() - self._written > INDEX_INTERVAL
+        if due:
+            self.write_index()
+
+    def compress(self, part):
+        path = os.path.join(self.run_dir, part['file'])
+        with open(path, 'rb') as plain_file:
+            gzip_file = gzip.open('%s.gz.tmp' % path, 'wb')
+            shutil.copyfileobj(plain_file, gzip_file)
+            gzip_file.close()
+        os.rename('%s.gz.tmp' % path, '%s.gz' % path)
+        with self._lock:
+            part['file'] = '%s.gz' % part['file']
+            part['compressed'] = True
+        os.remove(path)
+        self.write_index()
+
+    def write_index(self):
+        with self._lock:
+            self._written = time.time()
+            segments = list(self.segments.values())
+            entries = list(self.entries)
+        index = {'run': self.run_id,
+                 'segments': dict([(segment.name, segment.describe()) for segment in segments]),
+                 'entries': entries}
+        tmp_path = os.path.join(self.run_dir, '%s.%s.tmp' % (INDEX_FILE, threading.current_thread().ident))
+        with open(tmp_path, 'w') as index_file:
+            json.dump(index, index_file)
+        os.rename(tmp_path, os.path.join(self.run_dir, INDEX_FILE))
+
+    def close(self):
+        self.write_index()
+
+
+def list_runs(root, prefix=''):
+    """ Run directories under root whose name starts with prefix, oldest first """
+    runs = [path for path in glob.glob(os.path.join(root, '%s*' % prefix)) if os.path.isfile(os.path.join(path, INDEX_FILE))]
+    return [os.path.basename(path) for path in sorted(runs, key=os.path.getmtime)]
+
+
+def load_index(root, run_id):
+    with open(os.path.join(root, run_id, INDEX_FILE), 'r') as index_file:
+        return json.load(index_file)
+
+
+def _matches(item, host, phase):
+    return (host is None or host in (item['host'], item.get('minion'))) and (phase is None or item['phase'] == phase)
+
+
+def find_entries(index, kinds, host=None, phase=None):
+    return [entry for entry in index['entries'] if entry['kind'] in kinds and _matches(entry, host, phase)]
+
+
+def find_segments(index, host=None, phase=None):
+    return sorted([(name, segment) for name, segment in index['segments'].items() if _matches(segment, host, phase)])
+
+
+def _read_tail(part_file, size, count):
+    """ The last count lines of the first size bytes of part_file, reading back a block at a time """
+    data = b''
+    position = size
+    # one newline more than count, as the first line read may only be the end of a line
+    while position > 0 and data.count(b'\n') <= count:
+        step = min(TAIL_BLOCK, position)
+        position -= step
+        part_file.seek(position)
+        data = part_file.read(step) + data
+    lines = data.splitlines()
+    if position > 0:
+        lines = lines[1:]
+    return lines
+
+
+def tail(root, run_id, segment, count):
+    """ The last count lines of a segment, reading back from the end of its last parts only """
+    lines = []
+    for part in reversed(segment['parts']):
+        path = os.path.join(root, run_id, part['file'])
+        if part['compressed']:
+            part_file = gzip.open(path, 'rb')
+            part_lines = part_file.read().splitlines()
+            part_file.close()
+        else:
+            # the part may still be growing, so go by its size now rather than in the index
+            with open(path, 'rb') as part_file:
+                part_lines = _read_tail(part_file, os.path.getsize(path), count - len(lines))
+        lines = part_lines[-(count - len(lines)):] + lines
+        if len(lines) >= count:
+            break
+    return [line.decode('utf-8', 'replace') for line in lines[-count:]]
@@ -0,0 +1,53 @@
+#   Copyright (c) 2016 Cisco and/or its affiliates.
+#   This software is licensed to you under the terms of the Apache License, Version 2.0
+#   (the "License").
+#   You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   Unless required by applicable law or agreed to separately in writing, software distributed
+#   under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+#   ANY KIND, either express or implied.
+#
+#   Purpose: Show the failures, or the end of the output, of a run from its log store
+
+import sys
+
+import log_store
+from hosts import CONSOLE
+
+
+def show_logs(root, cluster, run_id, host, phase, tail_lines, warnings):
+    """
+    Shows the failures recorded in the index of a run under root, the latest run of cluster
+    unless run_id is given, or with tail_lines the end of the matching host and phase segments
+    """
+    runs = log_store.list_runs(root, '' if cluster is None else '%s.' % cluster)
+    if run_id is None:
+        if not runs:
+            CONSOLE.error('No logs found%s', '' if cluster is None else ' for %s' % cluster)
+            sys.exit(1)
+        run_id = runs[-1]
+    elif run_id not in runs:
+        CONSOLE.error('No logs found for run %s, runs are: %s', run_id, ', '.join(runs))
+        sys.exit(1)
+    index = log_store.load_index(root, run_id)
+    CONSOLE.info('Run %s', run_id)
+
+    if tail_lines is not None:
+        segments = log_store.find_segments(index, host, phase)
+        if not segments:
+            CONSOLE.info('No output recorded for that host and phase, segments are: %s',
+                         ', '.join(sorted(index['segments'].keys())))
+        for _, segment in segments:
+            CONSOLE.info('==> %s %s (%s lines) <==', segment['host'], segment['phase'], segment['lines'])
+            for line in log_store.tail(root, run_id, segment, tail_lines):
+                CONSOLE.info(line)
+        return
+
+    kinds = [log_store.SALT_FAILURE, log_store.ERROR] + ([log_store.WARNING] if warnings else [])
+    entries = log_store.find_entries(index, kinds, host, phase)
+    if not entries:
+        CONSOLE.info('No %s recorded', 'errors or warnings' if warnings else 'errors')
+    for entry in entries:
+        where = '%s %s line %s' % (entry['host'], entry['phase'], entry['line'])
+        if entry['kind'] == log_store.SALT_FAILURE and entry['minion'] is not None:
+            where += ' (minion %s, state %s)' % (entry['minion'], entry['state'])
+        CONSOLE.info('%-7s %s: %s', entry['kind'].upper(), where, entry['text'].strip())
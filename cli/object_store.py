@@ -0,0 +1,70 @@
+#   Copyright (c) 2016 Cisco and/or its affiliates.
+#   This software is licensed to you under the terms of the Apache License, Version 2.0
+#   (the "License").
+#   You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   Unless required by applicable law or agreed to separately in writing, software distributed
+#   under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+#   ANY KIND, either express or implied.
+#
+#   Purpose: Places to upload generated artifacts, such as templates, so AWS can fetch them by URL
+
+import os
+import hashlib
+
+
+class LocalObjectStore(object):
+    """
+    Stand-in store that writes objects to a local directory. URLs are built from base_url
+    when one is given, so the directory can be served over http, otherwise they are
+    file:// URLs.
+    """
+    def __init__(self, directory, base_url=None):
+        self.directory = directory
+        self.base_url = base_url
+
+    def put(self, key, body):
+        path = os.path.join(self.directory, key)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as object_file:
+            object_file.write(body)
+        if self.base_url is not None:
+            return '%s/%s' % (self.base_url.rstrip('/'), key)
+        return 'file://%s' % os.path.abspath(path)
+
+
+class S3ObjectStore(object):
+    """
+    Uploads objects to an S3 bucket and hands out pre-signed URLs for them. S3 calls go
+    through clients, a ClientRegistry, so they are rate limited and retried like any
+    other AWS call.
+    """
+    def __init__(self, clients, region, bucket, prefix='', expires_in=86400):
+        self.clients = clients
+        self.region = region
+        self.bucket = bucket
+        self.prefix = prefix.strip('/')
+        self.expires_in = expires_in
+
+    def put(self, key, body):
+        conn = self.clients.get('s3', self.region)
+        bucket = conn.get_bucket(self.bucket, validate=False)
+        s3_key = bucket.new_key('/'.join([part for part in [self.prefix, key] if part]))
+        self.clients.call('s3.set_contents_from_string', s3_key.set_contents_from_string, [body],
+                          {'headers': {'Content-Type': 'application/json'}})
+        return s3_key.generate_url(self.expires_in, query_auth=True)
+
+
+def from_uri(uri, clients, region):
+    """ s3://bucket/prefix selects S3, anything else is taken as a local directory """
+    if uri.startswith('s3://'):
+        bucket, _, prefix = uri[len('s3://'):].partition('/')
+        return S3ObjectStore(clients, region, bucket, prefix)
+    if uri.startswith('file://'):
+        uri = uri[len('file://'):]
+    return LocalObjectStore(uri)
+
+
+def content_key(name, body):
+    """ Object keys carry a hash of the body, so a changed object never reuses an old URL """
+    return '%s-%s.json' % (name, hashlib.sha256(body.encode('utf-8')).hexdigest()[:16])
@@ -17,7 +17,6 @@
 #   Purpose: Script to create PNDA on Amazon Web Services EC2
 
 import re
-import subprocess
 import sys
 import os
 import os.path
@@ -27,30 +26,46 @@ import logging
 import atexit
 import traceback
 import datetime
-from threading import Thread
 
-import requests
 import argparse
 from argparse import RawTextHelpFormatter
-import boto.cloudformation
-import boto.ec2
 
-import subprocess_to_log
+from stack_waiter import StackWaiter
+import template_engine
+from template_engine import template_path
+import object_store
+import template_diff
+import sizing
+import instance_profiles
+from journal import Journal, JOURNALED_OPTIONS
+import tracer
+from log_store import LogStore
+import cluster_context
+import bootstrap
+from bootstrap import publish_bundle, publish_artifacts, bootstrap_graph, run_graph, report_disk_throughput
+import stream_bootstrap
+import cluster_health
+import fleet
+import log_viewer
+from hosts import LOG_FILE_NAME, CONSOLE, INVENTORY, AWS, TRACER, cluster_env, get_instance_map, get_current_node_counts, \
+    write_ssh_config
+from salt_runs import wait_for_minions, expand_highstate_targets, run_salt
+from config_checks import check_environment_variables, run_preflight
+from validation import NAME_REGEX, name_string, get_validation, validate_size, node_limit, load_validation_rules
+
+
+CLI_DIR = os.path.dirname(os.path.abspath(__file__))
+os.chdir(CLI_DIR)
 
-
-os.chdir(os.path.dirname(os.path.abspath(__file__)))
-
-LOG_FILE_NAME = 'logs/pnda-cli.%s.log' % time.time()
 logging.basicConfig(filename=LOG_FILE_NAME,
                     level=logging.INFO,
                     format='%(asctime)s - %(levelname)s - %(message)s')
-LOG = logging.getLogger('everything')
-CONSOLE = logging.getLogger('console')
 CONSOLE.addHandler(logging.StreamHandler())
 
-NAME_REGEX = r"^[\.a-zA-Z0-9-]+$"
-VALIDATION_RULES = None
 START = datetime.datetime.now()
+JOURNAL_DIR = 'cli/journal'
+# Output from hosts goes to per host, per phase segments here once a cluster is known
+LOG_STORE_DIR = 'cli/logs/runs'
 
 def banner():
     print "🐼  🐼  🐼  🐼  🐼  🐼  🐼"
@@ -68,403 +83,423 @@ def display_elasped():
     elapsed = datetime.datetime.now() - START
     CONSOLE.info("%sTotal execution time: %s%s", blue, str(elapsed), reset)
 
-def generate_template_file(filepath, datanodes, opentsdbs, kafkas, zookeepers):
-    with open(filepath, 'r') as template_file:
-        template_data = json.loads(template_file.read())
-        instance_cdh_dn = json.dumps(template_data['Resources'].pop('instanceCdhDn'))
-        instance_open_tsdb = json.dumps(template_data['Resources'].pop('instanceOpenTsdb'))
-        instance_kafka = json.dumps(template_data['Resources'].pop('instanceKafka'))
-        instance_zookeeper = json.dumps(template_data['Resources'].pop('instanceZookeeper'))
-
-        for datanode in range(1, datanodes + 1):
-            instance_cdh_dn_n = instance_cdh_dn.replace('$node_idx$', str(datanode))
-            template_data['Resources']['instanceCdhDn%s' % datanode] = json.loads(instance_cdh_dn_n)
-
-        for opentsdb in range(1, opentsdbs + 1):
-            instance_open_tsdb_n = instance_open_tsdb.replace('$node_idx$', str(opentsdb))
-            template_data['Resources']['instanceOpenTsdb%s' % opentsdb] = json.loads(instance_open_tsdb_n)
-
-        for kafka in range(1, kafkas + 1):
-            instance_kafka_n = instance_kafka.replace('$node_idx$', str(kafka))
-            template_data['Resources']['instanceKafka%s' % kafka] = json.loads(instance_kafka_n)
-
-        for zookeeper in range(1, zookeepers + 1):
-            instance_zookeeper_n = instance_zookeeper.replace('$node_idx$', str(zookeeper))
-            template_data['Resources']['instanceZookeeper%s' % zookeeper] = json.loads(instance_zookeeper_n)
-
-    return json.dumps(template_data)
-
-def get_instance_map(cluster):
-    CONSOLE.debug('Checking details of created instances')
-    region = os.environ['AWS_REGION']
-    ec2 = boto.ec2.connect_to_region(region)
-    reservations = ec2.get_all_reservations()
-    instance_map = {}
-    for reservation in reservations:
-        for instance in reservation.instances:
-            if 'pnda_cluster' in instance.tags and instance.tags['pnda_cluster'] == cluster and instance.state == 'running':
-                CONSOLE.debug(instance.private_ip_address, ' ', instance.tags['Name'])
-                instance_map[instance.tags['Name']] = {
-                    "public_dns": instance.public_dns_name,
-                    "ip_address": instance.ip_address,
-                    "private_ip_address":instance.private_ip_address,
-                    "name": instance.tags['Name'],
-                    "node_idx": instance.tags['node_idx'],
-                    "node_type": instance.tags['node_type']
-                }
-    return instance_map
-
-def get_current_node_counts(cluster):
-    CONSOLE.debug('Counting existing instances')
-    node_counts = {}
-    for _, instance in get_instance_map(cluster).iteritems():
-        if instance['node_type'] in node_counts:
-            current_count = node_counts[instance['node_type']]
-        else:
-            current_count = 0
-        node_counts[instance['node_type']] = current_count + 1
-    return node_counts
-
-def scp(files, host):
-    cmd = "scp -F cli/ssh_config %s %s:%s" % (' '.join(files), host, '/tmp')
-    CONSOLE.debug(cmd)
-    ret_val = subprocess_to_log.call(cmd.split(' '), LOG, host)
-    if ret_val != 0:
-        raise Exception("Error transfering files to new host %s via SCP. See debug log (%s) for details." % (host, LOG_FILE_NAME))
-
-def ssh(cmds, host):
-    cmd = "ssh -F cli/ssh_config %s" % host
-    parts = cmd.split(' ')
-    parts.append(';'.join(cmds))
-    CONSOLE.debug(parts)
-    ret_val = subprocess_to_log.call(parts, LOG, host, scan_for_errors=['lost connection'])
-    if ret_val != 0:
-        raise Exception("Error running ssh commands on host %s. See debug log (%s) for details." % (host, LOG_FILE_NAME))
-
-def bootstrap(instance, saltmaster, cluster, flavour):
-    ret_val = None
-    try:
-        ip_address = instance['private_ip_address']
-        CONSOLE.debug('bootstrapping %s', ip_address)
-        node_type = instance['node_type']
-        type_script = 'bootstrap-scripts/%s/%s.sh' % (flavour, node_type)
-        if not os.path.isfile(type_script):
-            type_script = 'bootstrap-scripts/%s.sh' % (node_type)
-        node_idx = instance['node_idx']
-        scp(['pnda_env.sh', 'bootstrap-scripts/base.sh', type_script], ip_address)
-        ssh(['source /tmp/pnda_env.sh',
-             'export PNDA_SALTMASTER_IP=%s' % saltmaster,
-             'export PNDA_CLUSTER=%s' % cluster,
-             'export PNDA_FLAVOR=%s' % flavour,
-             'sudo chmod a+x /tmp/base.sh',
-             'sudo -E /tmp/base.sh',
-             'sudo chmod a+x /tmp/%s.sh' % node_type,
-             'sudo -E /tmp/%s.sh %s' % (node_type, node_idx)], ip_address)
-    except:
-        ret_val = 'Error for host %s. %s' % (instance['name'], traceback.format_exc())
-    return ret_val
-
-def check_environment_variables():
-    try:
-        region = os.environ['AWS_REGION']
-        CONSOLE.debug('AWS region is %s', region)
-        CONSOLE.info('Env variables.... OK')
-    except:
-        CONSOLE.info('Env variables.... ERROR')
-        CONSOLE.error('Missing required environment variables, run "source ../client_env.sh" and try again.')
-        sys.exit(1)
-
-def check_keypair(keyname, keyfile):
-    if not os.path.isfile(keyfile):
-        CONSOLE.info('Keyfile.......... ERROR')
-        CONSOLE.error('Did not find local file named %s' % keyfile)
-        sys.exit(1)
-
-    try:
-        region = os.environ['AWS_REGION']
-        ec2 = boto.ec2.connect_to_region(region)
-        stored_key = ec2.get_key_pair(keyname)
-        if stored_key is None:
-            raise Exception("Key not found %s" % keyname)
-        CONSOLE.info('Keyfile.......... OK')
-    except:
-        CONSOLE.info('Keyfile.......... ERROR')
-        CONSOLE.error('Failed to find key %s in ec2.' % keyname)
-        CONSOLE.error(traceback.format_exc())
-        sys.exit(1)
-
-
-def check_aws_connection():
-    region = os.environ['AWS_REGION']
-    conn = boto.cloudformation.connect_to_region(region)
-    if conn is None:
-        CONSOLE.info('AWS connection... ERROR')        
-        CONSOLE.error('Failed to query cloud formation API, verify config in "client_env.sh" and try again.')
-        sys.exit(1)
-
-    try:
-        conn.list_stacks()
-        CONSOLE.info('AWS connection... OK')
-    except:
-        CONSOLE.info('AWS connection... ERROR')
-        CONSOLE.error('Failed to query cloud formation API, verify config in "client_env.sh" and try again.')
-        CONSOLE.error(traceback.format_exc())
-        sys.exit(1)
-
-def check_java_mirror(pnda_env):
-    try:
-        java_mirror = pnda_env['JAVA_MIRROR']
-        response = requests.head(java_mirror)
-        response.raise_for_status()
-        CONSOLE.info('Java mirror...... OK')
-    except KeyError:
-        CONSOLE.info('Java mirror...... WARN')
-        CONSOLE.warning('Java mirror was not defined in pnda_env.sh,' +
-                        ' provisioning will be more reliable and quicker if you host this in the same AWS availability zone.')
-    except:
-        CONSOLE.info('Java mirror...... ERROR')
-        CONSOLE.error('Failed to connect to java mirror. Verify connection to %s, update config in pnda_env.sh if required and try again.', '')
-        CONSOLE.error(traceback.format_exc())
-        sys.exit(1)
+@atexit.register
+def write_trace():
+    if not TRACER.spans:
+        return
+    # main() moves to the parent directory, so go by where the debug log really is
+    trace_name = os.path.join(CLI_DIR, LOG_FILE_NAME[:-len('.log')])
+    TRACER.write_jsonl('%s.trace.jsonl' % trace_name)
+    TRACER.write_chrome_trace('%s.trace.json' % trace_name)
+    for line in TRACER.report():
+        CONSOLE.info(line)
+    CONSOLE.info('Timings saved to %s.trace.jsonl, load %s.trace.json in chrome://tracing or Perfetto to view them',
+                 trace_name, trace_name)
+
+def start_log_store(cluster):
+    context = cluster_context.current()
+    context.logs = LogStore(LOG_STORE_DIR, '%s.%s' % (cluster, time.strftime('%Y%m%d-%H%M%S')))
+    CONSOLE.info('Saving output from hosts to %s, see it with: pnda-cli.py logs -e %s', context.logs.run_dir, cluster)
 
-def check_package_server(pnda_env):
+@atexit.register
+def close_log_store():
+    for context in cluster_context.all_contexts():
+        if context.logs is not None:
+            context.logs.close()
+
+def generate_template_file(filepath, datanodes, opentsdbs, kafkas, zookeepers, profiles=None):
+    template = template_engine.load(filepath)
+    return template.render({'datanodes': datanodes,
+                            'opentsdb-nodes': opentsdbs,
+                            'kafka-nodes': kafkas,
+                            'zk-nodes': zookeepers}, profiles)
+
+def load_profiles(flavour, path):
+    """ Reads instance profiles from path, checking each is for a role in the flavour's template """
+    return instance_profiles.load(path, template_engine.load(template_path(flavour)).roles.values())
+
+def template_arguments(template_data, cluster, flavour, options):
+    """
+    Returns the create_stack/update_stack arguments that pass template_data to cloud
+    formation. The template is sent inline while it fits, otherwise it is uploaded to the
+    template store and passed by URL. With nested stacks each indexed role is uploaded as
+    a child template first.
+    """
+    store = None
+    if options.template_store is not None:
+        store = object_store.from_uri(options.template_store, AWS, cluster_env('AWS_REGION'))
+
+    if options.nested_stacks:
+        if store is None:
+            raise Exception('Nested stacks are uploaded before use, specify where with --template-store')
+        template_data, children = template_engine.load(template_path(flavour)).nest(template_data)
+        for stack_name, child in sorted(children.items()):
+            child_body = template_engine.to_json(child)
+            CONSOLE.debug('Nested template %s is %s bytes with %s resources', stack_name, len(child_body), len(child['Resources']))
+            if len(child_body) > template_engine.URL_BODY_LIMIT:
+                raise Exception('Nested template %s is %s bytes, over the %s byte limit'
+                                % (stack_name, len(child_body), template_engine.URL_BODY_LIMIT))
+            url = store.put('%s/%s' % (cluster, object_store.content_key(stack_name, child_body)), child_body)
+            template_data['Resources'][stack_name]['Properties']['TemplateURL'] = url
+
+    body = template_engine.to_json(template_data)
+    CONSOLE.info('Template is %s bytes with %s resources', len(body), len(template_data['Resources']))
+    if len(template_data['Resources']) > template_engine.RESOURCE_LIMIT:
+        raise Exception('Template has %s resources, over the limit of %s for one stack. Use --nested-stacks.'
+                        % (len(template_data['Resources']), template_engine.RESOURCE_LIMIT))
+    if len(body) <= template_engine.INLINE_BODY_LIMIT:
+        return {'template_body': body}
+    if store is None:
+        raise Exception('Template is %s bytes, over the %s byte limit for an inline template. Use --template-store.'
+                        % (len(body), template_engine.INLINE_BODY_LIMIT))
+    if len(body) > template_engine.URL_BODY_LIMIT:
+        raise Exception('Template is %s bytes, over the %s byte limit for a template URL. Use --nested-stacks.'
+                        % (len(body), template_engine.URL_BODY_LIMIT))
+    return {'template_url': store.put('%s/%s' % (cluster, object_store.content_key('template', body)), body)}
+
+def stack_parameters(cluster, keyname):
+    #load these from env variables from client_env.sh
+    whitelist = cluster_env('AWS_ACCESS_WHITELIST')
+    return [('imageId', cluster_env('AWS_IMAGE_ID')),
+            ('keyName', keyname),
+            ('pndaCluster', cluster),
+            ('whitelistSshAccess', whitelist),
+            ('whitelistUiAccess', whitelist)]
+
+def deployed_profiles(cluster):
+    """ The instance profiles the cluster's stack was last created or updated with, from its template """
+    response = AWS.cloudformation(cluster_env('AWS_REGION')).get_template(cluster)
+    deployed = json.loads(response['GetTemplateResponse']['GetTemplateResult']['TemplateBody'])
+    return deployed.get('Metadata', {}).get(instance_profiles.METADATA_KEY)
+
+def plan_stack_update(conn, cluster, flavour, template_data, parameters, options):
+    """
+    Compares the deployed template and stack parameters with what an update would send
+    and returns the resulting changes, see template_diff.diff_templates.
+    """
+    response = conn.get_template(cluster)
+    deployed = json.loads(response['GetTemplateResponse']['GetTemplateResult']['TemplateBody'])
+
+    generated = template_data
+    if options.nested_stacks:
+        generated, children = template_engine.load(template_path(flavour)).nest(template_data)
+        for stack_name, child in children.items():
+            generated['Resources'][stack_name]['Properties']['TemplateURL'] = \
+                object_store.content_key(stack_name, template_engine.to_json(child))
+    changes = template_diff.diff_templates(deployed, generated)
+
+    deployed_parameters = dict([(parameter.key, parameter.value) for parameter in conn.describe_stacks(cluster)[0].parameters])
+    for key, value in parameters:
+        if deployed_parameters.get(key) != value:
+            changes.append((template_diff.MODIFY, key, 'stack parameter', []))
+    return changes
+
+def stack_status(conn, cluster):
+    """ The status of the cluster's stack, or None when there is no such stack """
     try:
-        package_uri = '%s/%s' % (pnda_env['PACKAGES_SERVER_URI'], 'platform/releases/')
-        response = requests.head(package_uri)
-        if response.status_code != 403 and response.status_code != 200:
-            raise Exception("Unexpected status code from %s: %s" % (package_uri, response.status_code))
-        CONSOLE.info('Package server... OK')
+        return conn.describe_stacks(cluster)[0].stack_status
     except:
-        CONSOLE.info('Package server... ERROR')
-        CONSOLE.error('Failed to connect to package server. Verify connection to %s, update URL in pnda_env.sh if required and try again.', package_uri)
-        CONSOLE.error(traceback.format_exc())
-        sys.exit(1)
-
-def write_ssh_config(bastion_ip, os_user, keyfile):
-    with open('cli/ssh_config', 'w') as config_file:
-        config_file.write('host *\n')
-        config_file.write('    User %s\n' % os_user)
-        config_file.write('    IdentityFile %s\n' % keyfile)
-        config_file.write('    StrictHostKeyChecking no\n')
-        config_file.write('    UserKnownHostsFile /dev/null\n')
-        config_file.write('    ProxyCommand ssh -i %s -o StrictHostKeyChecking=no -o UserKnownHostsFile=/dev/null %s@%s exec nc %%h %%p\n'
-                          % (keyfile, os_user, bastion_ip))
-
-    with open('cli/socks_proxy', 'w') as config_file:
-        config_file.write('eval `ssh-agent`\n')
-        config_file.write('ssh-add %s\n' % keyfile)
-        config_file.write('ssh -i %s -o StrictHostKeyChecking=no -o UserKnownHostsFile=/dev/null -A -D 9999 %s@%s\n' % (keyfile, os_user, bastion_ip))
-
-def create(template_data, cluster, flavour, keyname, no_config_check):
+        return None
+
+def follow_stack(conn, cluster, in_progress):
+    """
+    Waits for an operation on cluster's stack that an earlier run started, while it is
+    in_progress, and returns the stack status it ended with, and the waiter.
+    """
+    # the waiter only sees events after it was made, so check the status after making it
+    waiter = StackWaiter(conn, cluster, CONSOLE)
+    status = stack_status(conn, cluster)
+    if status == in_progress:
+        CONSOLE.info('Cloud Formation stack is %s, following it', status)
+        status = waiter.wait()
+    return status, waiter
+
+def create(template_data, cluster, flavour, keyname, no_config_check, options, journal):
     keyfile = '%s.pem' % keyname
-    #load these from env variables from client_env.sh
-
-    if not no_config_check:
-        CONSOLE.info('Checking configuration...')
-        check_environment_variables()
-
-    region = os.environ['AWS_REGION']
-    image_id = os.environ['AWS_IMAGE_ID']
-    whitelist = os.environ['AWS_ACCESS_WHITELIST']
-
-    if not no_config_check:
-        settings_file_name = 'pnda_env.sh'
-        settings_file_contents = subprocess.Popen(['bash', '-c', 'source {} && env'.format(settings_file_name)], stdout=subprocess.PIPE).stdout
-        pnda_env = {entry_parts[0].strip(): entry_parts[1].strip() for entry_parts in [entry.strip().split('=', 1) for entry in settings_file_contents]}
-        check_aws_connection()
-        check_keypair(keyname, keyfile)
-        check_package_server(pnda_env)
-        check_java_mirror(pnda_env)
-
-    CONSOLE.info('Creating Cloud Formation stack')
-    conn = boto.cloudformation.connect_to_region(region)
-    stack_status = 'CREATING'
-    conn.create_stack(cluster,
-                      template_body=template_data,
-                      parameters=[('imageId', image_id),
-                                  ('keyName', keyname),
-                                  ('pndaCluster', cluster),
-                                  ('whitelistSshAccess', whitelist),
-                                  ('whitelistUiAccess', whitelist)])
-
-    while stack_status in ['CREATE_IN_PROGRESS', 'CREATING']:
-        time.sleep(5)
-        CONSOLE.info('Stack is: ' + stack_status)
-        stacks = conn.describe_stacks(cluster)
-        if len(stacks) > 0:
-            stack_status = stacks[0].stack_status
-
-    if stack_status != 'CREATE_COMPLETE':
-        CONSOLE.error('Stack did not come up, status is: ' + stack_status)
-        sys.exit(1)
+    stream = None
+
+    if journal.phase_done('stack'):
+        CONSOLE.info('Cloud Formation stack was already created, resuming')
+    else:
+        if not no_config_check:
+            CONSOLE.info('Checking configuration...')
+            check_environment_variables()
+
+        region = cluster_env('AWS_REGION')
+
+        if not no_config_check:
+            run_preflight(keyname, keyfile, options.preflight_ttl)
+
+        with TRACER.span('stack', tracer.PHASE):
+            conn = AWS.cloudformation(region)
+            status = None
+            if journal.phase_done('stack requested'):
+                # an interrupted run asked for the stack, which may be there or on its way
+                status, waiter = follow_stack(conn, cluster, 'CREATE_IN_PROGRESS')
+            if status is None:
+                template_args = template_arguments(template_data, cluster, flavour, options)
+                CONSOLE.info('Creating Cloud Formation stack')
+                waiter = StackWaiter(conn, cluster, CONSOLE)
+                journal.mark_phase('stack requested')
+                conn.create_stack(cluster,
+                                  parameters=stack_parameters(cluster, keyname),
+                                  **template_args)
+
+                if getattr(options, 'stream_bootstrap', False):
+                    stream = stream_bootstrap.start(cluster, flavour, keyfile, journal, options,
+                                                    [name for name in stream_bootstrap.PREREQUISITES if name in template_data['Resources']],
+                                                    lambda instance: instance['node_type'] != 'saltmaster', True)
+                status = waiter.wait(stream['feed'].on_event if stream is not None else None)
+        INVENTORY.invalidate(region, cluster)
+        if status != 'CREATE_COMPLETE':
+            if stream is not None:
+                stream_bootstrap.stop(stream)
+            CONSOLE.error('Stack did not come up, status is: %s. Failed at: %s', status, waiter.failure_reason())
+            sys.exit(1)
+        journal.mark_phase('stack')
 
     instance_map = get_instance_map(cluster)
-    write_ssh_config(instance_map[cluster+'-bastion']['ip_address'], os.environ['OS_USER'], os.path.abspath(keyfile))
+    write_ssh_config(cluster, instance_map[cluster+'-bastion']['ip_address'], cluster_env('OS_USER'), os.path.abspath(keyfile))
     CONSOLE.debug('The PNDA console will come up on: http://%s', instance_map[cluster+'-cdh-edge']['private_ip_address'])
 
-    CONSOLE.info('Bootstrapping saltmaster. Expect this to take a few minutes, check the debug log for progress (%s).', LOG_FILE_NAME)
+    CONSOLE.info('Bootstrapping saltmaster and other instances. Expect this to take a few minutes, check the debug log for progress (%s).', LOG_FILE_NAME)
     saltmaster = instance_map[cluster+'-saltmaster']['private_ip_address']
-    scp(['bootstrap-scripts/saltmaster.sh', 'pnda_env.sh', 'client_env.sh', 'git.pem'], instance_map[cluster+'-saltmaster']['private_ip_address'])
-    ssh(['source /tmp/client_env.sh',
-         'source /tmp/pnda_env.sh',
-         'export PNDA_SALTMASTER_IP=%s' % saltmaster,
-         'export PNDA_CLUSTER=%s' % cluster,
-         'export PNDA_FLAVOR=%s' % flavour,
-         'sudo chmod a+x /tmp/saltmaster.sh',
-         'sudo -E /tmp/saltmaster.sh'],
-        instance_map[cluster+'-saltmaster']['private_ip_address'])
-
-    CONSOLE.info('Bootstrapping other instances. Expect this to take a few minutes, check the debug log for progress (%s).', LOG_FILE_NAME)
-    bootstrap_threads = []
-    for key, instance in instance_map.iteritems():
-        if 'saltmaster' not in key:
-            thread = Thread(target=bootstrap, args=[instance, saltmaster, cluster, flavour])
-            bootstrap_threads.append(thread)
-
-    for thread in bootstrap_threads:
-        thread.start()
-        time.sleep(2)
-
-    for thread in bootstrap_threads:
-        ret_val = thread.join()
-        if ret_val is not None:
-            raise Exception("Error bootstrapping host, error msg: %s. See debug log (%s) for details." % (ret_val, LOG_FILE_NAME))
-
-    time.sleep(30)
+    with TRACER.span('bootstrap', tracer.PHASE):
+        if stream is not None:
+            stream_bootstrap.finish(stream)
+        else:
+            bootstrap_bundle = None
+            if options.distribution == 'relay':
+                bootstrap_bundle = publish_bundle(flavour, saltmaster)
+            artifacts_env = None
+            if options.artifact_cache or options.offline:
+                artifacts_env = publish_artifacts(saltmaster, options.offline)
+            run_graph(bootstrap_graph([instance for key, instance in instance_map.iteritems() if 'saltmaster' not in key],
+                                      saltmaster, cluster, flavour, journal, bootstrap_bundle, artifacts_env, with_saltmaster=True),
+                      options.parallel, options.keep_going)
+    report_disk_throughput()
+
+    minions = sorted([name for name in instance_map if 'saltmaster' not in name])
+    with TRACER.span('minion readiness', tracer.PHASE):
+        wait_for_minions(saltmaster, minions, options.minion_timeout)
 
     CONSOLE.info('Running salt to install software. Expect this to take 45 minutes or more, check the debug log for progress (%s).', LOG_FILE_NAME)
-    ssh(['sudo salt -v --log-level=debug --state-output=mixed "*" state.highstate',
-         'sudo CLUSTER=%s salt-run --log-level=debug state.orchestrate orchestrate.pnda' % cluster,
-         'sudo salt "*-bastion" state.sls hostsfile'],
-        instance_map[cluster+'-saltmaster']['private_ip_address'])
+    run_salt(saltmaster, cluster, 'orchestrate.pnda', None, options.batch_size, journal)
     return instance_map[cluster+'-cdh-edge']['private_ip_address']
 
-def expand(template_data, cluster, flavour, old_datanodes, old_kafka, keyname):
+def is_new_instance(instance, old_datanodes, old_kafka):
+    return (instance['node_type'] == 'cdh-dn' and int(instance['node_idx']) > old_datanodes
+            or instance['node_type'] == 'kafka' and int(instance['node_idx']) > old_kafka)
+
+def confirm_changes(destructive, options):
+    """
+    Whether a stack update that makes the destructive changes may go ahead, because
+    there are none, --yes was given, or the user says so when asked.
+    """
+    if not destructive or getattr(options, 'yes', False):
+        return True
+    names = ', '.join([name for _, name, _, _ in destructive])
+    # a fleet runs clusters side by side, so nobody can be asked
+    if cluster_context.current().cluster is None and sys.stdin.isatty():
+        answer = raw_input('The update replaces, removes or restarts %s. Apply it? (yes/no): ' % names)
+        if answer.strip().lower() in ('y', 'yes'):
+            return True
+    CONSOLE.error('The update replaces, removes or restarts %s, which can lose data on them. '
+                  'Check the plan above and run again with --yes to apply it.', names)
+    return False
+
+def expand(template_data, cluster, flavour, old_datanodes, old_kafka, keyname, options, journal):
     keyfile = '%s.pem' % keyname
-    #load these from env variables from client_env.sh
-    region = os.environ['AWS_REGION']
-    image_id = os.environ['AWS_IMAGE_ID']
-    whitelist = os.environ['AWS_ACCESS_WHITELIST']
-
-    CONSOLE.info('Updating Cloud Formation stack')
-    conn = boto.cloudformation.connect_to_region(region)
-    stack_status = 'UPDATING'
-    conn.update_stack(cluster,
-                      template_body=template_data,
-                      parameters=[('imageId', image_id),
-                                  ('keyName', keyname),
-                                  ('pndaCluster', cluster),
-                                  ('whitelistSshAccess', whitelist),
-                                  ('whitelistUiAccess', whitelist)])
-
-    while stack_status in ['UPDATE_IN_PROGRESS', 'UPDATING', 'UPDATE_COMPLETE_CLEANUP_IN_PROGRESS']:
-        time.sleep(5)
-        CONSOLE.info('Stack is: ' + stack_status)
-        stacks = conn.describe_stacks(cluster)
-        if len(stacks) > 0:
-            stack_status = stacks[0].stack_status
-
-    if stack_status != 'UPDATE_COMPLETE':
-        CONSOLE.error('Stack did not come up, status is: ' + stack_status)
-        sys.exit(1)
+    region = cluster_env('AWS_REGION')
+    stream = None
+
+    if journal.phase_done('stack'):
+        CONSOLE.info('Cloud Formation stack was already updated, resuming')
+    else:
+        conn = AWS.cloudformation(region)
+        if journal.phase_done('stack requested'):
+            # let the update an interrupted run asked for finish, planning against it would
+            # find nothing left to do once it has, or the same update again if it rolled back
+            follow_stack(conn, cluster, 'UPDATE_IN_PROGRESS')
+            INVENTORY.invalidate(region, cluster)
+        changes = plan_stack_update(conn, cluster, flavour, template_data, stack_parameters(cluster, keyname), options)
+        if not changes:
+            CONSOLE.info('Cloud Formation stack is already up to date, skipping the stack update')
+        else:
+            CONSOLE.info('Cloud Formation stack update plan:')
+            for action, name, resource_type, properties in changes:
+                CONSOLE.info('  %-8s %-32s %-28s %s', action, name, resource_type, ', '.join(properties))
+        if options.plan_only:
+            journal.remove()
+            return None
+        if not confirm_changes(template_diff.destructive(changes), options):
+            journal.remove()
+            sys.exit(1)
+        if changes:
+            with TRACER.span('stack', tracer.PHASE):
+                template_args = template_arguments(template_data, cluster, flavour, options)
+                CONSOLE.info('Updating Cloud Formation stack')
+                waiter = StackWaiter(conn, cluster, CONSOLE)
+                journal.mark_phase('stack requested')
+                conn.update_stack(cluster,
+                                  parameters=stack_parameters(cluster, keyname),
+                                  **template_args)
+
+                if getattr(options, 'stream_bootstrap', False):
+                    stream = stream_bootstrap.start(cluster, flavour, keyfile, journal, options, [],
+                                                    lambda instance: is_new_instance(instance, old_datanodes, old_kafka), False)
+                status = waiter.wait(stream['feed'].on_event if stream is not None else None)
+            INVENTORY.invalidate(region, cluster)
+            if status != 'UPDATE_COMPLETE':
+                if stream is not None:
+                    stream_bootstrap.stop(stream)
+                CONSOLE.error('Stack did not come up, status is: %s. Failed at: %s', status, waiter.failure_reason())
+                sys.exit(1)
+        journal.mark_phase('stack')
 
     instance_map = get_instance_map(cluster)
-    write_ssh_config(instance_map[cluster+'-bastion']['ip_address'], os.environ['OS_USER'], os.path.abspath(keyfile))
+    write_ssh_config(cluster, instance_map[cluster+'-bastion']['ip_address'], cluster_env('OS_USER'), os.path.abspath(keyfile))
     saltmaster = instance_map[cluster+'-saltmaster']['private_ip_address']
 
     CONSOLE.info('Bootstrapping new instances. Expect this to take a few minutes, check the debug log for progress. (%s)', LOG_FILE_NAME)
-    bootstrap_threads = []
+    new_instances = []
     for _, instance in instance_map.iteritems():
-        if ((instance['node_type'] == 'cdh-dn' and int(instance['node_idx']) > old_datanodes
-             or instance['node_type'] == 'kafka' and int(instance['node_idx']) > old_kafka)):
-            thread = Thread(target=bootstrap, args=[instance, saltmaster, cluster, flavour])
-            bootstrap_threads.append(thread)
-
-    for thread in bootstrap_threads:
-        thread.start()
-        time.sleep(2)
-
-    for thread in bootstrap_threads:
-        ret_val = thread.join()
-        if ret_val is not None:
-            raise Exception("Error bootstrapping host, error msg: %s. See debug log (%s) for details." % (ret_val, LOG_FILE_NAME))
-
-    time.sleep(30)
+        if is_new_instance(instance, old_datanodes, old_kafka):
+            new_instances.append(instance)
+    with TRACER.span('bootstrap', tracer.PHASE):
+        if stream is not None:
+            stream_bootstrap.finish(stream)
+        else:
+            bootstrap_bundle = None
+            if options.distribution == 'relay':
+                bootstrap_bundle = publish_bundle(flavour, saltmaster)
+            artifacts_env = None
+            if options.artifact_cache or options.offline:
+                artifacts_env = publish_artifacts(saltmaster, options.offline)
+            run_graph(bootstrap_graph(new_instances, saltmaster, cluster, flavour, journal, bootstrap_bundle, artifacts_env),
+                      options.parallel, options.keep_going)
+    report_disk_throughput()
+
+    with TRACER.span('minion readiness', tracer.PHASE):
+        wait_for_minions(saltmaster, [name for name in instance_map if 'saltmaster' not in name], options.minion_timeout)
 
     CONSOLE.info('Running salt to install software. Expect this to take 10 - 20 minutes, check the debug log for progress. (%s)', LOG_FILE_NAME)
-    ssh(['sudo salt -v --log-level=debug --state-output=mixed "*" state.highstate',
-         'sudo CLUSTER=%s salt-run --log-level=debug state.orchestrate orchestrate.pnda-expand' % cluster,
-         'sudo salt "*-bastion" state.sls hostsfile'],
-        instance_map[cluster+'-saltmaster']['private_ip_address'])
+    run_salt(saltmaster, cluster, 'orchestrate.pnda-expand', expand_highstate_targets(instance_map, new_instances),
+             options.batch_size, journal)
     return instance_map[cluster+'-cdh-edge']['private_ip_address']
 
 def destroy(cluster):
     CONSOLE.info('Deleting Cloud Formation stack')
-    region = os.environ['AWS_REGION']
-    conn = boto.cloudformation.connect_to_region(region)
-
-    stack_status = 'DELETING'
-    conn.delete_stack(cluster)
-    while stack_status in ['DELETE_IN_PROGRESS', 'DELETING']:
-        time.sleep(5)
-        CONSOLE.info('Stack is: ' + stack_status)
-        try:
-            stacks = conn.describe_stacks(cluster)
-        except:
-            stacks = []
-
-        if len(stacks) > 0:
-            stack_status = stacks[0].stack_status
-        else:
-            stack_status = None
-
-def name_string(value):
-    try:
-        return re.match(NAME_REGEX, value).group(0)
-    except:
-        raise argparse.ArgumentTypeError("String '%s' may contain only  a-z 0-9 and '-'" % value)
-
-def get_validation(param_name):
-    return VALIDATION_RULES[param_name]
-
-def check_validation(restriction, value):
-    if restriction.startswith("<="):
-        return value <= int(restriction[2:])
-
-    if restriction.startswith(">="):
-        return value > int(restriction[2:])
-
-    if restriction.startswith("<"):
-        return value < int(restriction[1:])
-
-    if restriction.startswith(">"):
-        return value > int(restriction[1:])
-
-    if "-" in restriction:
-        restrict_min = int(restriction.split('-')[0])
-        restrict_max = int(restriction.split('-')[1])
-        return value >= restrict_min and value <= restrict_max
+    region = cluster_env('AWS_REGION')
+    conn = AWS.cloudformation(region)
 
-    return value == int(restriction)
-
-def validate_size(param_name, value):
-    restrictions = get_validation(param_name)
-    for restriction in restrictions.split(','):
-        if check_validation(restriction, value):
-            return True
-    return False
-
-def node_limit(param_name, value):
-    as_num = None
     try:
-        as_num = int(value)
+        stack_id = conn.describe_stacks(cluster)[0].stack_id
     except:
-        raise argparse.ArgumentTypeError("'%s' must be an integer, %s found" % (param_name, value))
+        CONSOLE.info('Stack %s does not exist', cluster)
+        return
+
+    # follow the deletion by stack id, the name stops resolving once the stack is gone
+    waiter = StackWaiter(conn, stack_id, CONSOLE)
+    with TRACER.span('stack delete', tracer.PHASE):
+        conn.delete_stack(cluster)
+        Journal(Journal.path_for(JOURNAL_DIR, cluster)).remove()
+        status = waiter.wait()
+    INVENTORY.invalidate(region, cluster)
+    if status != 'DELETE_COMPLETE':
+        CONSOLE.error('Stack was not deleted, status is: %s. Failed at: %s', status, waiter.failure_reason())
+        sys.exit(1)
 
-    if not validate_size(param_name, as_num):
-        raise argparse.ArgumentTypeError("'%s' is not in valid range %s" % (as_num, get_validation(param_name)))
+def expand_settings(cluster, flavour, keyname, datanodes, kafkanodes, new_profiles=None):
+    """
+    Checks the new node counts for an expand of cluster against what it has now and returns
+    its settings. new_profiles take precedence over the instance profiles in use so far.
+    """
+    node_counts = get_current_node_counts(cluster)
+
+    if datanodes is None:
+        datanodes = node_counts['cdh-dn']
+    if kafkanodes is None:
+        kafkanodes = node_counts['kafka']
+    # nodes keep the instance profiles the stack was built with unless new ones are given
+    profiles = instance_profiles.merge(deployed_profiles(cluster), new_profiles)
+
+    if not validate_size("datanodes", datanodes):
+        print "Consider choice of datanodes again, limits are: %s" % get_validation("datanodes")
+        sys.exit(1)
+    if not validate_size("kafka-nodes", kafkanodes):
+        print "Consider choice of kafkanodes again, limits are: %s" % get_validation("kafka-nodes")
+        sys.exit(1)
 
-    return as_num
+    if datanodes < node_counts['cdh-dn']:
+        print "You cannot shrink the cluster using this CLI, existing number of datanodes is: %s" % node_counts['cdh-dn']
+        sys.exit(1)
+    elif datanodes > node_counts['cdh-dn']:
+        print "Increasing the number of datanodes from %s to %s" % (node_counts['cdh-dn'], datanodes)
+    if kafkanodes < node_counts['kafka']:
+        print "You cannot shrink the cluster using this CLI, existing number of kafkanodes is: %s" % node_counts['kafka']
+        sys.exit(1)
+    elif  kafkanodes > node_counts['kafka']:
+        print "Increasing the number of kafkanodes from %s to %s" % (node_counts['kafka'], kafkanodes)
+
+    settings = {'flavour': flavour, 'keyname': keyname,
+                'datanodes': datanodes, 'opentsdb_nodes': node_counts['opentsdb'],
+                'kafka_nodes': kafkanodes, 'zk_nodes': node_counts['zk'],
+                'old_datanodes': node_counts['cdh-dn'], 'old_kafka': node_counts['kafka'],
+                'profiles': profiles}
+    return settings
+
+def run_journaled(cluster, command, settings, options, journal=None):
+    """
+    Runs create or expand with settings, recording progress in the cluster's journal. A new
+    journal is started unless journal, loaded by resume, is given.
+    """
+    if journal is None:
+        settings['options'] = dict([(name, getattr(options, name)) for name in JOURNALED_OPTIONS])
+        journal = Journal(Journal.path_for(JOURNAL_DIR, cluster))
+        journal.start(command, settings)
+    start_log_store(cluster)
+
+    flavour = settings['flavour']
+    template_data = generate_template_file(template_path(flavour), settings['datanodes'], settings['opentsdb_nodes'],
+                                           settings['kafka_nodes'], settings['zk_nodes'], settings.get('profiles'))
+    if command == 'create':
+        console_dns = create(template_data, cluster, flavour, settings['keyname'], settings['no_config_check'],
+                             options, journal)
+        CONSOLE.info('Use the PNDA console to get started: http://%s', console_dns)
+        context = cluster_context.current()
+        CONSOLE.info(' Access hints:')
+        CONSOLE.info('  - Set up a socks proxy with: ./%s', os.path.relpath(context.socks_proxy, 'cli'))
+        CONSOLE.info('  - ssh to a node with: ssh -F %s <private_ip>', os.path.relpath(context.ssh_config, 'cli'))
+    else:
+        expand(template_data, cluster, flavour, settings['old_datanodes'], settings['old_kafka'],
+               settings['keyname'], options, journal)
+
+def resume(cluster):
+    journal = Journal(Journal.path_for(JOURNAL_DIR, cluster))
+    if not journal.load():
+        CONSOLE.error('No journal found for %s, there is nothing to resume', cluster)
+        sys.exit(1)
+    if journal.phase_done('complete'):
+        CONSOLE.info('The last %s of %s completed, there is nothing to resume', journal.command(), cluster)
+        return
+
+    settings = journal.settings()
+    if 'environment' in settings and cluster_context.current().cluster is None:
+        # started by a fleet command, so pick up its ssh config and settings
+        cluster_context.activate(fleet.fleet_context(cluster, settings['environment']))
+    CONSOLE.info('Resuming %s of %s', journal.command(), cluster)
+    load_validation_rules(settings['flavour'])
+    options = argparse.Namespace(plan_only=False, **settings['options'])
+    run_journaled(cluster, journal.command(), settings, options, journal)
+
+def run_fleet_entry(cluster, command, settings, options):
+    if command == 'destroy':
+        destroy(cluster)
+    elif command == 'resume':
+        resume(cluster)
+    else:
+        run_journaled(cluster, command, settings, options)
 
 def get_args():
     epilog = """examples:
@@ -476,11 +511,31 @@ def get_args():
     pnda-cli.py expand -e squirrel-land -f standard -s keyname -n 10 -k 5
     Either, or both, kafka (k) and datanodes (n) can be changed. The value specifies the new total number of nodes. Shrinking is not supported - this must be done very carefully to avoid data loss.
   - create cluster without user input:
-    pnda-cli.py create -s mykeyname -e squirrel-land -f standard -n 5 -o 1 -k 2 -z 3"""
+    pnda-cli.py create -s mykeyname -e squirrel-land -f standard -n 5 -o 1 -k 2 -z 3
+  - create, expand or destroy each cluster listed in a manifest, all at the same time:
+    pnda-cli.py fleet -m fleet.json
+    where fleet.json is like {"clusters": [{"command": "create", "pnda_cluster": "squirrel-land", "flavour": "standard",
+    "keyname": "mykeyname", "datanodes": 5, "opentsdb_nodes": 1, "kafka_nodes": 2, "zk_nodes": 3, "region": "eu-west-1"}]}
+    and entries may also give "environment" settings, "options" such as "parallel" and instance "profiles"
+  - carry on with a create or expand that was interrupted:
+    pnda-cli.py resume -e squirrel-land
+  - work out how many nodes of which instance types, with how much disk, a workload needs, then create a cluster sized for it:
+    pnda-cli.py plan --kafka-mb-per-sec 10 --retention-days 7 --hdfs-replication 3 --opentsdb-points-per-sec 50000
+    pnda-cli.py create -e squirrel-land -f standard -s mykeyname --kafka-mb-per-sec 10 --retention-days 7
+  - choose the instance type and EBS data volumes for a role, or for some nodes of a role, e.g. to move datanodes 11 onwards to a newer generation:
+    pnda-cli.py expand -e squirrel-land -f standard -s mykeyname -n 20 --profiles profiles.json
+    where profiles.json is like {"kafka": {"instance_type": "m4.2xlarge", "volumes": {"count": 2, "size_gb": 500, "type": "st1"}},
+    "cdh-dn": [{"volumes": {"count": 3, "size_gb": 2048, "type": "gp2"}},
+    {"nodes": "11-20", "instance_type": "m5.2xlarge", "volumes": {"type": "gp3", "iops": 6000, "throughput": 500}}]}
+  - check the health of every host in a cluster, by role, or as json for monitoring:
+    pnda-cli.py status -e squirrel-land -s mykeyname
+    pnda-cli.py status -e squirrel-land --json
+  - show the errors and salt failures from the last run against a cluster, or the end of one host's output:
+    pnda-cli.py logs -e squirrel-land
+    pnda-cli.py logs -e squirrel-land --host squirrel-land-kafka-0 --phase base --tail 100"""
     parser = argparse.ArgumentParser(formatter_class=RawTextHelpFormatter, description='PNDA CLI', epilog=epilog)
-    banner()
 
-    parser.add_argument('command', help='Mode of operation', choices=['create', 'expand', 'destroy'])
+    parser.add_argument('command', help='Mode of operation', choices=['create', 'expand', 'destroy', 'resume', 'logs', 'fleet', 'status', 'plan'])
     parser.add_argument('-e', '--pnda-cluster', type=name_string, help='Namespaced environment for machines in this cluster')
     parser.add_argument('-n', '--datanodes', type=int, help='How many datanodes for the hadoop cluster')
     parser.add_argument('-o', '--opentsdb-nodes', type=int, help='How many Open TSDB nodes for the hadoop cluster')
@@ -489,13 +544,60 @@ def get_args():
     parser.add_argument('-f', '--flavour', help='PNDA flavour: "standard"', choices=['standard'])
     parser.add_argument('-s', '--keyname', help='Keypair name')
     parser.add_argument('-x', '--no-config-check', action='store_true', help='Skip config verifiction checks')
+    parser.add_argument('--parallel', type=int, default=10, help='Maximum number of hosts to bootstrap at the same time')
+    parser.add_argument('--keep-going', action='store_true',
+                        help='Carry on bootstrapping the remaining hosts when one fails, instead of stopping at the first failure')
+    parser.add_argument('--distribution', choices=['direct', 'relay'], default='direct',
+                        help='How bootstrap files reach the hosts: "direct" copies them from here to every host, ' +
+                        '"relay" uploads one bundle to the saltmaster which serves it to the other hosts')
+    parser.add_argument('--minion-timeout', type=int, default=600,
+                        help='Seconds to wait for every salt minion to respond before running salt')
+    parser.add_argument('--template-store',
+                        help='Where to upload templates too large to send inline: s3://bucket/prefix, or a local directory')
+    parser.add_argument('--nested-stacks', action='store_true',
+                        help='Put each scalable role in its own nested stack, needs --template-store')
+    parser.add_argument('--stream-bootstrap', action='store_true',
+                        help='Bootstrap each instance as soon as it is running, while the rest of the stack is still being built')
+    parser.add_argument('--plan-only', action='store_true',
+                        help='For expand, show the changes a stack update would make and stop there')
+    parser.add_argument('-y', '--yes', action='store_true',
+                        help='For expand, apply a stack update even when it replaces, removes or restarts existing resources')
+    parser.add_argument('--batch-size', type=int,
+                        help='Run highstate on this many minions at a time, reporting progress after each batch')
+    parser.add_argument('--artifact-cache', action='store_true',
+                        help='Serve the salt installer, the packages in %s and other artifacts in %s from the saltmaster, '
+                        % (bootstrap.PACKAGES_FILE, bootstrap.ARTIFACT_MANIFEST) +
+                        'instead of every host downloading them, keeping a versioned copy in %s' % bootstrap.ARTIFACT_CACHE_DIR)
+    parser.add_argument('--preflight-ttl', type=int, default=600,
+                        help='Seconds to skip configuration checks that passed with the same config files, 0 to always check')
+    parser.add_argument('--offline', action='store_true',
+                        help='Implies --artifact-cache, use only artifacts already in the local cache and never download them')
+    parser.add_argument('-m', '--manifest', help='For fleet, the json file listing the clusters and what to do to each')
+    parser.add_argument('--max-clusters', type=int, help='For fleet, the most clusters to work on at the same time')
+    parser.add_argument('--probe-timeout', type=int, default=5, help='For status, seconds each host has to answer')
+    parser.add_argument('--json', action='store_true', help='For status and plan, print the health of each host or the plan as json')
+    parser.add_argument('--kafka-mb-per-sec', type=float, help='For plan and create, MB per second written to kafka')
+    parser.add_argument('--retention-days', type=float, help='For plan and create, days data is kept in HDFS')
+    parser.add_argument('--hdfs-replication', type=int, default=3, help='For plan and create, copies HDFS keeps of each block')
+    parser.add_argument('--profiles',
+                        help='For create and expand, json file giving the instance type and data volumes of each role or range of nodes')
+    parser.add_argument('--opentsdb-points-per-sec', type=float, help='For plan and create, data points per second written to Open TSDB')
+    parser.add_argument('--run', help='For logs, the run to show instead of the latest, e.g. squirrel-land.20170101-120000')
+    parser.add_argument('--host', help='For logs, only show this host, by instance name')
+    parser.add_argument('--phase', help='For logs, only show this phase or host step, e.g. base, minion, highstate')
+    parser.add_argument('--tail', type=int, help='For logs, show the last lines of output instead of the failures')
+    parser.add_argument('--warnings', action='store_true', help='For logs, show warnings as well as failures')
 
     args = parser.parse_args()
+    # json output goes to stdout on its own, for other programs to read
+    if not args.json:
+        banner()
     return args
 
 def main():
     args = get_args()
-    print 'Saving debug log to %s' % LOG_FILE_NAME
+    if not args.json:
+        print 'Saving debug log to %s' % LOG_FILE_NAME
     pnda_cluster = args.pnda_cluster
     datanodes = args.datanodes
     tsdbnodes = args.opentsdb_nodes
@@ -518,6 +620,45 @@ def main():
             print 'destroy command must specify pnda_cluster, e.g.\npnda-cli.py destroy -e squirrel-land'
             sys.exit(1)
 
+    if args.command == 'fleet':
+        if args.manifest is not None:
+            fleet.run_fleet(args.manifest, args, expand_settings, run_fleet_entry)
+            sys.exit(0)
+        else:
+            print 'fleet command must specify a manifest, e.g.\npnda-cli.py fleet -m fleet.json'
+            sys.exit(1)
+
+    if args.command == 'status':
+        if pnda_cluster is not None:
+            cluster_health.show_status(pnda_cluster, flavour or 'standard', keyname, args.probe_timeout, args.parallel, args.json)
+            sys.exit(0)
+        else:
+            print 'status command must specify pnda_cluster, e.g.\npnda-cli.py status -e squirrel-land'
+            sys.exit(1)
+
+    if args.command == 'plan':
+        flavour = flavour or 'standard'
+        load_validation_rules(flavour)
+        plan = sizing.workload_plan(flavour, args, validate_size)
+        if plan is not None:
+            sizing.show_plan(plan, args.json)
+            sys.exit(0)
+        else:
+            print 'plan command must specify the workload, e.g.\npnda-cli.py plan --kafka-mb-per-sec 10 --retention-days 7'
+            sys.exit(1)
+
+    if args.command == 'logs':
+        log_viewer.show_logs(LOG_STORE_DIR, pnda_cluster, args.run, args.host, args.phase, args.tail, args.warnings)
+        sys.exit(0)
+
+    if args.command == 'resume':
+        if pnda_cluster is not None:
+            resume(pnda_cluster)
+            sys.exit(0)
+        else:
+            print 'resume command must specify pnda_cluster, e.g.\npnda-cli.py resume -e squirrel-land'
+            sys.exit(1)
+
     while pnda_cluster is None:
         pnda_cluster = raw_input("Enter a name for the pnda cluster (e.g. squirrel-land): ")
         if not re.match(NAME_REGEX, pnda_cluster):
@@ -533,46 +674,29 @@ def main():
     while keyname is None:
         keyname = raw_input("Enter a keypair name to use for ssh access to instances: ")
 
-    global VALIDATION_RULES
-    validation_file = file('cloud-formation/%s/validation.json' % flavour)
-    VALIDATION_RULES = json.load(validation_file)
-    validation_file.close()
+    load_validation_rules(flavour)
 
     if args.command == 'expand':
         if pnda_cluster is not None:
-            node_counts = get_current_node_counts(pnda_cluster)
-
-            if datanodes is None:
-                datanodes = node_counts['cdh-dn']
-            if kafkanodes is None:
-                kafkanodes = node_counts['kafka']
-
-            if not validate_size("datanodes", datanodes):
-                print "Consider choice of datanodes again, limits are: %s" % get_validation("datanodes")
-                sys.exit(1)
-            if not validate_size("kafka-nodes", kafkanodes):
-                print "Consider choice of kafkanodes again, limits are: %s" % get_validation("kafka-nodes")
-                sys.exit(1)
-
-            if datanodes < node_counts['cdh-dn']:
-                print "You cannot shrink the cluster using this CLI, existing number of datanodes is: %s" % node_counts['cdh-dn']
-                sys.exit(1)
-            elif datanodes > node_counts['cdh-dn']:
-                print "Increasing the number of datanodes from %s to %s" % (node_counts['cdh-dn'], datanodes)
-            if kafkanodes < node_counts['kafka']:
-                print "You cannot shrink the cluster using this CLI, existing number of kafkanodes is: %s" % node_counts['kafka']
-                sys.exit(1)
-            elif  kafkanodes > node_counts['kafka']:
-                print "Increasing the number of kafkanodes from %s to %s" % (node_counts['kafka'], kafkanodes)
-
-            template_data = generate_template_file('cloud-formation/%s/cf-tmpl.json' % flavour,
-                                                   datanodes, node_counts['opentsdb'], kafkanodes, node_counts['zk'])
-            expand(template_data, pnda_cluster, flavour, node_counts['cdh-dn'], node_counts['kafka'], keyname)
+            new_profiles = load_profiles(flavour, args.profiles) if args.profiles is not None else None
+            settings = expand_settings(pnda_cluster, flavour, keyname, datanodes, kafkanodes, new_profiles)
+            run_journaled(pnda_cluster, 'expand', settings, args)
             sys.exit(0)
         else:
             print 'expand command must specify pnda_cluster, e.g.\npnda-cli.py expand -e squirrel-land -f standard -s keyname -n 5'
             sys.exit(1)
 
+    plan = sizing.workload_plan(flavour, args, validate_size)
+    if plan is not None:
+        if [datanodes, tsdbnodes, kafkanodes, zknodes] != [None, None, None, None]:
+            print 'Give either node counts or workload figures to size the cluster from, not both'
+            sys.exit(1)
+        sizing.show_plan(plan, False)
+        datanodes = plan['node_counts']['datanodes']
+        tsdbnodes = plan['node_counts']['opentsdb-nodes']
+        kafkanodes = plan['node_counts']['kafka-nodes']
+        zknodes = plan['node_counts']['zk-nodes']
+
     while datanodes is None:
         datanodes = raw_input("Enter how many Hadoop data nodes (%s): " % get_validation("datanodes"))
         try:
@@ -626,12 +750,12 @@ def main():
     node_limit("kafka-nodes", kafkanodes)
     node_limit("zk-nodes", zknodes)
 
-    template_data = generate_template_file('cloud-formation/%s/cf-tmpl.json' % flavour, datanodes, tsdbnodes, kafkanodes, zknodes)
-    console_dns = create(template_data, pnda_cluster, flavour, keyname, no_config_check)
-    CONSOLE.info('Use the PNDA console to get started: http://%s', console_dns)
-    CONSOLE.info(' Access hints:')
-    CONSOLE.info('  - Set up a socks proxy with: ./socks_proxy')
-    CONSOLE.info('  - ssh to a node with: ssh -F ssh_config <private_ip>')
+    settings = {'flavour': flavour, 'keyname': keyname, 'no_config_check': no_config_check,
+                'datanodes': datanodes, 'opentsdb_nodes': tsdbnodes,
+                'kafka_nodes': kafkanodes, 'zk_nodes': zknodes,
+                'profiles': instance_profiles.merge(sizing.to_profiles(plan) if plan is not None else None,
+                                                    load_profiles(flavour, args.profiles) if args.profiles is not None else None)}
+    run_journaled(pnda_cluster, 'create', settings, args)
 
 if __name__ == "__main__":
     try:
@@ -0,0 +1,157 @@
+#   Copyright (c) 2016 Cisco and/or its affiliates.
+#   This software is licensed to you under the terms of the Apache License, Version 2.0
+#   (the "License").
+#   You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   Unless required by applicable law or agreed to separately in writing, software distributed
+#   under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+#   ANY KIND, either express or implied.
+#
+#   Purpose: Run configuration checks concurrently, each within a deadline, and remember the ones that passed
+
+import os
+import json
+import time
+import hashlib
+import threading
+import traceback
+
+OK = 'OK'
+WARN = 'WARN'
+ERROR = 'ERROR'
+TIMEOUT = 'TIMEOUT'
+LABEL_WIDTH = 17
+
+
+class CheckFailed(Exception):
+    pass
+
+
+class CheckWarning(Exception):
+    pass
+
+
+def cache_key(paths, values):
+    """ sha256 over the contents of paths, missing files included, and a list of values """
+    sha = hashlib.sha256()
+    for path in paths:
+        sha.update(path.encode('utf-8'))
+        if os.path.isfile(path):
+            with open(path, 'rb') as input_file:
+                sha.update(input_file.read())
+    for value in values:
+        sha.update(('\0%s' % value).encode('utf-8'))
+    return sha.hexdigest()
+
+
+class _Check(object):
+    def __init__(self, label, target, args, deadline):
+        self.label = label
+        self.target = target
+        self.args = args
+        self.deadline = deadline
+        self.status = None
+        self.detail = None
+        self.trace = None
+        self.duration = None
+        self.cached = False
+        self.lock = threading.Lock()
+
+    def run(self):
+        start = time.time()
+        status, detail, trace = OK, None, None
+        try:
+            self.target(*self.args)
+        except CheckWarning as warning:
+            status, detail = WARN, str(warning)
+        except CheckFailed as failure:
+            status, detail = ERROR, str(failure)
+        except Exception as error:
+            status, detail, trace = ERROR, str(error), traceback.format_exc()
+        with self.lock:
+            # a check that outlived its deadline keeps its TIMEOUT
+            if self.status is None:
+                self.status, self.detail, self.trace = status, detail, trace
+                self.duration = time.time() - start
+
+
+class Preflight(object):
+    """
+    Checks are functions that return if all is well, raise CheckWarning for a problem
+    worth reporting that does not stop provisioning and raise anything else to fail.
+    They all run at once, each in its own thread, and one still running at its deadline
+    is reported as TIMEOUT and left behind.
+
+    Checks that pass are recorded in cache_path under key, normally a cache_key() of
+    the config files, and are skipped for ttl seconds while the key stays the same.
+    """
+    def __init__(self, logger, cache_path=None, key=None, ttl=0):
+        self.logger = logger
+        self.cache_path = cache_path
+        self.key = key
+        self.ttl = ttl
+        self.checks = []
+
+    def add(self, label, target, args=None, deadline=30):
+        self.checks.append(_Check(label, target, args or [], deadline))
+
+    def _load_cache(self):
+        if self.cache_path is None or self.ttl <= 0:
+            return {}
+        try:
+            with open(self.cache_path, 'r') as cache_file:
+                entry = json.load(cache_file)
+        except (IOError, ValueError):
+            return {}
+        if entry.get('key') != self.key:
+            return {}
+        return dict([(label, passed) for label, passed in entry['passed'].items() if time.time() - passed <= self.ttl])
+
+    def _save_cache(self, passed):
+        if self.cache_path is None or self.ttl <= 0:
+            return
+        if not os.path.isdir(os.path.dirname(self.cache_path)):
+            os.makedirs(os.path.dirname(self.cache_path))
+        tmp_path = '%s.tmp' % self.cache_path
+        with open(tmp_path, 'w') as cache_file:
+            json.dump({'key': self.key, 'passed': passed}, cache_file)
+        os.rename(tmp_path, self.cache_path)
+
+    def run(self):
+        """ Runs the checks, logs a line for each and returns True if none failed or timed out """
+        passed = self._load_cache()
+        threads = []
+        for check in self.checks:
+            if check.label in passed:
+                check.status = OK
+                check.cached = True
+                continue
+            thread = threading.Thread(target=check.run, name='preflight-%s' % check.label)
+            thread.daemon = True
+            thread.start()
+            threads.append((time.time(), check, thread))
+
+        for started, check, thread in threads:
+            thread.join(max(0, started + check.deadline - time.time()))
+            with check.lock:
+                if check.status is None:
+                    check.status = TIMEOUT
+                    check.detail = 'no answer within %ss' % check.deadline
+
+        ok = True
+        for check in self.checks:
+            self.logger.info('%s %s%s', check.label.ljust(LABEL_WIDTH, '.'), check.status,
+                             ' (cached)' if check.cached else '')
+            if check.status == OK:
+                passed.setdefault(check.label, time.time())
+            elif check.status == WARN:
+                self.logger.warning('%s', check.detail)
+            else:
+                ok = False
+                self.logger.error('%s', check.detail)
+                if check.trace is not None:
+                    self.logger.debug('%s', check.trace)
+            if check.duration is not None:
+                self.logger.debug('Check %s took %.2fs', check.label, check.duration)
+
+        self._save_cache(passed)
+        return ok
@@ -0,0 +1,128 @@
+#   Copyright (c) 2016 Cisco and/or its affiliates.
+#   This software is licensed to you under the terms of the Apache License, Version 2.0
+#   (the "License").
+#   You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   Unless required by applicable law or agreed to separately in writing, software distributed
+#   under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+#   ANY KIND, either express or implied.
+#
+#   Purpose: Wait for salt minions and run highstate and orchestrate from the saltmaster
+
+import json
+import time
+
+import tracer
+from hosts import CONSOLE, TRACER, ssh
+
+# Existing node types that need a highstate when nodes of the key type are added by expand
+EXPAND_RECONFIGURE = {
+    'cdh-dn': ['cdh-cm'],
+    'kafka': ['tools']
+}
+
+
+def salt_json(cmd, saltmaster, timeout=None):
+    output = []
+    ssh(['%s --out=json || true' % cmd], saltmaster, output, timeout)
+    try:
+        return json.loads('\n'.join(output))
+    except ValueError:
+        return {}
+
+
+def wait_for_minions(saltmaster, expected_minions, timeout):
+    """
+    Polls the saltmaster until every expected minion has an accepted key and answers
+    test.ping, accepting any expected keys still pending. Gives up after timeout seconds
+    and names the minions that never answered.
+    """
+    CONSOLE.info('Waiting for %s salt minions to respond', len(expected_minions))
+    expected = set(expected_minions)
+    deadline = time.time() + timeout
+    interval = 2
+    while True:
+        keys = salt_json('sudo salt-key -L', saltmaster)
+        pending = expected.intersection(keys.get('minions_pre', []))
+        for minion in pending:
+            ssh(['sudo salt-key -y -a %s' % minion], saltmaster)
+
+        accepted = expected.intersection(keys.get('minions', []))
+        responding = set()
+        if accepted:
+            pings = salt_json('sudo salt -t 5 --static -L %s test.ping' % ','.join(sorted(accepted)), saltmaster)
+            responding = set([minion for minion in accepted if pings.get(minion) is True])
+
+        CONSOLE.info('Salt minions: %s of %s responding', len(responding), len(expected))
+        if responding == expected:
+            return
+
+        if time.time() > deadline:
+            stragglers = sorted(expected - responding)
+            CONSOLE.error('Salt minions not ready after %s seconds: %s', timeout, ', '.join(stragglers))
+            raise Exception('Salt minions not ready: %s' % ', '.join(stragglers))
+
+        time.sleep(interval)
+        interval = min(interval * 2, 15)
+
+
+def expand_highstate_targets(instance_map, new_instances):
+    """ The new minions plus any existing minions whose configuration depends on them """
+    targets = set([instance['name'] for instance in new_instances])
+    reconfigure_types = set()
+    for instance in new_instances:
+        reconfigure_types.update(EXPAND_RECONFIGURE.get(instance['node_type'], []))
+    for name, instance in instance_map.iteritems():
+        if instance['node_type'] in reconfigure_types:
+            targets.add(name)
+    return sorted(targets)
+
+
+def run_highstate(saltmaster, minions, batch_size):
+    """
+    Runs highstate on the named minions, or on every minion when minions is None.
+    With a batch_size, the named minions are taken batch_size at a time and progress
+    is reported after each batch, while every minion, the saltmaster's own included,
+    is handed to salt's --batch-size.
+    """
+    if minions is not None and not minions:
+        CONSOLE.info('No minions need a highstate')
+        return
+
+    if minions is None:
+        batches = [None]
+    else:
+        batch_size = batch_size or len(minions)
+        batches = [minions[idx:idx + batch_size] for idx in range(0, len(minions), batch_size)]
+
+    for batch_idx, batch in enumerate(batches):
+        if batch is None:
+            target = '"*"'
+            if batch_size:
+                target += ' --batch-size %s' % batch_size
+        else:
+            target = '-L "%s"' % ','.join(batch)
+            CONSOLE.info('Highstate batch %s of %s: %s', batch_idx + 1, len(batches), ', '.join(batch))
+        start = time.time()
+        ssh(['sudo salt -v --log-level=debug --state-output=mixed %s state.highstate' % target], saltmaster)
+        if len(batches) > 1:
+            CONSOLE.info('Highstate batch %s of %s finished in %ss', batch_idx + 1, len(batches), int(time.time() - start))
+
+
+def run_salt(saltmaster, cluster, orchestrate, minions, batch_size, journal):
+    if journal.phase_done('highstate'):
+        CONSOLE.info('Highstate was already run, resuming')
+    else:
+        with TRACER.span('highstate', tracer.PHASE):
+            run_highstate(saltmaster, minions, batch_size)
+        journal.mark_phase('highstate')
+
+    if journal.phase_done('orchestrate'):
+        CONSOLE.info('Orchestrate was already run, resuming')
+    else:
+        with TRACER.span('orchestrate', tracer.PHASE):
+            ssh(['sudo CLUSTER=%s salt-run --log-level=debug state.orchestrate %s' % (cluster, orchestrate)], saltmaster)
+        journal.mark_phase('orchestrate')
+
+    with TRACER.span('hostsfile', tracer.PHASE):
+        ssh(['sudo salt "*-bastion" state.sls hostsfile'], saltmaster)
+    journal.mark_phase('complete')
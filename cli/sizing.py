@@ -0,0 +1,159 @@
+#   Copyright (c) 2016 Cisco and/or its affiliates.
+#   This software is licensed to you under the terms of the Apache License, Version 2.0
+#   (the "License").
+#   You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   Unless required by applicable law or agreed to separately in writing, software distributed
+#   under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+#   ANY KIND, either express or implied.
+#
+#   Purpose: Work out node counts, instance types and volume sizes from the workload a cluster has to carry
+
+from __future__ import print_function
+
+import json
+import math
+
+CAPACITY_FILE = 'capacity.json'
+# data volumes are sized in steps of this many GB
+VOLUME_STEP_GB = 64
+# the most nodes of one role ever considered when looking for a count validation allows
+MAX_NODES = 1000
+
+KAFKA = 'instanceKafka'
+DATANODE = 'instanceCdhDn'
+OPENTSDB = 'instanceOpenTsdb'
+ZOOKEEPER = 'instanceZookeeper'
+
+
+def load_capacity(path):
+    with open(path, 'r') as capacity_file:
+        return json.load(capacity_file)
+
+
+def _nodes(amount, per_node):
+    return int(math.ceil(float(amount) / per_node)) if amount > 0 else 0
+
+
+def _volume_gb(stored_gb, count, role, utilisation):
+    steps = int(math.ceil(stored_gb / count / utilisation / VOLUME_STEP_GB))
+    return max(role['min_volume_gb'], steps * VOLUME_STEP_GB)
+
+
+def _allowed(count_name, count, validate):
+    """ The smallest node count of at least count that validate allows, or None """
+    for candidate in range(max(count, 1), MAX_NODES + 1):
+        if validate(count_name, candidate):
+            return candidate
+    return None
+
+
+def _choose(capacity, resource_name, count_name, needs_for, validate):
+    """
+    Tries the instance types listed for a role, smallest first, and returns the first
+    one for which the nodes needed are allowed by validate. needs_for(spec, role) returns
+    how many nodes of an instance type are needed for each resource it could run out of.
+    """
+    role = capacity['roles'][resource_name]
+    for instance_type in role['instance_types']:
+        needs = needs_for(capacity['instance_types'][instance_type], role)
+        limited_by = max(sorted(needs), key=needs.get)
+        count = _allowed(count_name, needs[limited_by], validate)
+        if count is not None:
+            return {'role': role['role'], 'count_name': count_name, 'count': count,
+                    'instance_type': instance_type, 'limited_by': limited_by}
+    raise Exception('%s needs %s %s nodes to have enough %s, more than validation.json allows for %s'
+                    % (role['role'], needs[limited_by], role['instance_types'][-1], limited_by, count_name))
+
+
+def plan_cluster(capacity, kafka_mb_per_sec, retention_days, hdfs_replication, opentsdb_points_per_sec, validate):
+    """
+    Sizes a cluster taking kafka_mb_per_sec, keeping what lands in HDFS, and what
+    opentsdb_points_per_sec writes to HBase, for retention_days. capacity is the flavour's
+    capacity.json and validate(count_name, count) says whether a node count is allowed.
+
+    Returns {'node_counts': {count name: count}, 'roles': {resource name: sizing}}, where
+    each sizing gives the count, instance_type, volume_gb of the data volume (None to
+    keep the template's) and which resource limited_by the count.
+    """
+    utilisation = capacity['target_utilisation']
+    if hdfs_replication < 1:
+        raise Exception('HDFS replication must be at least 1, %s found' % hdfs_replication)
+    plan = {}
+
+    kafka_role = capacity['roles'][KAFKA]
+    kafka_write = kafka_mb_per_sec * kafka_role['replication']
+    kafka_read = kafka_mb_per_sec * (kafka_role['replication'] - 1 + kafka_role['consumer_groups'])
+    kafka_stored_gb = kafka_write * 3600 * kafka_role['retention_hours'] / 1024.0
+    def kafka_needs(spec, role):
+        return {'disk throughput': _nodes(kafka_write, spec['ebs_mb_per_sec'] * utilisation),
+                'network': _nodes(max(kafka_write, kafka_read), spec['network_mb_per_sec'] * utilisation),
+                'storage': _nodes(kafka_stored_gb, role['max_volume_gb'] * utilisation),
+                'replication': role['replication']}
+    plan[KAFKA] = _choose(capacity, KAFKA, 'kafka-nodes', kafka_needs, validate)
+    plan[KAFKA]['volume_gb'] = _volume_gb(kafka_stored_gb, plan[KAFKA]['count'], kafka_role, utilisation)
+
+    opentsdb_mb_per_sec = opentsdb_points_per_sec * capacity['roles'][OPENTSDB]['bytes_per_point'] / 1048576.0
+    hdfs_write = (kafka_mb_per_sec + opentsdb_mb_per_sec) * hdfs_replication
+    hdfs_stored_gb = hdfs_write * 86400 * retention_days / 1024.0
+    def datanode_needs(spec, role):
+        return {'disk throughput': _nodes(hdfs_write, spec['ebs_mb_per_sec'] * utilisation),
+                'network': _nodes(hdfs_write, spec['network_mb_per_sec'] * utilisation),
+                'storage': _nodes(hdfs_stored_gb, role['max_volume_gb'] * utilisation),
+                'replication': hdfs_replication}
+    plan[DATANODE] = _choose(capacity, DATANODE, 'datanodes', datanode_needs, validate)
+    plan[DATANODE]['volume_gb'] = _volume_gb(hdfs_stored_gb, plan[DATANODE]['count'], capacity['roles'][DATANODE],
+                                             utilisation)
+
+    def opentsdb_needs(spec, _role):
+        return {'write rate': _nodes(opentsdb_points_per_sec, spec['tsdb_points_per_sec'] * utilisation),
+                'minimum': 1}
+    plan[OPENTSDB] = _choose(capacity, OPENTSDB, 'opentsdb-nodes', opentsdb_needs, validate)
+    plan[OPENTSDB]['volume_gb'] = None
+
+    # a quorum that survives losing one node once there is more than one broker or datanode
+    quorum = 3 if plan[KAFKA]['count'] > 1 or plan[DATANODE]['count'] > 1 else 1
+    zookeepers = _allowed('zk-nodes', quorum, validate)
+    if zookeepers is None:
+        raise Exception('%s zookeeper nodes are needed, more than validation.json allows for zk-nodes' % quorum)
+    plan[ZOOKEEPER] = {'role': capacity['roles'][ZOOKEEPER]['role'], 'count_name': 'zk-nodes', 'count': zookeepers,
+                       'instance_type': None, 'volume_gb': None, 'limited_by': 'quorum'}
+
+    return {'node_counts': dict([(sizing['count_name'], sizing['count']) for sizing in plan.values()]),
+            'roles': plan}
+
+
+def to_profiles(plan):
+    """ The instance profiles, see instance_profiles, that give each role the instance type and volume it was planned with """
+    profiles = {}
+    for sizing in plan['roles'].values():
+        profile = {}
+        if sizing['instance_type'] is not None:
+            profile['instance_type'] = sizing['instance_type']
+        if sizing['volume_gb'] is not None:
+            profile['volumes'] = {'count': 1, 'size_gb': sizing['volume_gb']}
+        if profile:
+            profiles[sizing['role']] = profile
+    return profiles
+
+
+def workload_plan(flavour, args, validate):
+    """ Sizes a cluster from the workload figures in args with the flavour's capacity table, None if none are given """
+    figures = [args.kafka_mb_per_sec, args.retention_days, args.opentsdb_points_per_sec]
+    if figures == [None, None, None]:
+        return None
+    if args.kafka_mb_per_sec is None or args.retention_days is None:
+        raise Exception('Sizing a cluster needs at least --kafka-mb-per-sec and --retention-days')
+    capacity = load_capacity('cloud-formation/%s/%s' % (flavour, CAPACITY_FILE))
+    return plan_cluster(capacity, args.kafka_mb_per_sec, args.retention_days, args.hdfs_replication,
+                        args.opentsdb_points_per_sec or 0, validate)
+
+
+def show_plan(plan, as_json):
+    if as_json:
+        print(json.dumps(plan, indent=2, sort_keys=True))
+        return
+    print('%-10s %6s  %-14s %12s  %s' % ('role', 'nodes', 'instance type', 'data volume', 'limited by'))
+    for _, role in sorted(plan['roles'].items()):
+        print('%-10s %6s  %-14s %12s  %s' % (role['role'], role['count'], role['instance_type'] or 'default',
+                                             '-' if role['volume_gb'] is None else '%s GB' % role['volume_gb'],
+                                             role['limited_by']))
@@ -0,0 +1,102 @@
+#   Copyright (c) 2016 Cisco and/or its affiliates.
+#   This software is licensed to you under the terms of the Apache License, Version 2.0
+#   (the "License").
+#   You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   Unless required by applicable law or agreed to separately in writing, software distributed
+#   under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+#   ANY KIND, either express or implied.
+#
+#   Purpose: Follow a cloud formation stack operation by streaming its events
+
+import time
+
+STACK_RESOURCE_TYPE = 'AWS::CloudFormation::Stack'
+
+
+class StackWaiter(object):
+    """
+    Follows one create, update or delete operation on a stack.
+
+    Only events newer than the last one seen are fetched on each poll. The poll
+    interval starts at min_interval, grows while nothing is happening and drops
+    back as soon as new events arrive. The wait ends on the stack's own terminal
+    event, or straight away when any resource reports a *_FAILED status.
+    """
+    def __init__(self, conn, stack, logger, min_interval=2.0, max_interval=30.0):
+        self.conn = conn
+        self.stack = stack
+        self.logger = logger
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.failure = None
+        self.completed = set()
+        self._last_event_id = self._newest_event_id()
+
+    def _newest_event_id(self):
+        try:
+            events = self.conn.describe_stack_events(self.stack)
+        except:
+            return None
+        if len(events) > 0:
+            return events[0].event_id
+        return None
+
+    def _new_events(self):
+        new_events = []
+        next_token = None
+        while True:
+            events = self.conn.describe_stack_events(self.stack, next_token)
+            for event in events:
+                if event.event_id == self._last_event_id:
+                    next_token = None
+                    break
+                new_events.append(event)
+            else:
+                next_token = getattr(events, 'next_token', None)
+            if next_token is None:
+                break
+        if len(new_events) > 0:
+            self._last_event_id = new_events[0].event_id
+        new_events.reverse()
+        return new_events
+
+    def _describe(self, event):
+        message = '%s (%s): %s' % (event.logical_resource_id, event.resource_type, event.resource_status)
+        if event.resource_status_reason:
+            message = '%s - %s' % (message, event.resource_status_reason)
+        return message
+
+    def wait(self, on_event=None):
+        """
+        Blocks until the operation finishes and returns the final stack status. On failure
+        self.failure holds the event that caused it.
+        """
+        interval = self.min_interval
+        while True:
+            time.sleep(interval)
+            events = self._new_events()
+            if len(events) == 0:
+                interval = min(self.max_interval, interval * 1.5)
+                continue
+            interval = self.min_interval
+
+            for event in events:
+                status = event.resource_status
+                is_stack = event.resource_type == STACK_RESOURCE_TYPE and event.physical_resource_id == event.stack_id
+                if status.endswith('_COMPLETE') and not is_stack:
+                    self.completed.add(event.logical_resource_id)
+                self.logger.info('[%s resources done] %s', len(self.completed), self._describe(event))
+                if on_event is not None:
+                    on_event(event)
+
+                if status.endswith('_FAILED') or (is_stack and 'ROLLBACK' in status):
+                    if self.failure is None:
+                        self.failure = event
+                    return status
+                if is_stack and status.endswith('_COMPLETE'):
+                    return status
+
+    def failure_reason(self):
+        if self.failure is None:
+            return None
+        return self._describe(self.failure)
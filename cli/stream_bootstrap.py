@@ -0,0 +1,89 @@
+#   Copyright (c) 2016 Cisco and/or its affiliates.
+#   This software is licensed to you under the terms of the Apache License, Version 2.0
+#   (the "License").
+#   You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   Unless required by applicable law or agreed to separately in writing, software distributed
+#   under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+#   ANY KIND, either express or implied.
+#
+#   Purpose: Bootstrap instances as they come up, while the rest of their stack is still being built
+
+import os
+import threading
+
+from task_graph import TaskGraph
+from instance_feed import InstanceFeed
+from hosts import CONSOLE, cluster_env, in_context, get_instance_map, write_ssh_config
+from bootstrap import BOOT_TIMEOUT, wait_for_ssh, publish_bundle, publish_artifacts, bootstrap_graph, run_graph
+
+# Resources the nodes need, to reach the internet and each other, before they can be bootstrapped
+# while the rest of the stack is still being created
+PREREQUISITES = ['NAT', 'PrivateRoute', 'PrivateSubnetRouteTableAssociation', 'PublicRoute',
+                 'egressAll', 'ingressInternal', 'ingressInternalSaltMaster', 'ingressSsh1', 'ingressSsh2']
+
+
+def start(cluster, flavour, keyfile, journal, options, prerequisites, select, with_saltmaster):
+    """
+    Starts bootstrapping instances while their stack is still being created or updated.
+    Instances for which select is true are bootstrapped as soon as they are running, once
+    the resources in prerequisites are complete and the bastion and saltmaster exist.
+    Returns the stream, whose feed's on_event is for StackWaiter.wait(), to pass to
+    finish() once the stack is complete or stop() if not.
+    """
+    stream = {'graph': TaskGraph(), 'all_added': threading.Event(), 'cancelled': threading.Event(),
+              'saltmaster': None, 'error': None}
+
+    def on_ready(instances):
+        first = stream['saltmaster'] is None
+        if first:
+            write_ssh_config(cluster, instances[cluster+'-bastion']['ip_address'], cluster_env('OS_USER'),
+                             os.path.abspath(keyfile))
+            saltmaster = instances[cluster+'-saltmaster']['private_ip_address']
+            stream['bootstrap_bundle'] = None
+            stream['artifacts_env'] = None
+            if options.distribution == 'relay' or options.artifact_cache or options.offline:
+                wait_for_ssh(saltmaster, BOOT_TIMEOUT, stream['cancelled'])
+            if options.distribution == 'relay':
+                stream['bootstrap_bundle'] = publish_bundle(flavour, saltmaster)
+            if options.artifact_cache or options.offline:
+                stream['artifacts_env'] = publish_artifacts(saltmaster, options.offline)
+            stream['saltmaster'] = saltmaster
+        selected = sorted([instance for instance in instances.values() if select(instance)], key=lambda instance: instance['name'])
+        if selected:
+            CONSOLE.info('Bootstrapping %s more instances: %s', len(selected), ', '.join([instance['name'] for instance in selected]))
+        bootstrap_graph(selected, stream['saltmaster'], cluster, flavour, journal, stream['bootstrap_bundle'],
+                        stream['artifacts_env'], with_saltmaster=with_saltmaster and first, graph=stream['graph'],
+                        wait_for_boot=stream['cancelled'])
+
+    def run():
+        try:
+            run_graph(stream['graph'], options.parallel, options.keep_going, stream['all_added'])
+        except Exception as exception:
+            stream['error'] = exception
+
+    stream['feed'] = InstanceFeed(lambda: get_instance_map(cluster, refresh=True), in_context(on_ready), prerequisites,
+                                  [cluster+'-bastion', cluster+'-saltmaster'], CONSOLE)
+    stream['runner'] = threading.Thread(target=in_context(run))
+    stream['runner'].daemon = True
+    stream['runner'].start()
+    stream['feed'].start()
+    return stream
+
+
+def finish(stream):
+    """ Bootstraps any instances not yet started and waits for every bootstrap to finish """
+    try:
+        stream['feed'].finish()
+    finally:
+        stream['all_added'].set()
+        stream['runner'].join()
+    if stream['error'] is not None:
+        raise stream['error']
+
+
+def stop(stream):
+    """ Starts no more bootstraps and waits for those running to end """
+    stream['cancelled'].set()
+    stream['feed'].stop()
+    stream['all_added'].set()
+    stream['runner'].join()
@@ -1,31 +1,200 @@
-import subprocess
+import os
+import time
+import fcntl
+import errno
 import select
+import threading
+import traceback
+import subprocess
 from logging import INFO
 
+READ_SIZE = 65536
+# seconds to wait for the rest of the output once a child has exited, before giving up on
+# pipes that something it started, such as an ssh ControlMaster, still holds open
+EXIT_GRACE = 0.5
+
+
+def _wait_readable(filenos, timeout):
+    """ The descriptors among filenos that can be read from, or have been closed """
+    # select() cannot watch descriptors numbered past FD_SETSIZE, which a busy CLI reaches
+    if hasattr(select, 'poll'):
+        poller = select.poll()
+        for fileno in filenos:
+            poller.register(fileno, select.POLLIN | select.POLLPRI)
+        return [fileno for fileno, _ in poller.poll(timeout * 1000)]
+    return select.select(filenos, [], [], timeout)[0]
+
+
+class _Watch(object):
+    """ Output of one child process, as seen by the pump """
+    def __init__(self, child_process, logger, log_id, log_levels, scan_for_errors, output=None):
+        self.child_process = child_process
+        self.logger = logger
+        self.log_id = log_id
+        self.log_levels = log_levels
+        self.scan_for_errors = scan_for_errors
+        self.output = output
+        self.open_streams = len(log_levels)
+        self.output_bytes = 0
+        self.error = None
+        self.done = threading.Event()
+
+    def emit(self, fileno, raw_line):
+        self.output_bytes += len(raw_line)
+        msg = raw_line.decode('utf-8', 'replace')
+        if self.log_id is not None:
+            msg_with_id = '%s %s' % (self.log_id, msg)
+        else:
+            msg_with_id = msg
+        self.logger.log(self.log_levels[fileno], msg_with_id)
+        if self.output is not None and fileno == self.child_process.stdout.fileno():
+            self.output.append(msg)
+        if msg in self.scan_for_errors and self.error is None:
+            self.error = msg_with_id
+
+
+class OutputPump(object):
+    """
+    Logs the stdout and stderr of any number of child processes from a single thread.
+
+    Streams are read in non-blocking chunks and split into lines here, so a partial
+    line never stalls the loop and one chatty child cannot hold up the others.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buffers = {}
+        self._watches = {}
+        self._thread = None
+        self._wake_read, self._wake_write = os.pipe()
+
+    def watch(self, child_process, logger, log_id, log_levels, scan_for_errors, output=None):
+        watch = _Watch(child_process, logger, log_id, log_levels, scan_for_errors, output)
+        with self._lock:
+            for fileno in log_levels:
+                flags = fcntl.fcntl(fileno, fcntl.F_GETFL)
+                fcntl.fcntl(fileno, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+                self._buffers[fileno] = b''
+                self._watches[fileno] = watch
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run)
+                self._thread.daemon = True
+                self._thread.start()
+        os.write(self._wake_write, b'x')
+        return watch
 
-def call(cmd_to_run, logger, log_id=None, stdout_log_level=INFO, stderr_log_level=INFO, scan_for_errors=None, **kwargs):
+    def _close(self, fileno):
+        watch = self._watches.pop(fileno)
+        remainder = self._buffers.pop(fileno)
+        if remainder:
+            watch.emit(fileno, remainder)
+        watch.open_streams -= 1
+        if watch.open_streams == 0:
+            watch.done.set()
+
+    def forget(self, watch):
+        """ Stops following a child whose pipes were inherited by something that outlived it """
+        with self._lock:
+            for fileno in [fileno for fileno in self._watches if self._watches[fileno] is watch]:
+                self._close(fileno)
+
+    def _fail(self, reason):
+        """ Ends every watch with reason as its error, once the loop can no longer follow them """
+        with self._lock:
+            watches = set(self._watches.values())
+            self._watches.clear()
+            self._buffers.clear()
+            self._thread = None
+        for watch in watches:
+            watch.error = 'Lost the output of %s: %s' % (watch.log_id or watch.child_process.pid, reason)
+            watch.done.set()
+
+    def _read(self, fileno):
+        with self._lock:
+            # the descriptor may have been closed, or even reused, since poll returned
+            if fileno not in self._watches:
+                return
+            try:
+                data = os.read(fileno, READ_SIZE)
+            except OSError as error:
+                if error.errno in (errno.EAGAIN, errno.EINTR):
+                    return
+                data = b''
+            if not data:
+                self._close(fileno)
+                return
+            watch = self._watches[fileno]
+            lines = (self._buffers[fileno] + data).split(b'\n')
+            self._buffers[fileno] = lines.pop()
+
+        for line in lines:
+            watch.emit(fileno, line)
+
+    def _run(self):
+        try:
+            while True:
+                with self._lock:
+                    filenos = list(self._watches)
+                try:
+                    readable = _wait_readable(filenos + [self._wake_read], 1.0)
+                except (select.error, OSError) as error:
+                    if error.args[0] == errno.EINTR:
+                        continue
+                    raise
+                for fileno in readable:
+                    if fileno == self._wake_read:
+                        os.read(self._wake_read, READ_SIZE)
+                    else:
+                        self._read(fileno)
+        except Exception:
+            self._fail(traceback.format_exc().splitlines()[-1])
+
+
+PUMP = OutputPump()
+
+
+def call(cmd_to_run, logger, log_id=None, stdout_log_level=INFO, stderr_log_level=INFO, scan_for_errors=None, timeout=None,
+         output=None, stats=None, **kwargs):
+    """
+    Runs cmd_to_run, logging its output line by line, and returns its exit code. Lines
+    written to stdout are also appended to output when a list is passed, and when stats
+    is a dict the exit code and bytes of output are stored in it.
+    """
     if scan_for_errors is None:
         scan_for_errors = []
 
     child_process = subprocess.Popen(cmd_to_run, stdout=subprocess.PIPE, stderr=subprocess.PIPE, **kwargs)
 
-    log_level = {child_process.stdout: stdout_log_level, child_process.stderr: stderr_log_level}
-
-    def fetch_child_output():
-        child_output_streams = select.select([child_process.stdout, child_process.stderr], [], [], 1000)[0]
-        for child_output_stream in child_output_streams:
-            line = child_output_stream.readline()
-            msg = line[:-1]
-            msg = msg.decode('utf-8')
-            if log_id is not None:
-                msg_with_id = '%s %s' % (log_id, msg)
-            logger.log(log_level[child_output_stream], msg_with_id)
-            if msg in scan_for_errors:
-                raise Exception(msg_with_id)
+    log_level = {child_process.stdout.fileno(): stdout_log_level, child_process.stderr.fileno(): stderr_log_level}
+    watch = PUMP.watch(child_process, logger, log_id, log_level, scan_for_errors, output)
 
-    while child_process.poll() is None:
-        fetch_child_output()
+    deadline = None if timeout is None else time.time() + timeout
+    timed_out = False
+    while not watch.done.is_set():
+        if watch.error is not None:
+            break
+        if deadline is not None and time.time() > deadline:
+            timed_out = True
+            break
+        if child_process.poll() is not None:
+            watch.done.wait(EXIT_GRACE)
+            break
+        watch.done.wait(0.1)
 
-    fetch_child_output()
+    if watch.error is not None or not watch.done.is_set():
+        if child_process.poll() is None:
+            child_process.kill()
+            watch.done.wait(5)
+        if not watch.done.is_set():
+            PUMP.forget(watch)
 
-    return child_process.wait()
+    ret_val = child_process.wait()
+    child_process.stdout.close()
+    child_process.stderr.close()
+    if stats is not None:
+        stats['exit_code'] = ret_val
+        stats['output_bytes'] = watch.output_bytes
+    if timed_out:
+        raise Exception('%s timed out after %s seconds' % (log_id or cmd_to_run[0], timeout))
+    if watch.error is not None:
+        raise Exception(watch.error)
+    return ret_val
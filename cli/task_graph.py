@@ -0,0 +1,128 @@
+#   Copyright (c) 2016 Cisco and/or its affiliates.
+#   This software is licensed to you under the terms of the Apache License, Version 2.0
+#   (the "License").
+#   You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   Unless required by applicable law or agreed to separately in writing, software distributed
+#   under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+#   ANY KIND, either express or implied.
+#
+#   Purpose: Run a set of dependent tasks on a worker pool, each as soon as its dependencies are done
+
+import threading
+
+from worker_pool import SUCCEEDED, FAILED
+
+SKIPPED = 'SKIPPED'
+
+
+class _Task(object):
+    def __init__(self, name, target, args, depends_on):
+        self.name = name
+        self.target = target
+        self.args = args
+        self.depends_on = depends_on
+        self.dependents = []
+        self.waiting_on = set(depends_on)
+        self.state = None
+
+
+class TaskGraph(object):
+    """
+    Tasks are submitted to the pool once every task they depend on has succeeded.
+    Tasks downstream of a failure are never started and end up SKIPPED. Tasks can be
+    added while the graph runs, and start straight away if their dependencies are done.
+    """
+    def __init__(self):
+        self.tasks = {}
+        self._order = []
+        self._lock = threading.Lock()
+        self._pool = None
+
+    def add(self, name, target, args=None, depends_on=None):
+        task = _Task(name, target, args or [], depends_on or [])
+        with self._lock:
+            if name in self.tasks:
+                raise Exception('Duplicate task %s' % name)
+            self.tasks[name] = task
+            self._order.append(name)
+            if self._pool is None:
+                return
+            for dependency in task.depends_on:
+                dependency_task = self.tasks[dependency]
+                if dependency_task.state == SUCCEEDED:
+                    task.waiting_on.discard(dependency)
+                elif dependency_task.state is not None:
+                    self._skip(task)
+                else:
+                    dependency_task.dependents.append(task)
+            ready = task.state is None and len(task.waiting_on) == 0
+        if ready:
+            self._submit(task)
+
+    def _submit(self, task):
+        future = self._pool.submit(task.name, self._execute, task)
+        if future.done() and future.state != SUCCEEDED:
+            self._finished(task, future.state)
+
+    def _execute(self, task):
+        try:
+            result = task.target(*task.args)
+        except:
+            self._finished(task, FAILED)
+            raise
+        self._finished(task, SUCCEEDED)
+        return result
+
+    def _finished(self, task, state):
+        ready = []
+        with self._lock:
+            task.state = state
+            for dependent in task.dependents:
+                dependent.waiting_on.discard(task.name)
+                if state != SUCCEEDED:
+                    self._skip(dependent)
+                elif len(dependent.waiting_on) == 0 and dependent.state is None:
+                    ready.append(dependent)
+        for dependent in ready:
+            self._submit(dependent)
+
+    def _skip(self, task):
+        if task.state is not None:
+            return
+        task.state = SKIPPED
+        for dependent in task.dependents:
+            self._skip(dependent)
+
+    def run(self, pool, all_added=None):
+        """
+        Runs every task on pool and blocks until nothing more can run. When tasks are
+        still being added, all_added is an Event set once the last one has been.
+        """
+        with self._lock:
+            self._pool = pool
+            for name in self._order:
+                for dependency in self.tasks[name].depends_on:
+                    self.tasks[dependency].dependents.append(self.tasks[name])
+            initial = [self.tasks[name] for name in self._order if len(self.tasks[name].depends_on) == 0]
+
+        for task in initial:
+            self._submit(task)
+
+        # dependents are submitted before the task that unblocked them completes, so once
+        # every known future is done and no new ones appeared the graph has settled
+        while True:
+            futures = list(pool.futures)
+            for future in futures:
+                future.wait()
+            if all_added is not None and not all_added.is_set():
+                all_added.wait(0.5)
+                continue
+            if len(pool.futures) == len(futures):
+                break
+
+        for name in self._order:
+            if self.tasks[name].state is None:
+                self.tasks[name].state = SKIPPED
+
+    def skipped(self):
+        return [name for name in self._order if self.tasks[name].state == SKIPPED]
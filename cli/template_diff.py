@@ -0,0 +1,97 @@
+#   Copyright (c) 2016 Cisco and/or its affiliates.
+#   This software is licensed to you under the terms of the Apache License, Version 2.0
+#   (the "License").
+#   You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   Unless required by applicable law or agreed to separately in writing, software distributed
+#   under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+#   ANY KIND, either express or implied.
+#
+#   Purpose: Work out what a stack update would change by comparing deployed and generated templates
+
+import json
+
+ADD = 'add'
+REMOVE = 'remove'
+MODIFY = 'modify'
+REPLACE = 'replace'
+
+# Properties that cloud formation can only change by replacing the resource
+REPLACEMENT_PROPERTIES = {
+    'AWS::EC2::Instance': ['AvailabilityZone', 'BlockDeviceMappings', 'ImageId', 'KeyName', 'LaunchTemplate',
+                           'NetworkInterfaces', 'PlacementGroupName', 'PrivateIpAddress', 'SecurityGroups', 'SubnetId',
+                           'Tenancy'],
+    'AWS::EC2::Volume': ['AvailabilityZone', 'Encrypted', 'KmsKeyId', 'SnapshotId'],
+    'AWS::EC2::SecurityGroup': ['GroupDescription', 'VpcId'],
+    'AWS::EC2::Subnet': ['AvailabilityZone', 'CidrBlock', 'VpcId'],
+    'AWS::EC2::VPC': ['CidrBlock', 'InstanceTenancy'],
+    'AWS::EC2::NatGateway': ['AllocationId', 'SubnetId']
+}
+
+# Properties that cloud formation changes by stopping and starting the instance, which loses instance storage
+INTERRUPTION_PROPERTIES = {
+    'AWS::EC2::Instance': ['EbsOptimized', 'InstanceType', 'UserData']
+}
+
+SECTIONS = ['Metadata', 'Parameters', 'Mappings', 'Conditions', 'Outputs']
+
+
+def _normalize(value):
+    """
+    Nested stack URLs are compared by object name only. The object names carry a hash
+    of the child template while the rest of the URL, e.g. an S3 signature, changes on
+    every upload.
+    """
+    if isinstance(value, dict):
+        normalized = {}
+        for key, item in value.items():
+            if key == 'TemplateURL' and item is not None:
+                item = item.split('?')[0].rstrip('/').split('/')[-1]
+            normalized[key] = _normalize(item)
+        return normalized
+    if isinstance(value, list):
+        return [_normalize(item) for item in value]
+    return value
+
+
+def _canonical(value):
+    return json.dumps(_normalize(value), sort_keys=True)
+
+
+def diff_templates(deployed, generated):
+    """
+    Returns a list of (action, logical id, resource type, changed properties) needed to
+    turn the deployed template into the generated one, sorted by logical id. Changes to
+    other template sections are reported with the section name as the logical id.
+    """
+    changes = []
+    deployed_resources = deployed.get('Resources', {})
+    generated_resources = generated.get('Resources', {})
+
+    for name in sorted(set(deployed_resources) | set(generated_resources)):
+        old = deployed_resources.get(name)
+        new = generated_resources.get(name)
+        if old is None:
+            changes.append((ADD, name, new.get('Type'), []))
+        elif new is None:
+            changes.append((REMOVE, name, old.get('Type'), []))
+        elif _canonical(old) != _canonical(new):
+            old_properties = old.get('Properties', {})
+            new_properties = new.get('Properties', {})
+            changed = sorted([key for key in set(old_properties) | set(new_properties)
+                              if _canonical(old_properties.get(key)) != _canonical(new_properties.get(key))])
+            replaced = set(changed).intersection(REPLACEMENT_PROPERTIES.get(new.get('Type'), []))
+            if old.get('Type') != new.get('Type'):
+                replaced.add('Type')
+            changes.append((REPLACE if replaced else MODIFY, name, new.get('Type'), changed))
+
+    for section in SECTIONS:
+        if _canonical(deployed.get(section, {})) != _canonical(generated.get(section, {})):
+            changes.append((MODIFY, section, 'template section', []))
+    return changes
+
+
+def destructive(changes):
+    """ The changes from diff_templates that remove, replace, or stop and start existing resources """
+    return [(action, name, resource_type, properties) for action, name, resource_type, properties in changes
+            if action in (REMOVE, REPLACE) or
+            set(properties).intersection(INTERRUPTION_PROPERTIES.get(resource_type, []))]
@@ -0,0 +1,229 @@
+#   Copyright (c) 2016 Cisco and/or its affiliates.
+#   This software is licensed to you under the terms of the Apache License, Version 2.0
+#   (the "License").
+#   You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   Unless required by applicable law or agreed to separately in writing, software distributed
+#   under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+#   ANY KIND, either express or implied.
+#
+#   Purpose: Expand the cloud formation template for a flavour into one resource per node
+
+import os
+import re
+import json
+import threading
+
+import instance_profiles
+
+PLACEHOLDER = '$node_idx$'
+INDEXED_ROLES_FILE = 'indexed-roles.json'
+# cloud formation limits on template size when passed inline and by url, and on resources per stack
+INLINE_BODY_LIMIT = 51200
+URL_BODY_LIMIT = 1000000
+RESOURCE_LIMIT = 500
+
+_CACHE = {}
+_CACHE_LOCK = threading.Lock()
+
+try:
+    STRING_TYPES = (basestring,)
+except NameError:
+    STRING_TYPES = (str,)
+
+
+def _compile(value):
+    """
+    Turns a json value into a function of the node index. Subtrees without a placeholder
+    compile to None and are shared, unchanged, between every copy.
+    """
+    if isinstance(value, dict):
+        variable = [(key, _compile(item)) for key, item in value.items()]
+        variable = [(key, stamp) for key, stamp in variable if stamp is not None]
+        if not variable:
+            return None
+        def stamp_dict(node_idx):
+            stamped = dict(value)
+            for key, stamp in variable:
+                stamped[key] = stamp(node_idx)
+            return stamped
+        return stamp_dict
+
+    if isinstance(value, list):
+        variable = [(idx, _compile(item)) for idx, item in enumerate(value)]
+        variable = [(idx, stamp) for idx, stamp in variable if stamp is not None]
+        if not variable:
+            return None
+        def stamp_list(node_idx):
+            stamped = list(value)
+            for idx, stamp in variable:
+                stamped[idx] = stamp(node_idx)
+            return stamped
+        return stamp_list
+
+    if isinstance(value, STRING_TYPES) and PLACEHOLDER in value:
+        parts = value.split(PLACEHOLDER)
+        return lambda node_idx: node_idx.join(parts)
+
+    return None
+
+
+def _unchanged(value):
+    return lambda node_idx: value
+
+
+class CompiledTemplate(object):
+    """
+    A flavour template parsed once, with each indexed role resource compiled so copies
+    for any number of nodes can be stamped out without re-parsing json.
+
+    Indexed roles are read from indexed-roles.json next to the template, which maps the
+    name of each resource to copy per node onto the node count that drives it, e.g.
+    {"instanceCdhDn": "datanodes"}.
+    """
+    def __init__(self, filepath):
+        with open(filepath, 'r') as template_file:
+            self.template = json.load(template_file)
+        with open(os.path.join(os.path.dirname(filepath), INDEXED_ROLES_FILE), 'r') as roles_file:
+            self.indexed_roles = json.load(roles_file)
+
+        self.base_resources = dict(self.template['Resources'])
+        self.role_resources = {}
+        self.stampers = {}
+        # the role of each instance, from its node_type tag, for applying instance profiles
+        self.roles = {}
+        for resource_name, resource in self.template['Resources'].items():
+            for tag in resource.get('Properties', {}).get('Tags', []):
+                if resource['Type'] == 'AWS::EC2::Instance' and tag['Key'] == 'node_type':
+                    self.roles[resource_name] = tag['Value']
+        for resource_name in self.indexed_roles:
+            resource = self.base_resources.pop(resource_name)
+            self.role_resources[resource_name] = resource
+            self.stampers[resource_name] = _compile(resource) or _unchanged(resource)
+
+    def stamp(self, resource_name, node_idx):
+        return self.stampers[resource_name](str(node_idx))
+
+    def nest(self, template_data):
+        """
+        Splits template_data, as returned by render(), into a parent template plus one
+        child template per indexed role. Returns the parent and a dict mapping the name
+        of each nested stack resource in the parent to its child template.
+        """
+        parent = dict(template_data)
+        parent['Resources'] = dict(template_data['Resources'])
+        children = {}
+        for resource_name in sorted(self.indexed_roles):
+            stack_name, child = nest_resources(parent, resource_name)
+            if stack_name is not None:
+                children[stack_name] = child
+        return parent, children
+
+    def _profile(self, resources, resource_name, resource, profiles, node_idx=None):
+        role = self.roles.get(resource_name)
+        profile = instance_profiles.for_node(profiles, role, node_idx) if role is not None else {}
+        if not profile:
+            return resource
+        description = role if node_idx is None else '%s node %s' % (role, node_idx)
+        profiled, needed = instance_profiles.apply(resource_name, resource, profile, description)
+        resources.update(needed)
+        return profiled
+
+    def render(self, node_counts, profiles=None):
+        """
+        Returns the template as a dict, with resources named <resource><n> for n from 1 to
+        the count given for each indexed role in node_counts. Instances are changed to
+        match any of profiles for their role, see instance_profiles, and the profiles are
+        kept in the template's Metadata. Parts without a
+        placeholder are shared with this CompiledTemplate, so copy anything before changing it.
+        """
+        profiles = profiles or {}
+        template_data = dict(self.template)
+        if profiles:
+            template_data['Metadata'] = dict(self.template.get('Metadata', {}))
+            template_data['Metadata'][instance_profiles.METADATA_KEY] = profiles
+        resources = dict(self.base_resources)
+        for resource_name in self.base_resources:
+            resources[resource_name] = self._profile(resources, resource_name, resources[resource_name], profiles)
+        for resource_name, count_name in self.indexed_roles.items():
+            for node_idx in range(1, node_counts.get(count_name, 0) + 1):
+                resources['%s%s' % (resource_name, node_idx)] = self._profile(
+                    resources, resource_name, self.stamp(resource_name, node_idx), profiles, node_idx)
+        template_data['Resources'] = resources
+        return template_data
+
+
+def to_json(template_data):
+    """ Compact and with sorted keys, so the same template always gives the same bytes """
+    return json.dumps(template_data, separators=(',', ':'), sort_keys=True)
+
+
+def _collect_refs(value, refs):
+    if isinstance(value, dict):
+        for key, item in value.items():
+            if key == 'Ref':
+                refs.add(item)
+            elif key == 'Fn::GetAtt':
+                raise Exception('Fn::GetAtt %s cannot be used from a nested stack' % item)
+            else:
+                _collect_refs(item, refs)
+    elif isinstance(value, list):
+        for item in value:
+            _collect_refs(item, refs)
+
+
+def nest_resources(template_data, resource_name):
+    """
+    Moves the copies of resource_name (resource_name1, resource_name2, ...) out of
+    template_data into a child template. The copies are replaced with one
+    AWS::CloudFormation::Stack resource, which passes every parameter and resource
+    they refer to through as a child stack parameter. Its TemplateURL is left for the
+    caller to fill in once the child has been uploaded.
+
+    Returns (stack resource name, child template), or (None, None) if there are no copies.
+    """
+    member_pattern = re.compile('^%s[0-9]+$' % resource_name)
+    resources = template_data['Resources']
+    members = sorted([name for name in resources if member_pattern.match(name)])
+    if not members:
+        return None, None
+
+    refs = set()
+    depends_on = set()
+    child_resources = {}
+    for name in members:
+        resource = dict(resources.pop(name))
+        _collect_refs(resource, refs)
+        dependencies = resource.pop('DependsOn', [])
+        depends_on.update([dependencies] if isinstance(dependencies, STRING_TYPES) else dependencies)
+        child_resources[name] = resource
+    refs = sorted([ref for ref in refs if not ref.startswith('AWS::')])
+
+    child = {'AWSTemplateFormatVersion': template_data.get('AWSTemplateFormatVersion', '2010-09-09'),
+             'Description': 'Nested stack holding the %s resources' % resource_name,
+             'Parameters': dict([(ref, {'Type': 'String'}) for ref in refs]),
+             'Resources': child_resources}
+    stack = {'Type': 'AWS::CloudFormation::Stack',
+             'Properties': {'TemplateURL': None,
+                            'Parameters': dict([(ref, {'Ref': ref}) for ref in refs])}}
+    if depends_on:
+        stack['DependsOn'] = sorted(depends_on)
+
+    stack_name = 'stack%s%s' % (resource_name[0].upper(), resource_name[1:])
+    resources[stack_name] = stack
+    return stack_name, child
+
+
+def template_path(flavour):
+    return 'cloud-formation/%s/cf-tmpl.json' % flavour
+
+
+def load(filepath):
+    """ Returns the CompiledTemplate for filepath, parsing it again only when the file changes """
+    key = os.path.abspath(filepath)
+    mtime = os.path.getmtime(filepath)
+    with _CACHE_LOCK:
+        cached = _CACHE.get(key)
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, CompiledTemplate(filepath))
+            _CACHE[key] = cached
+        return cached[1]
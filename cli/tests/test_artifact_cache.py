@@ -0,0 +1,182 @@
+#   Copyright (c) 2016 Cisco and/or its affiliates.
+#   This software is licensed to you under the terms of the Apache License, Version 2.0
+#   (the "License").
+#   You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   Unless required by applicable law or agreed to separately in writing, software distributed
+#   under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+#   ANY KIND, either express or implied.
+#
+#   Purpose: Tests for artifact_cache, and for bootstrapping a host from the cache with no other network access
+
+import os
+import hashlib
+import functools
+import threading
+import subprocess
+from http.server import HTTPServer, SimpleHTTPRequestHandler
+
+import pytest
+
+import artifact_cache
+
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                           'bootstrap-scripts')
+
+PACKAGES_OUTPUT = [
+    "PNDA_PACKAGE minion 'http://archive.ubuntu.com/ubuntu/pool/main/x/xfsprogs/xfsprogs_3.1.9ubuntu2_amd64.deb' "
+    "xfsprogs_3.1.9ubuntu2_amd64.deb 1044570 MD5Sum:3c6bd7c1e3a5c2f8b1a07b9f2a2b4b61",
+    "PNDA_PACKAGE minion 'http://repo.saltstack.com/apt/ubuntu/14.04/amd64/archive/2015.8.10/pool/salt-minion_2015.8.10%3a1_all.deb' "
+    "salt-minion_2015.8.10%3a1_all.deb 26914 SHA256:" + 'a' * 64,
+    "PNDA_PACKAGE saltmaster 'http://repo.saltstack.com/apt/ubuntu/14.04/amd64/archive/2015.8.10/pool/salt-master_2015.8.10_all.deb' "
+    "salt-master_2015.8.10_all.deb 39472 SHA256:" + 'b' * 64,
+    'Reading package lists...',
+]
+
+
+def test_resolve_args():
+    packages = {'source': 'deb http://repo trusty main', 'key': 'http://repo/key',
+                'sets': {'minion': ['salt-minion', 'xfsprogs'], 'saltmaster': ['salt-master']}}
+    assert artifact_cache.resolve_args(packages) == ['deb http://repo trusty main', 'http://repo/key',
+                                                     'minion=salt-minion,xfsprogs', 'saltmaster=salt-master']
+
+
+def test_parse_packages():
+    sets = artifact_cache.parse_packages(PACKAGES_OUTPUT)
+    assert sorted(sets) == ['minion', 'saltmaster']
+    xfsprogs, salt_minion = sets['minion']
+    assert xfsprogs == {'url': 'http://archive.ubuntu.com/ubuntu/pool/main/x/xfsprogs/xfsprogs_3.1.9ubuntu2_amd64.deb',
+                        'name': 'xfsprogs_3.1.9ubuntu2_amd64.deb'}
+    assert salt_minion['name'] == 'salt-minion_2015.8.10_3a1_all.deb'
+    assert salt_minion['sha256'] == 'a' * 64
+
+
+def test_package_artifacts():
+    artifacts = artifact_cache.package_artifacts(artifact_cache.parse_packages(PACKAGES_OUTPUT))
+    assert sorted(artifacts) == ['debs/minion/salt-minion_2015.8.10_3a1_all.deb',
+                                 'debs/minion/xfsprogs_3.1.9ubuntu2_amd64.deb',
+                                 'debs/saltmaster/salt-master_2015.8.10_all.deb']
+    assert artifacts['debs/saltmaster/salt-master_2015.8.10_all.deb']['sha256'] == 'b' * 64
+    assert 'sha256' not in artifacts['debs/minion/xfsprogs_3.1.9ubuntu2_amd64.deb']
+
+
+def test_packages_path_follows_the_image_and_package_sets():
+    packages = {'source': 's', 'key': 'k', 'sets': {'minion': ['salt-minion']}}
+    path = artifact_cache.packages_path('cache', packages, 'ami-1')
+    assert path.startswith(os.path.join('cache', 'packages-ami-1-'))
+    assert artifact_cache.packages_path('cache', packages, 'ami-2') != path
+    packages['sets']['minion'].append('xfsprogs')
+    assert artifact_cache.packages_path('cache', packages, 'ami-1') != path
+
+
+# Commands standing in for the network and package tools. Anything that would reach past the
+# stand-in for the relay is refused and recorded, as it would be with outbound access blocked.
+WGET = '''#!/bin/bash
+for ARG in "$@"; do
+  case $ARG in
+    http://*|https://*) URL=$ARG ;;
+  esac
+done
+case $URL in
+  $RELAY/*) exec %(wget)s "$@" ;;
+esac
+echo "wget $URL" >> $CALLS/blocked
+exit 4
+'''
+BLOCKED = '''#!/bin/bash
+echo "$(basename $0) $*" >> $CALLS/blocked
+exit 100
+'''
+DPKG = '''#!/bin/bash
+echo "dpkg $*" >> $CALLS/dpkg
+if [ "$1" = "-s" ]; then
+  grep -q "^dpkg -i .*/$2_" $CALLS/dpkg
+fi
+'''
+
+
+def served(directory):
+    handler = functools.partial(SimpleHTTPRequestHandler, directory=directory)
+    handler.func.log_message = lambda *args: None
+    server = HTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def write(path, content, mode=0o644):
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, 'wb') as out_file:
+        out_file.write(content.encode('utf-8') if isinstance(content, str) else content)
+    os.chmod(path, mode)
+
+
+@pytest.fixture
+def host(tmp_path):
+    """ A stand-in for a host's /tmp, with the stand-in commands first on its PATH """
+    tmp_dir, calls, bin_dir = str(tmp_path / 'tmp'), str(tmp_path / 'calls'), str(tmp_path / 'bin')
+    os.makedirs(calls)
+    with open(os.path.join(SCRIPTS_DIR, 'base.sh'), 'r') as script:
+        write(os.path.join(tmp_dir, 'base.sh'), script.read().replace('/tmp/', tmp_dir + '/'))
+    write(os.path.join(tmp_dir, 'disks.sh'), 'echo preparing disks\n')
+    write(os.path.join(bin_dir, 'wget'), WGET % {'wget': subprocess.check_output(['which', 'wget']).decode().strip()}, 0o755)
+    for command in ['curl', 'apt-get', 'apt-key', 'sh']:
+        write(os.path.join(bin_dir, command), BLOCKED, 0o755)
+    write(os.path.join(bin_dir, 'dpkg'), DPKG, 0o755)
+    return {'tmp': tmp_dir, 'calls': calls, 'bin': bin_dir}
+
+
+def cache(relay_dir, artifacts):
+    sums = ''
+    for name, content in sorted(artifacts.items()):
+        write(os.path.join(relay_dir, name), content)
+        sums += '%s  %s\n' % (hashlib.sha256(content).hexdigest(), name)
+    write(os.path.join(relay_dir, artifact_cache.SUMS_FILE), sums)
+
+
+def run_base(host, relay_dir):
+    server = served(relay_dir)
+    try:
+        env = dict(os.environ, PATH='%s:%s' % (host['bin'], os.environ['PATH']), CALLS=host['calls'],
+                   RELAY='http://127.0.0.1:%s' % server.server_port,
+                   PNDA_ARTIFACTS_URI='http://127.0.0.1:%s' % server.server_port)
+        return subprocess.run(['bash', os.path.join(host['tmp'], 'base.sh')], cwd=host['tmp'], env=env,
+                              stdout=subprocess.PIPE, stderr=subprocess.STDOUT, timeout=60)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def calls(host, name):
+    path = os.path.join(host['calls'], name)
+    if not os.path.isfile(path):
+        return []
+    with open(path, 'r') as calls_file:
+        return calls_file.read().splitlines()
+
+
+def test_base_bootstraps_from_the_cache_alone(host, tmp_path):
+    relay_dir = str(tmp_path / 'relay')
+    cache(relay_dir, {'install_salt.sh': b'exit 1\n',
+                      'debs/minion/salt-minion_2015.8.10_all.deb': b'minion',
+                      'debs/minion/xfsprogs_3.1.9ubuntu2_amd64.deb': b'xfsprogs',
+                      'debs/saltmaster/salt-master_2015.8.10_all.deb': b'master'})
+
+    result = run_base(host, relay_dir)
+
+    assert result.returncode == 0, result.stdout.decode()
+    assert calls(host, 'blocked') == []
+    installs = [call for call in calls(host, 'dpkg') if call.startswith('dpkg -i ')]
+    assert len(installs) == 1
+    assert sorted(os.path.basename(deb) for deb in installs[0].split()[2:]) == ['salt-minion_2015.8.10_all.deb',
+                                                                               'xfsprogs_3.1.9ubuntu2_amd64.deb']
+
+
+def test_base_refuses_an_artifact_that_does_not_match(host, tmp_path):
+    relay_dir = str(tmp_path / 'relay')
+    cache(relay_dir, {'install_salt.sh': b'exit 1\n', 'debs/minion/salt-minion_2015.8.10_all.deb': b'minion'})
+    write(os.path.join(relay_dir, 'debs/minion/salt-minion_2015.8.10_all.deb'), b'tampered')
+
+    result = run_base(host, relay_dir)
+
+    assert result.returncode != 0
+    assert [call for call in calls(host, 'dpkg') if call.startswith('dpkg -i ')] == []
@@ -0,0 +1,86 @@
+#   Copyright (c) 2016 Cisco and/or its affiliates.
+#   This software is licensed to you under the terms of the Apache License, Version 2.0
+#   (the "License").
+#   You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   Unless required by applicable law or agreed to separately in writing, software distributed
+#   under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+#   ANY KIND, either express or implied.
+#
+#   Purpose: Tests for env_file
+
+import os
+import subprocess
+
+import pytest
+
+import env_file
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SUPPORTED = '''# comment
+export JAVA_MIRROR=http://mirror.example.com/jdk.tar.gz
+PACKAGES_SERVER_IP=10.0.0.1
+PACKAGES_SERVER_URI="http://$PACKAGES_SERVER_IP:8080/${PNDA_PATH}"
+LITERAL='$PACKAGES_SERVER_IP and ${HOME}'
+FROM_ENVIRON=$BENCH_ENV_TEST_VALUE/x
+UNSET="${NOT_SET_ANYWHERE}"
+'''
+
+
+def env(tmp_path, content):
+    path = str(tmp_path / 'pnda_env.sh')
+    with open(path, 'w') as out_file:
+        out_file.write(content)
+    return path
+
+
+def sourced(path, environ):
+    output = subprocess.check_output(['bash', '-c', 'set -a; source "%s"; env -0' % path], env=environ)
+    return dict(entry.split('=', 1) for entry in output.decode('utf-8').split('\0') if '=' in entry)
+
+
+def test_matches_bash(tmp_path):
+    path = env(tmp_path, SUPPORTED)
+    environ = {'PATH': os.environ['PATH'], 'PNDA_PATH': 'pnda', 'BENCH_ENV_TEST_VALUE': 'from-env'}
+    variables = env_file.parse(path, environ)
+    assert variables['PACKAGES_SERVER_URI'] == 'http://10.0.0.1:8080/pnda'
+    assert variables['LITERAL'] == '$PACKAGES_SERVER_IP and ${HOME}'
+    assert variables['FROM_ENVIRON'] == 'from-env/x'
+    assert variables['UNSET'] == ''
+    from_bash = sourced(path, environ)
+    for name, value in variables.items():
+        assert from_bash[name] == value, name
+
+
+def test_parses_the_shipped_pnda_env():
+    env_file.parse(os.path.join(ROOT, 'pnda_env.sh'), {})
+
+
+@pytest.mark.parametrize('line', [
+    'MIRROR=${JAVA_MIRROR:-http://default}',
+    'MIRROR="${JAVA_MIRROR:-http://default}"',
+    'NAME="${FILE%.tar.gz}"',
+    'NAME=${FILE#*/}',
+    'LENGTH="${#FILE}"',
+    'HOST=$(hostname)',
+    'HOST="$(hostname)"',
+    'HOST=`hostname`',
+    'HOST="`hostname`"',
+    'ARG="$1"',
+    'PID=$$',
+    'QUOTED="say \\"hi\\""',
+    'ESCAPED=a\\ b',
+    'MIXED="a"b"c"',
+    'VALUE=a b',
+    'VALUE=a;b',
+    'if [ -z "$X" ]; then X=1; fi',
+    'source other.sh',
+])
+def test_falls_back_to_bash(tmp_path, line):
+    with pytest.raises(ValueError):
+        env_file.parse(env(tmp_path, line + '\n'), {})
+
+
+def test_single_quotes_keep_everything_literal(tmp_path):
+    variables = env_file.parse(env(tmp_path, "VALUE='${X:-y} $(date) `date`'\n"), {})
+    assert variables['VALUE'] == '${X:-y} $(date) `date`'
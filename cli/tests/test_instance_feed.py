@@ -0,0 +1,130 @@
+#   Copyright (c) 2016 Cisco and/or its affiliates.
+#   This software is licensed to you under the terms of the Apache License, Version 2.0
+#   (the "License").
+#   You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   Unless required by applicable law or agreed to separately in writing, software distributed
+#   under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+#   ANY KIND, either express or implied.
+#
+#   Purpose: Tests for instance_feed
+
+import time
+import logging
+import threading
+from collections import namedtuple
+
+import pytest
+
+from instance_feed import InstanceFeed, INSTANCE_RESOURCE_TYPE
+
+Event = namedtuple('Event', ['logical_resource_id', 'resource_type', 'resource_status'])
+LOG = logging.getLogger('test_instance_feed')
+
+
+class Cloud(object):
+    """ The instances lookup() finds, as they come up """
+    def __init__(self):
+        self.instances = {}
+        self.lock = threading.Lock()
+
+    def add(self, name, ip_address='10.0.0.1'):
+        with self.lock:
+            self.instances[name] = {'name': name, 'private_ip_address': ip_address}
+
+    def lookup(self):
+        with self.lock:
+            return dict(self.instances)
+
+
+def feed_for(cloud, prerequisites=(), required=()):
+    delivered = []
+    feed = InstanceFeed(cloud.lookup, lambda ready: delivered.append(sorted(ready)), prerequisites, required, LOG,
+                        min_interval=0.05)
+    return feed, delivered
+
+
+def completed(name, resource_type=INSTANCE_RESOURCE_TYPE):
+    return Event(name, resource_type, 'CREATE_COMPLETE')
+
+
+def wait_for(condition, seconds=5):
+    deadline = time.time() + seconds
+    while not condition():
+        assert time.time() < deadline
+        time.sleep(0.02)
+
+
+def test_nothing_before_the_prerequisites():
+    cloud = Cloud()
+    feed, delivered = feed_for(cloud, prerequisites=['vpc', 'subnet'])
+    feed.start()
+    cloud.add('c1-kafka-1')
+    feed.on_event(completed('instanceKafka1'))
+    feed.on_event(completed('vpc', 'AWS::EC2::VPC'))
+    time.sleep(0.2)
+    assert feed.lookups == 0
+    feed.on_event(completed('subnet', 'AWS::EC2::Subnet'))
+    wait_for(lambda: delivered == [['c1-kafka-1']])
+    feed.finish()
+
+
+def test_each_instance_is_handed_over_once():
+    cloud = Cloud()
+    feed, delivered = feed_for(cloud)
+    feed.start()
+    cloud.add('c1-kafka-1')
+    feed.on_event(completed('instanceKafka1'))
+    wait_for(lambda: len(delivered) == 1)
+    cloud.add('c1-cdh-dn-1')
+    cloud.add('c1-cdh-dn-2', ip_address=None)
+    feed.on_event(completed('instanceCdhDn1'))
+    wait_for(lambda: len(delivered) == 2)
+    cloud.add('c1-cdh-dn-2')
+    feed.finish()
+    assert delivered == [['c1-kafka-1'], ['c1-cdh-dn-1'], ['c1-cdh-dn-2']]
+
+
+def test_waits_for_required_instances():
+    cloud = Cloud()
+    feed, delivered = feed_for(cloud, required=['c1-saltmaster'])
+    feed.start()
+    cloud.add('c1-kafka-1')
+    feed.on_event(completed('instanceKafka1'))
+    wait_for(lambda: feed.lookups > 0)
+    time.sleep(0.1)
+    assert delivered == []
+    cloud.add('c1-saltmaster')
+    feed.on_event(completed('instanceSaltmaster'))
+    wait_for(lambda: delivered == [['c1-kafka-1', 'c1-saltmaster']])
+    feed.finish()
+
+
+def test_ignores_events_that_are_not_completions():
+    cloud = Cloud()
+    feed, delivered = feed_for(cloud)
+    feed.start()
+    wait_for(lambda: feed.lookups == 1)
+    feed.on_event(Event('instanceKafka1', INSTANCE_RESOURCE_TYPE, 'CREATE_IN_PROGRESS'))
+    time.sleep(0.2)
+    assert feed.lookups == 1
+    feed.stop()
+
+
+def test_stop_does_not_wait_out_the_interval():
+    cloud = Cloud()
+    feed = InstanceFeed(cloud.lookup, lambda ready: None, [], [], LOG, min_interval=30)
+    feed.start()
+    wait_for(lambda: feed.lookups == 1)
+    start = time.time()
+    feed.stop()
+    assert time.time() - start < 5
+
+
+def test_lookup_errors_surface_on_finish():
+    def lookup():
+        raise Exception('throttled')
+    feed = InstanceFeed(lookup, lambda ready: None, [], [], LOG, min_interval=0.05)
+    feed.start()
+    wait_for(lambda: feed.error is not None)
+    with pytest.raises(Exception):
+        feed.finish()
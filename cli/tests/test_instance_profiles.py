@@ -0,0 +1,92 @@
+#   Copyright (c) 2016 Cisco and/or its affiliates.
+#   This software is licensed to you under the terms of the Apache License, Version 2.0
+#   (the "License").
+#   You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   Unless required by applicable law or agreed to separately in writing, software distributed
+#   under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+#   ANY KIND, either express or implied.
+#
+#   Purpose: Tests for instance_profiles
+
+import pytest
+
+import instance_profiles
+
+
+def kafka():
+    return {'Type': 'AWS::EC2::Instance',
+            'Properties': {'InstanceType': {'Ref': 'instancetypeDbKafka'},
+                           'BlockDeviceMappings': [{'DeviceName': '/dev/sda1', 'Ebs': {'VolumeSize': '50'}},
+                                                   {'DeviceName': '/dev/sdc', 'VirtualName': 'ephemeral0'},
+                                                   {'DeviceName': '/dev/sdd', 'VirtualName': 'ephemeral1'}]}}
+
+
+def devices(resource):
+    return dict((mapping['DeviceName'], mapping) for mapping in resource['Properties']['BlockDeviceMappings'])
+
+
+def test_empty_profile_changes_nothing():
+    profiled, needed = instance_profiles.apply('instanceKafka', kafka(), {}, 'kafka')
+    assert profiled == kafka()
+    assert needed == {}
+
+
+def test_volumes_replace_data_devices():
+    profile = {'volumes': {'count': 2, 'size_gb': 512, 'type': 'st1'}}
+    profiled, needed = instance_profiles.apply('instanceKafka', kafka(), profile, 'kafka')
+    mappings = devices(profiled)
+    assert sorted(mappings) == ['/dev/sda1', '/dev/sdc', '/dev/sdd', '/dev/sde']
+    assert mappings['/dev/sdc'] == {'DeviceName': '/dev/sdc', 'VirtualName': 'ephemeral0'}
+    assert mappings['/dev/sde']['Ebs'] == {'VolumeSize': '512', 'VolumeType': 'st1'}
+    assert needed == {}
+
+
+def test_instance_type_moves_instance_storage_to_ebs():
+    profile = {'instance_type': 'm4.2xlarge', 'volumes': {'size_gb': 256}}
+    profiled, _ = instance_profiles.apply('instanceKafka', kafka(), profile, 'kafka')
+    mappings = devices(profiled)
+    assert profiled['Properties']['InstanceType'] == 'm4.2xlarge'
+    assert mappings['/dev/sdc'] == {'DeviceName': '/dev/sdc', 'Ebs': {'VolumeSize': {'Ref': 'logVolumeSizeGb'}}}
+    assert mappings['/dev/sdd'] == {'DeviceName': '/dev/sdd', 'Ebs': {'VolumeSize': '256'}}
+    assert not any('VirtualName' in mapping for mapping in mappings.values())
+
+
+def test_instance_type_without_volumes_drops_instance_storage_data():
+    profiled, _ = instance_profiles.apply('instanceKafka', kafka(), {'instance_type': 'm4.4xlarge'}, 'kafka')
+    assert sorted(devices(profiled)) == ['/dev/sda1', '/dev/sdc']
+    assert 'Ebs' in devices(profiled)['/dev/sdc']
+
+
+def test_throughput_uses_a_launch_template():
+    profile = {'volumes': {'size_gb': 256, 'type': 'gp3', 'throughput': 500}}
+    profiled, needed = instance_profiles.apply('instanceKafka', kafka(), profile, 'kafka')
+    assert 'BlockDeviceMappings' not in profiled['Properties']
+    assert len(needed) == 1
+    name = list(needed)[0]
+    assert name.startswith('launchTemplateInstanceKafka')
+    assert profiled['Properties']['LaunchTemplate'] == {'LaunchTemplateId': {'Ref': name}, 'Version': '1'}
+    data_volume = needed[name]['Properties']['LaunchTemplateData']['BlockDeviceMappings'][-1]
+    assert data_volume['Ebs']['Throughput'] == '500'
+    # the name follows the content so a changed template is a new resource, not a new version
+    _, again = instance_profiles.apply('instanceKafka', kafka(), profile, 'kafka')
+    assert list(again) == [name]
+
+
+def test_iops_need_a_provisioned_volume_type():
+    with pytest.raises(Exception):
+        instance_profiles.apply('instanceKafka', kafka(), {'volumes': {'size_gb': 64, 'iops': 3000}}, 'kafka')
+
+
+def test_for_node_uses_later_matching_entries():
+    profiles = instance_profiles.check({'cdh-dn': [{'instance_type': 'm4.2xlarge', 'volumes': {'size_gb': 1024}},
+                                                   {'nodes': '3-4', 'volumes': {'count': 2}}]})
+    assert instance_profiles.for_node(profiles, 'cdh-dn', 1) == {'instance_type': 'm4.2xlarge', 'volumes': {'size_gb': 1024}}
+    assert instance_profiles.for_node(profiles, 'cdh-dn', 4) == {'instance_type': 'm4.2xlarge',
+                                                                 'volumes': {'size_gb': 1024, 'count': 2}}
+
+
+def test_check_rejects_unknown_settings_and_roles():
+    with pytest.raises(Exception):
+        instance_profiles.check({'kafka': {'instance': 'm4.xlarge'}})
+    with pytest.raises(Exception):
+        instance_profiles.check({'brokers': {'instance_type': 'm4.xlarge'}}, roles=['kafka'])
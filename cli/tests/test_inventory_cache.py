@@ -0,0 +1,35 @@
+#   Copyright (c) 2016 Cisco and/or its affiliates.
+#   This software is licensed to you under the terms of the Apache License, Version 2.0
+#   (the "License").
+#   You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   Unless required by applicable law or agreed to separately in writing, software distributed
+#   under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+#   ANY KIND, either express or implied.
+#
+#   Purpose: Tests for inventory_cache
+
+from inventory_cache import InventoryCache
+
+INSTANCES = {'c1-saltmaster': {'private_ip_address': '10.0.0.1', 'node_type': 'saltmaster', 'node_idx': ''}}
+
+
+def test_put_and_get(tmp_path):
+    cache = InventoryCache(str(tmp_path), 300)
+    assert cache.get('eu-west-1', 'c1') is None
+    cache.put('eu-west-1', 'c1', INSTANCES)
+    assert cache.get('eu-west-1', 'c1') == INSTANCES
+
+
+def test_clusters_of_the_same_name_in_other_regions_are_kept_apart(tmp_path):
+    cache = InventoryCache(str(tmp_path), 300)
+    cache.put('eu-west-1', 'c1', INSTANCES)
+    assert cache.get('us-east-1', 'c1') is None
+    cache.put('us-east-1', 'c1', {})
+    cache.invalidate('us-east-1', 'c1')
+    assert cache.get('eu-west-1', 'c1') == INSTANCES
+
+
+def test_entries_expire(tmp_path):
+    cache = InventoryCache(str(tmp_path), -1)
+    cache.put('eu-west-1', 'c1', INSTANCES)
+    assert cache.get('eu-west-1', 'c1') is None
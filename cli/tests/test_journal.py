@@ -0,0 +1,79 @@
+#   Copyright (c) 2016 Cisco and/or its affiliates.
+#   This software is licensed to you under the terms of the Apache License, Version 2.0
+#   (the "License").
+#   You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   Unless required by applicable law or agreed to separately in writing, software distributed
+#   under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+#   ANY KIND, either express or implied.
+#
+#   Purpose: Tests for journal
+
+import os
+import threading
+
+from journal import Journal
+
+
+def journal_in(tmp_path, cluster='c1'):
+    return Journal(Journal.path_for(str(tmp_path / 'journal'), cluster))
+
+
+def test_nothing_to_load(tmp_path):
+    assert not journal_in(tmp_path).load()
+
+
+def test_progress_survives_a_restart(tmp_path):
+    journal = journal_in(tmp_path)
+    journal.start('create', {'flavour': 'standard', 'datanodes': 3})
+    journal.mark_phase('stack')
+    journal.mark_host('c1-kafka-1', 'base', 'abc')
+
+    resumed = journal_in(tmp_path)
+    assert resumed.load()
+    assert resumed.command() == 'create'
+    assert resumed.settings() == {'flavour': 'standard', 'datanodes': 3}
+    assert resumed.phase_done('stack')
+    assert not resumed.phase_done('highstate')
+    assert resumed.host_done('c1-kafka-1', 'base', 'abc')
+    assert not resumed.host_done('c1-kafka-1', 'minion', 'abc')
+
+
+def test_steps_are_repeated_when_their_files_change(tmp_path):
+    journal = journal_in(tmp_path)
+    journal.start('expand', {})
+    journal.mark_host('c1-cdh-dn-4', 'base', 'abc')
+    journal.mark_phase('bootstrap', 'abc')
+    assert not journal.host_done('c1-cdh-dn-4', 'base', 'def')
+    assert journal.phase_done('bootstrap')
+    assert not journal.phase_done('bootstrap', 'def')
+
+
+def test_start_replaces_the_last_run(tmp_path):
+    journal = journal_in(tmp_path)
+    journal.start('create', {})
+    journal.mark_phase('stack')
+    journal.start('expand', {})
+    assert journal.command() == 'expand'
+    assert not journal.phase_done('stack')
+
+
+def test_remove(tmp_path):
+    journal = journal_in(tmp_path)
+    journal.start('create', {})
+    journal.remove()
+    journal.remove()
+    assert not os.path.exists(journal.path)
+    assert not journal_in(tmp_path).load()
+
+
+def test_hosts_marked_from_many_threads(tmp_path):
+    journal = journal_in(tmp_path)
+    journal.start('create', {})
+    threads = [threading.Thread(target=journal.mark_host, args=('host-%s' % idx, 'base', 'abc')) for idx in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    resumed = journal_in(tmp_path)
+    assert resumed.load()
+    assert all(resumed.host_done('host-%s' % idx, 'base', 'abc') for idx in range(20))
@@ -0,0 +1,117 @@
+#   Copyright (c) 2016 Cisco and/or its affiliates.
+#   This software is licensed to you under the terms of the Apache License, Version 2.0
+#   (the "License").
+#   You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   Unless required by applicable law or agreed to separately in writing, software distributed
+#   under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+#   ANY KIND, either express or implied.
+#
+#   Purpose: Tests for log_store
+
+import time
+import logging
+
+import log_store
+import subprocess_to_log
+from log_store import LogStore
+
+SALT_OUTPUT = ['c1-kafka-1:',
+               '----------',
+               '          ID: kafka-server',
+               '    Function: pkg.installed',
+               '      Result: False',
+               '     Comment: Package kafka not found',
+               'Summary for c1-kafka-1',
+               'Failed:    1']
+
+
+def wait_for(condition, seconds=5):
+    deadline = time.time() + seconds
+    while not condition():
+        assert time.time() < deadline
+        time.sleep(0.05)
+
+
+def test_index_lists_errors_warnings_and_salt_failures(tmp_path):
+    store = LogStore(str(tmp_path), 'run-1')
+    base = store.segment('10.0.0.5', 'base')
+    base.log(logging.INFO, 'Setting up xfsprogs')
+    base.log(logging.INFO, 'WARNING: apt does not have a stable CLI interface')
+    base.log(logging.ERROR, 'dpkg: error processing package salt-minion (--install)')
+    highstate = store.segment('10.0.0.1', 'highstate')
+    for line in SALT_OUTPUT:
+        highstate.log(logging.INFO, line)
+    store.close()
+
+    index = log_store.load_index(str(tmp_path), 'run-1')
+    assert [entry['kind'] for entry in log_store.find_entries(index, [log_store.WARNING], phase='base')] == ['warning']
+    errors = log_store.find_entries(index, [log_store.ERROR])
+    assert [entry['line'] for entry in errors] == [3]
+    failures = log_store.find_entries(index, [log_store.SALT_FAILURE])
+    assert [(entry['minion'], entry['state']) for entry in failures] == [('c1-kafka-1', 'kafka-server'),
+                                                                         ('c1-kafka-1', 'kafka-server')]
+    # salt failures can be found by the minion they happened on as well as the host that ran salt
+    assert len(log_store.find_entries(index, [log_store.SALT_FAILURE], host='c1-kafka-1')) == 2
+    assert [name for name, _ in log_store.find_segments(index, host='10.0.0.5')] == ['10.0.0.5.base']
+
+
+def test_tail(tmp_path):
+    store = LogStore(str(tmp_path), 'run-1')
+    segment = store.segment('10.0.0.5', 'base')
+    for idx in range(1000):
+        segment.log(logging.INFO, 'line %s' % idx)
+    store.close()
+    index = log_store.load_index(str(tmp_path), 'run-1')
+    lines = log_store.tail(str(tmp_path), 'run-1', index['segments'][segment.name], 3)
+    assert [line.split()[-1] for line in lines] == ['997', '998', '999']
+
+
+def test_tail_of_long_lines(tmp_path):
+    # salt's json output puts a whole state run on one line
+    store = LogStore(str(tmp_path), 'run-1')
+    segment = store.segment('10.0.0.1', 'highstate')
+    for idx in range(20):
+        segment.log(logging.INFO, '%s %s' % ('x' * 12000, idx))
+    store.close()
+    index = log_store.load_index(str(tmp_path), 'run-1')
+    lines = log_store.tail(str(tmp_path), 'run-1', index['segments'][segment.name], 10)
+    assert [line.split()[-1] for line in lines] == [str(idx) for idx in range(10, 20)]
+    assert all(len(line.split()[-2]) == 12000 for line in lines)
+
+
+def test_full_parts_are_compressed_and_still_read(tmp_path, monkeypatch):
+    monkeypatch.setattr(log_store, 'MAX_PART_BYTES', 1024)
+    store = LogStore(str(tmp_path), 'run-1')
+    segment = store.segment('10.0.0.5', 'base')
+    for idx in range(200):
+        segment.log(logging.INFO, 'line %s' % idx)
+    wait_for(lambda: all(part['compressed'] for part in segment.parts[:-1]))
+    store.close()
+
+    index = log_store.load_index(str(tmp_path), 'run-1')
+    parts = index['segments'][segment.name]['parts']
+    assert len(parts) > 2
+    assert all(part['file'].endswith('.gz') for part in parts[:-1])
+    # reaching back past the uncompressed last part into the compressed ones
+    lines = log_store.tail(str(tmp_path), 'run-1', index['segments'][segment.name], 100)
+    assert [line.split()[-1] for line in lines] == [str(idx) for idx in range(100, 200)]
+
+
+def test_segments_do_not_hold_files_open(tmp_path):
+    store = LogStore(str(tmp_path), 'run-1')
+    for idx in range(1100):
+        store.segment('10.0.%s.%s' % (idx // 250, idx % 250), 'base').log(logging.INFO, 'Setting up xfsprogs')
+    segment = store.segment('10.0.0.1', 'highstate')
+    output = []
+    ret_val = subprocess_to_log.call(['sh', '-c', 'echo hello; echo err >&2'], segment, output=output)
+    store.close()
+    assert ret_val == 0
+    assert output == ['hello']
+    assert segment.lines == 2
+
+
+def test_list_runs(tmp_path):
+    LogStore(str(tmp_path), 'c1-1').close()
+    LogStore(str(tmp_path), 'c2-1').close()
+    LogStore(str(tmp_path), 'c1-2')
+    assert log_store.list_runs(str(tmp_path), 'c1-') == ['c1-1']
@@ -0,0 +1,97 @@
+#   Copyright (c) 2016 Cisco and/or its affiliates.
+#   This software is licensed to you under the terms of the Apache License, Version 2.0
+#   (the "License").
+#   You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   Unless required by applicable law or agreed to separately in writing, software distributed
+#   under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+#   ANY KIND, either express or implied.
+#
+#   Purpose: Tests for preflight
+
+import time
+import logging
+
+import preflight
+from preflight import Preflight, CheckFailed, CheckWarning, OK, WARN, ERROR, TIMEOUT
+
+LOG = logging.getLogger('test_preflight')
+
+
+def passes():
+    pass
+
+
+def warns():
+    raise CheckWarning('key file is readable by others')
+
+
+def fails():
+    raise CheckFailed('AWS_REGION is not set')
+
+
+def crashes():
+    raise KeyError('AWS_IMAGE_ID')
+
+
+def statuses(checks):
+    return dict((check.label, check.status) for check in checks.checks)
+
+
+def test_statuses():
+    checks = Preflight(LOG)
+    for target in [passes, warns, fails, crashes]:
+        checks.add(target.__name__, target)
+    assert not checks.run()
+    assert statuses(checks) == {'passes': OK, 'warns': WARN, 'fails': ERROR, 'crashes': ERROR}
+    crashed = [check for check in checks.checks if check.label == 'crashes'][0]
+    assert 'KeyError' in crashed.trace
+
+
+def test_warnings_do_not_fail():
+    checks = Preflight(LOG)
+    checks.add('passes', passes)
+    checks.add('warns', warns)
+    assert checks.run()
+
+
+def test_checks_run_at_once_and_slow_ones_time_out():
+    checks = Preflight(LOG)
+    checks.add('slow', time.sleep, [10], deadline=0.5)
+    for idx in range(5):
+        checks.add('quick-%s' % idx, time.sleep, [0.3])
+    start = time.time()
+    assert not checks.run()
+    assert time.time() - start < 2
+    assert statuses(checks)['slow'] == TIMEOUT
+    assert all(status == OK for label, status in statuses(checks).items() if label != 'slow')
+
+
+def test_passed_checks_are_cached_while_the_key_holds(tmp_path):
+    cache_path = str(tmp_path / 'preflight.json')
+    calls = []
+    def counted():
+        calls.append(1)
+
+    def run(key):
+        checks = Preflight(LOG, cache_path, key, ttl=600)
+        checks.add('counted', counted)
+        checks.add('fails', fails)
+        checks.run()
+        return checks
+
+    run('a')
+    second = run('a')
+    assert len(calls) == 1
+    assert [check.cached for check in second.checks] == [True, False]
+    run('b')
+    assert len(calls) == 2
+
+
+def test_cache_key_follows_file_contents(tmp_path):
+    config = tmp_path / 'client_env.sh'
+    config.write_text('AWS_REGION=eu-west-1\n')
+    key = preflight.cache_key([str(config)], ['key-name'])
+    assert preflight.cache_key([str(config)], ['key-name']) == key
+    assert preflight.cache_key([str(config)], ['other-key']) != key
+    config.write_text('AWS_REGION=us-east-1\n')
+    assert preflight.cache_key([str(config)], ['key-name']) != key
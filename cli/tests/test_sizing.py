@@ -0,0 +1,85 @@
+#   Copyright (c) 2016 Cisco and/or its affiliates.
+#   This software is licensed to you under the terms of the Apache License, Version 2.0
+#   (the "License").
+#   You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   Unless required by applicable law or agreed to separately in writing, software distributed
+#   under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+#   ANY KIND, either express or implied.
+#
+#   Purpose: Tests for sizing
+
+import os
+import copy
+
+import pytest
+
+import sizing
+import instance_profiles
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+CAPACITY = sizing.load_capacity(os.path.join(ROOT, 'cloud-formation', 'standard', sizing.CAPACITY_FILE))
+# as validation.json for the standard flavour
+LIMITS = {'zk-nodes': [1, 3, 5], 'kafka-nodes': range(1, 11), 'opentsdb-nodes': range(1, 21), 'datanodes': range(1, 21)}
+
+
+def validate(count_name, count):
+    return count in LIMITS[count_name]
+
+
+def test_small_workload():
+    plan = sizing.plan_cluster(CAPACITY, 1, 1, 3, 1000, validate)
+    roles = plan['roles']
+    assert roles[sizing.KAFKA]['count'] == 2
+    assert roles[sizing.KAFKA]['limited_by'] == 'replication'
+    assert roles[sizing.DATANODE]['count'] == 3
+    assert roles[sizing.DATANODE]['volume_gb'] == CAPACITY['roles'][sizing.DATANODE]['min_volume_gb']
+    assert roles[sizing.OPENTSDB]['count'] == 1
+    assert roles[sizing.ZOOKEEPER]['count'] == 3
+    assert plan['node_counts'] == {'kafka-nodes': 2, 'datanodes': 3, 'opentsdb-nodes': 1, 'zk-nodes': 3}
+
+
+def test_storage_grows_datanodes_and_volumes():
+    small = sizing.plan_cluster(CAPACITY, 10, 1, 3, 0, validate)['roles'][sizing.DATANODE]
+    large = sizing.plan_cluster(CAPACITY, 10, 30, 3, 0, validate)['roles'][sizing.DATANODE]
+    assert large['count'] * large['volume_gb'] > small['count'] * small['volume_gb']
+    assert large['volume_gb'] % sizing.VOLUME_STEP_GB == 0
+
+
+def test_a_single_broker_and_datanode_need_a_single_zookeeper():
+    capacity = copy.deepcopy(CAPACITY)
+    capacity['roles'][sizing.KAFKA]['replication'] = 1
+    plan = sizing.plan_cluster(capacity, 1, 1, 1, 0, validate)
+    assert plan['node_counts'] == {'kafka-nodes': 1, 'datanodes': 1, 'opentsdb-nodes': 1, 'zk-nodes': 1}
+
+
+def test_counts_follow_validation():
+    limits = dict(LIMITS, datanodes=[4, 8, 16])
+    plan = sizing.plan_cluster(CAPACITY, 1, 1, 3, 0, lambda count_name, count: count in limits[count_name])
+    assert plan['node_counts']['datanodes'] == 4
+
+
+def test_larger_instance_types_are_tried_before_giving_up():
+    plan = sizing.plan_cluster(CAPACITY, 300, 1, 3, 0, validate)
+    kafka = plan['roles'][sizing.KAFKA]
+    assert kafka['instance_type'] != CAPACITY['roles'][sizing.KAFKA]['instance_types'][0]
+    assert validate('kafka-nodes', kafka['count'])
+
+
+def test_too_much_for_validation():
+    with pytest.raises(Exception):
+        sizing.plan_cluster(CAPACITY, 100000, 365, 3, 0, validate)
+
+
+def test_bad_replication():
+    with pytest.raises(Exception):
+        sizing.plan_cluster(CAPACITY, 1, 1, 0, 0, validate)
+
+
+def test_to_profiles():
+    plan = sizing.plan_cluster(CAPACITY, 1, 1, 3, 1000, validate)
+    profiles = instance_profiles.check(sizing.to_profiles(plan), ['kafka', 'cdh-dn', 'opentsdb', 'zk'])
+    assert profiles['kafka']['instance_type'] == plan['roles'][sizing.KAFKA]['instance_type']
+    assert profiles['cdh-dn']['volumes'] == {'count': 1, 'size_gb': plan['roles'][sizing.DATANODE]['volume_gb']}
+    assert 'volumes' not in profiles['opentsdb']
+    # zookeepers keep the template's instance type and volumes
+    assert 'zk' not in profiles
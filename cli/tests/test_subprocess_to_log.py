@@ -0,0 +1,83 @@
+#   Copyright (c) 2016 Cisco and/or its affiliates.
+#   This software is licensed to you under the terms of the Apache License, Version 2.0
+#   (the "License").
+#   You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   Unless required by applicable law or agreed to separately in writing, software distributed
+#   under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+#   ANY KIND, either express or implied.
+#
+#   Purpose: Tests for subprocess_to_log
+
+import os
+import time
+import logging
+import resource
+
+import pytest
+
+import subprocess_to_log
+
+LOGGER = logging.getLogger('test_subprocess_to_log')
+
+
+def test_output_and_exit_code():
+    output = []
+    stats = {}
+    ret_val = subprocess_to_log.call(['sh', '-c', 'echo one; echo two >&2; echo three; exit 3'], LOGGER,
+                                     output=output, stats=stats)
+    assert ret_val == 3
+    assert output == ['one', 'three']
+    assert stats['exit_code'] == 3
+
+
+def test_returns_when_a_grandchild_keeps_the_pipes_open():
+    # like an ssh ControlMaster started by the first connection to a host
+    output = []
+    start = time.time()
+    ret_val = subprocess_to_log.call(['sh', '-c', '(sleep 8 >&2 &) ; echo hi'], LOGGER, output=output)
+    assert ret_val == 0
+    assert output == ['hi']
+    assert time.time() - start < 3
+
+
+def test_timeout():
+    start = time.time()
+    with pytest.raises(Exception) as raised:
+        subprocess_to_log.call(['sleep', '10'], LOGGER, log_id='sleeper', timeout=1)
+    assert 'timed out' in str(raised.value)
+    assert time.time() - start < 8
+
+
+def test_scan_for_errors():
+    with pytest.raises(Exception) as raised:
+        subprocess_to_log.call(['sh', '-c', 'echo lost connection; sleep 10'], LOGGER, scan_for_errors=['lost connection'])
+    assert 'lost connection' in str(raised.value)
+
+
+def test_descriptors_past_fd_setsize():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard != resource.RLIM_INFINITY and hard < 1200:
+        pytest.skip('needs more than 1200 open files')
+    resource.setrlimit(resource.RLIMIT_NOFILE, (max(soft, 1200), hard))
+    held = [os.open(os.devnull, os.O_RDONLY) for _ in range(1100)]
+    try:
+        output = []
+        ret_val = subprocess_to_log.call(['sh', '-c', 'echo hello; echo err >&2'], LOGGER, output=output)
+    finally:
+        for fileno in held:
+            os.close(fileno)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (soft, hard))
+    assert ret_val == 0
+    assert output == ['hello']
+
+
+def test_a_failed_pump_fails_its_calls(monkeypatch):
+    def broken(filenos, timeout):
+        raise ValueError('filedescriptor out of range in select()')
+    monkeypatch.setattr(subprocess_to_log, 'PUMP', subprocess_to_log.OutputPump())
+    monkeypatch.setattr(subprocess_to_log, '_wait_readable', broken)
+    start = time.time()
+    with pytest.raises(Exception) as raised:
+        subprocess_to_log.call(['sleep', '10'], LOGGER, log_id='sleeper')
+    assert 'filedescriptor out of range' in str(raised.value)
+    assert time.time() - start < 5
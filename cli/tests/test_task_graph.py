@@ -0,0 +1,90 @@
+#   Copyright (c) 2016 Cisco and/or its affiliates.
+#   This software is licensed to you under the terms of the Apache License, Version 2.0
+#   (the "License").
+#   You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   Unless required by applicable law or agreed to separately in writing, software distributed
+#   under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+#   ANY KIND, either express or implied.
+#
+#   Purpose: Tests for task_graph
+
+import threading
+
+from task_graph import TaskGraph, SKIPPED
+from worker_pool import WorkerPool, SUCCEEDED
+
+
+def pool():
+    return WorkerPool(4, initial_workers=4, ramp_interval=0, fail_fast=False)
+
+
+def recorder():
+    order = []
+    lock = threading.Lock()
+    def record(name):
+        with lock:
+            order.append(name)
+    return order, record
+
+
+def fail(name):
+    raise Exception('%s failed' % name)
+
+
+def test_dependencies_run_first():
+    order, record = recorder()
+    graph = TaskGraph()
+    graph.add('saltmaster', record, ['saltmaster'])
+    for host in ['kafka-1', 'cdh-dn-1', 'cdh-dn-2']:
+        graph.add('%s base' % host, record, ['%s base' % host])
+        graph.add('%s minion' % host, record, ['%s minion' % host], depends_on=['saltmaster', '%s base' % host])
+    graph.run(pool())
+    assert len(order) == 7
+    for host in ['kafka-1', 'cdh-dn-1', 'cdh-dn-2']:
+        assert order.index('%s minion' % host) > order.index('saltmaster')
+        assert order.index('%s minion' % host) > order.index('%s base' % host)
+    assert all(task.state == SUCCEEDED for task in graph.tasks.values())
+    assert graph.skipped() == []
+
+
+def test_failures_skip_everything_downstream():
+    order, record = recorder()
+    graph = TaskGraph()
+    graph.add('base', fail, ['base'])
+    graph.add('minion', record, ['minion'], depends_on=['base'])
+    graph.add('highstate', record, ['highstate'], depends_on=['minion'])
+    graph.add('other', record, ['other'])
+    graph.run(pool())
+    assert order == ['other']
+    assert graph.skipped() == ['minion', 'highstate']
+
+
+def test_tasks_added_while_running():
+    order, record = recorder()
+    graph = TaskGraph()
+    all_added = threading.Event()
+    graph.add('saltmaster', record, ['saltmaster'])
+
+    def add_later():
+        graph.add('kafka-1 minion', record, ['kafka-1 minion'], depends_on=['saltmaster'])
+        all_added.set()
+    timer = threading.Timer(0.2, add_later)
+    timer.start()
+    graph.run(pool(), all_added)
+    timer.join()
+    assert order == ['saltmaster', 'kafka-1 minion']
+
+
+def test_tasks_added_after_a_failed_dependency_are_skipped():
+    graph = TaskGraph()
+    all_added = threading.Event()
+    graph.add('saltmaster', fail, ['saltmaster'])
+
+    def add_later():
+        graph.add('kafka-1 minion', lambda: None, depends_on=['saltmaster'])
+        all_added.set()
+    timer = threading.Timer(0.2, add_later)
+    timer.start()
+    graph.run(pool(), all_added)
+    timer.join()
+    assert graph.tasks['kafka-1 minion'].state == SKIPPED
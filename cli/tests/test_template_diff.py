@@ -0,0 +1,75 @@
+#   Copyright (c) 2016 Cisco and/or its affiliates.
+#   This software is licensed to you under the terms of the Apache License, Version 2.0
+#   (the "License").
+#   You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   Unless required by applicable law or agreed to separately in writing, software distributed
+#   under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+#   ANY KIND, either express or implied.
+#
+#   Purpose: Tests for template_diff
+
+import copy
+
+import template_diff
+from template_diff import ADD, REMOVE, MODIFY, REPLACE
+
+
+def instance(instance_type='m4.xlarge', volume_size='1024'):
+    return {'Type': 'AWS::EC2::Instance',
+            'Properties': {'InstanceType': instance_type, 'ImageId': {'Ref': 'imageId'},
+                           'BlockDeviceMappings': [{'DeviceName': '/dev/sdd', 'Ebs': {'VolumeSize': volume_size}}]}}
+
+
+def template(**resources):
+    return {'Parameters': {'imageId': {'Type': 'String'}}, 'Resources': resources}
+
+
+def test_no_changes():
+    deployed = template(instanceCdhDn1=instance())
+    assert template_diff.diff_templates(deployed, copy.deepcopy(deployed)) == []
+
+
+def test_added_and_removed_resources():
+    deployed = template(instanceCdhDn1=instance(), instanceKafka1=instance())
+    generated = template(instanceCdhDn1=instance(), instanceCdhDn2=instance())
+    changes = template_diff.diff_templates(deployed, generated)
+    assert changes == [(ADD, 'instanceCdhDn2', 'AWS::EC2::Instance', []),
+                       (REMOVE, 'instanceKafka1', 'AWS::EC2::Instance', [])]
+    assert template_diff.destructive(changes) == [changes[1]]
+
+
+def test_block_device_change_replaces_the_instance():
+    changes = template_diff.diff_templates(template(instanceCdhDn1=instance()),
+                                           template(instanceCdhDn1=instance(volume_size='2048')))
+    assert changes == [(REPLACE, 'instanceCdhDn1', 'AWS::EC2::Instance', ['BlockDeviceMappings'])]
+    assert template_diff.destructive(changes) == changes
+
+
+def test_launch_template_change_replaces_the_instance():
+    generated = instance()
+    generated['Properties']['LaunchTemplate'] = {'LaunchTemplateId': {'Ref': 'launchTemplateX'}, 'Version': '1'}
+    changes = template_diff.diff_templates(template(instanceCdhDn1=instance()), template(instanceCdhDn1=generated))
+    assert changes[0][0] == REPLACE
+
+
+def test_instance_type_change_restarts_the_instance():
+    changes = template_diff.diff_templates(template(instanceCdhDn1=instance()),
+                                           template(instanceCdhDn1=instance(instance_type='m4.2xlarge')))
+    assert changes == [(MODIFY, 'instanceCdhDn1', 'AWS::EC2::Instance', ['InstanceType'])]
+    assert template_diff.destructive(changes) == changes
+
+
+def test_nested_stack_urls_compare_by_object_name():
+    deployed = template(stackInstanceCdhDn={'Type': 'AWS::CloudFormation::Stack',
+                                            'Properties': {'TemplateURL': 'https://s3/bucket/pnda/child-abc?Signature=1'}})
+    generated = template(stackInstanceCdhDn={'Type': 'AWS::CloudFormation::Stack',
+                                             'Properties': {'TemplateURL': 'child-abc'}})
+    assert template_diff.diff_templates(deployed, generated) == []
+
+
+def test_section_changes():
+    generated = template(instanceCdhDn1=instance())
+    generated['Parameters']['keyName'] = {'Type': 'String'}
+    changes = template_diff.diff_templates(template(instanceCdhDn1=instance()), generated)
+    assert changes == [(MODIFY, 'Parameters', 'template section', [])]
+    assert template_diff.destructive(changes) == []
@@ -0,0 +1,86 @@
+#   Copyright (c) 2016 Cisco and/or its affiliates.
+#   This software is licensed to you under the terms of the Apache License, Version 2.0
+#   (the "License").
+#   You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   Unless required by applicable law or agreed to separately in writing, software distributed
+#   under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+#   ANY KIND, either express or implied.
+#
+#   Purpose: Tests for template_engine
+
+import os
+import json
+import copy
+
+import pytest
+
+import template_engine
+import instance_profiles
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+TEMPLATE = os.path.join(ROOT, 'cloud-formation', 'standard', 'cf-tmpl.json')
+NODE_COUNTS = {'datanodes': 3, 'opentsdb-nodes': 2, 'kafka-nodes': 2, 'zk-nodes': 3}
+
+
+def legacy_render(filepath, node_counts):
+    """ The expansion the CLI did before template_engine: a text replace on each role's json """
+    with open(filepath, 'r') as template_file:
+        template_data = json.load(template_file)
+    with open(os.path.join(os.path.dirname(filepath), template_engine.INDEXED_ROLES_FILE), 'r') as roles_file:
+        indexed_roles = json.load(roles_file)
+    for resource_name, count_name in indexed_roles.items():
+        resource = json.dumps(template_data['Resources'].pop(resource_name))
+        for node_idx in range(1, node_counts[count_name] + 1):
+            template_data['Resources']['%s%s' % (resource_name, node_idx)] = \
+                json.loads(resource.replace(template_engine.PLACEHOLDER, str(node_idx)))
+    return template_data
+
+
+@pytest.mark.parametrize('node_counts', [NODE_COUNTS, {'datanodes': 1, 'opentsdb-nodes': 1, 'kafka-nodes': 1, 'zk-nodes': 1},
+                                         {'datanodes': 40, 'opentsdb-nodes': 0, 'kafka-nodes': 12, 'zk-nodes': 5}])
+def test_render_matches_the_legacy_expansion(node_counts):
+    rendered = template_engine.CompiledTemplate(TEMPLATE).render(node_counts)
+    assert template_engine.to_json(rendered) == template_engine.to_json(legacy_render(TEMPLATE, node_counts))
+
+
+def test_renders_do_not_share_changed_parts():
+    compiled = template_engine.CompiledTemplate(TEMPLATE)
+    first = compiled.render(NODE_COUNTS)
+    expected = copy.deepcopy(first)
+    compiled.render({'datanodes': 5, 'opentsdb-nodes': 1, 'kafka-nodes': 1, 'zk-nodes': 1})
+    assert first == expected
+    assert first['Resources']['instanceCdhDn1'] is not first['Resources']['instanceCdhDn2']
+
+
+def test_profiles_change_only_their_role_and_are_kept_in_metadata():
+    profiles = {'cdh-dn': [{'nodes': '2-3', 'instance_type': 'm4.4xlarge'}]}
+    compiled = template_engine.CompiledTemplate(TEMPLATE)
+    rendered = compiled.render(NODE_COUNTS, profiles)
+    plain = compiled.render(NODE_COUNTS)
+    resources = rendered['Resources']
+    assert resources['instanceCdhDn1'] == plain['Resources']['instanceCdhDn1']
+    assert resources['instanceCdhDn2']['Properties']['InstanceType'] == 'm4.4xlarge'
+    assert resources['instanceKafka1'] == plain['Resources']['instanceKafka1']
+    assert rendered['Metadata'][instance_profiles.METADATA_KEY] == profiles
+    assert instance_profiles.METADATA_KEY not in compiled.template.get('Metadata', {})
+
+
+def test_nest_moves_copies_into_child_stacks():
+    compiled = template_engine.CompiledTemplate(TEMPLATE)
+    rendered = compiled.render(NODE_COUNTS)
+    parent, children = compiled.nest(rendered)
+    assert not any(name.startswith('instanceCdhDn') for name in parent['Resources'])
+    child = children['stackInstanceCdhDn']
+    assert sorted(child['Resources']) == ['instanceCdhDn1', 'instanceCdhDn2', 'instanceCdhDn3']
+    stack = parent['Resources']['stackInstanceCdhDn']
+    assert stack['Type'] == 'AWS::CloudFormation::Stack'
+    assert sorted(stack['Properties']['Parameters']) == sorted(child['Parameters'])
+    for ref in child['Parameters']:
+        assert ref in parent['Parameters'] or ref in parent['Resources']
+    # every resource ends up in exactly one template
+    nested = sum(len(child['Resources']) for child in children.values())
+    assert len(parent['Resources']) - len(children) + nested == len(rendered['Resources'])
+
+
+def test_load_reuses_the_compiled_template():
+    assert template_engine.load(TEMPLATE) is template_engine.load(TEMPLATE)
@@ -0,0 +1,87 @@
+#   Copyright (c) 2016 Cisco and/or its affiliates.
+#   This software is licensed to you under the terms of the Apache License, Version 2.0
+#   (the "License").
+#   You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   Unless required by applicable law or agreed to separately in writing, software distributed
+#   under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+#   ANY KIND, either express or implied.
+#
+#   Purpose: Tests for worker_pool
+
+import time
+import threading
+
+import pytest
+
+from worker_pool import WorkerPool, SUCCEEDED, FAILED, CANCELLED
+
+
+class Concurrency(object):
+    """ Counts how many calls of a task are running at once """
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.running = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, value):
+        with self._lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        time.sleep(self.seconds)
+        with self._lock:
+            self.running -= 1
+        return value
+
+
+def fail():
+    raise Exception('boom')
+
+
+def test_results():
+    pool = WorkerPool(4, initial_workers=4, ramp_interval=0)
+    futures = [pool.submit('task-%s' % idx, lambda value: value * 2, idx) for idx in range(10)]
+    pool.wait()
+    assert [future.result() for future in futures] == [idx * 2 for idx in range(10)]
+    assert pool.failures() == []
+    assert pool.summary()[-1] == '  10 of 10 succeeded'
+
+
+def test_never_runs_more_than_max_workers():
+    task = Concurrency(0.05)
+    pool = WorkerPool(3, initial_workers=3, ramp_interval=0)
+    for idx in range(12):
+        pool.submit('task-%s' % idx, task, idx)
+    pool.wait()
+    assert task.peak == 3
+
+
+def test_ramps_up_from_initial_workers():
+    task = Concurrency(0.3)
+    pool = WorkerPool(8, initial_workers=1, ramp_interval=10)
+    for idx in range(4):
+        pool.submit('task-%s' % idx, task, idx)
+    pool.wait()
+    assert task.peak == 1
+
+
+def test_fail_fast_cancels_what_has_not_started():
+    pool = WorkerPool(1, initial_workers=1, ramp_interval=0)
+    failed = pool.submit('fails', fail)
+    later = [pool.submit('later-%s' % idx, time.sleep, 0) for idx in range(3)]
+    pool.wait()
+    assert failed.state == FAILED
+    assert 'boom' in failed.error
+    assert [future.state for future in later] == [CANCELLED] * 3
+    assert pool.submit('after', time.sleep, 0).state == CANCELLED
+    with pytest.raises(Exception):
+        failed.result()
+
+
+def test_keep_going():
+    pool = WorkerPool(2, initial_workers=2, ramp_interval=0, fail_fast=False)
+    pool.submit('fails', fail)
+    others = [pool.submit('other-%s' % idx, time.sleep, 0) for idx in range(3)]
+    pool.wait()
+    assert [future.state for future in others] == [SUCCEEDED] * 3
+    assert [future.key for future in pool.failures()] == ['fails']
@@ -0,0 +1,174 @@
+#   Copyright (c) 2016 Cisco and/or its affiliates.
+#   This software is licensed to you under the terms of the Apache License, Version 2.0
+#   (the "License").
+#   You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   Unless required by applicable law or agreed to separately in writing, software distributed
+#   under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+#   ANY KIND, either express or implied.
+#
+#   Purpose: Record timing spans for phases and host steps and export them as traces
+
+import os
+import json
+import time
+import threading
+
+PHASE = 'phase'
+STEP = 'step'
+COMMAND = 'command'
+
+
+class Span(object):
+    def __init__(self, span_id, parent_id, name, category, host, args):
+        self.span_id = span_id
+        self.parent_id = parent_id
+        self.name = name
+        self.category = category
+        self.host = host
+        self.args = args
+        self.thread = threading.current_thread().name
+        self.start = time.time()
+        self.end = None
+        self.error = None
+
+    def duration(self):
+        return (self.end or time.time()) - self.start
+
+    def to_dict(self):
+        return {'id': self.span_id, 'parent': self.parent_id, 'name': self.name, 'category': self.category,
+                'host': self.host, 'thread': self.thread, 'start': self.start, 'end': self.end,
+                'duration': self.duration(), 'error': self.error, 'args': self.args}
+
+
+class _SpanContext(object):
+    def __init__(self, tracer, span):
+        self.tracer = tracer
+        self.span = span
+
+    def __enter__(self):
+        return self.span
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        if exc_value is not None:
+            self.span.error = str(exc_value)
+        self.tracer._finish(self.span)
+        return False
+
+
+class Tracer(object):
+    """
+    Collects spans from any thread. Spans opened while another is open on the same
+    thread become its children. Attributes such as the command, exit code and output
+    size go in span.args.
+    """
+    def __init__(self):
+        self.spans = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._next_id = 1
+
+    def span(self, name, category, host=None, **args):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        with self._lock:
+            span_id = self._next_id
+            self._next_id += 1
+        span = Span(span_id, stack[-1].span_id if stack else None, name, category, host, args)
+        stack.append(span)
+        with self._lock:
+            self.spans.append(span)
+        return _SpanContext(self, span)
+
+    def bind(self, target):
+        """ Wraps target so spans it opens, on whichever thread, are children of the span open here now """
+        parent = self.current()
+        def run(*args, **kwargs):
+            previous = getattr(self._local, 'stack', None)
+            self._local.stack = [parent] if parent is not None else []
+            try:
+                return target(*args, **kwargs)
+            finally:
+                self._local.stack = previous
+        return run
+
+    def current(self):
+        """
+        Returns the span that work on this thread belongs to: the innermost open host
+        step on this thread, otherwise the innermost phase on this thread, otherwise the
+        most recently started phase still open anywhere.
+        """
+        stack = getattr(self._local, 'stack', None) or []
+        for category in (STEP, PHASE):
+            for span in reversed(stack):
+                if span.category == category and span.end is None:
+                    return span
+        with self._lock:
+            phases = [span for span in self.spans if span.category == PHASE and span.end is None]
+        return phases[-1] if phases else None
+
+    def _finish(self, span):
+        span.end = time.time()
+        stack = self._local.stack
+        if span in stack:
+            stack.remove(span)
+
+    def write_jsonl(self, path):
+        with open(path, 'w') as trace_file:
+            for span in sorted(self.spans, key=lambda span: span.start):
+                trace_file.write(json.dumps(span.to_dict(), sort_keys=True))
+                trace_file.write('\n')
+
+    def write_chrome_trace(self, path):
+        """ Writes the spans in the Chrome trace event format, which Perfetto can also load """
+        events = []
+        thread_ids = {}
+        for span in sorted(self.spans, key=lambda span: span.start):
+            if span.thread not in thread_ids:
+                thread_ids[span.thread] = len(thread_ids) + 1
+                events.append({'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': thread_ids[span.thread],
+                               'args': {'name': span.thread}})
+            args = dict(span.args)
+            if span.host is not None:
+                args['host'] = span.host
+            if span.error is not None:
+                args['error'] = span.error
+            events.append({'name': span.name if span.host is None else '%s %s' % (span.name, span.host),
+                           'cat': span.category, 'ph': 'X', 'pid': os.getpid(), 'tid': thread_ids[span.thread],
+                           'ts': int(span.start * 1000000), 'dur': int(span.duration() * 1000000), 'args': args})
+        with open(path, 'w') as trace_file:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, trace_file)
+
+    def report(self, top=5):
+        """
+        Returns lines summarising the run: each phase with the host step that finished
+        last inside it, which is the one the phase waited for, then the slowest hosts
+        and the slowest individual steps.
+        """
+        with self._lock:
+            spans = list(self.spans)
+        phases = sorted([span for span in spans if span.category == PHASE], key=lambda span: span.start)
+        steps = [span for span in spans if span.category == STEP]
+        lines = ['Critical path:']
+        for phase in phases:
+            inside = [step for step in steps if step.end is not None and phase.start <= step.start and
+                      (phase.end is None or step.end <= phase.end)]
+            line = '  %-24s %8.1fs' % (phase.name, phase.duration())
+            if len(inside) > 0:
+                last = max(inside, key=lambda step: step.end)
+                line += '   last to finish: %s %s (%.1fs)' % (last.name, last.host, last.duration())
+            if phase.error is not None:
+                line += '   FAILED'
+            lines.append(line)
+
+        host_totals = {}
+        for step in steps:
+            host_totals[step.host] = host_totals.get(step.host, 0) + step.duration()
+        if len(host_totals) > 0:
+            lines.append('Slowest hosts:')
+            for host, total in sorted(host_totals.items(), key=lambda item: -item[1])[:top]:
+                lines.append('  %-40s %8.1fs' % (host, total))
+            lines.append('Slowest steps:')
+            for step in sorted(steps, key=lambda step: -step.duration())[:top]:
+                lines.append('  %-40s %8.1fs' % ('%s %s' % (step.name, step.host), step.duration()))
+        return lines
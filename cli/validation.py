@@ -0,0 +1,76 @@
+#   Copyright (c) 2016 Cisco and/or its affiliates.
+#   This software is licensed to you under the terms of the Apache License, Version 2.0
+#   (the "License").
+#   You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   Unless required by applicable law or agreed to separately in writing, software distributed
+#   under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+#   ANY KIND, either express or implied.
+#
+#   Purpose: Checks of cluster names and node counts against the limits in the flavour's validation.json
+
+import re
+import json
+import argparse
+
+import cluster_context
+
+NAME_REGEX = r"^[\.a-zA-Z0-9-]+$"
+
+
+def name_string(value):
+    try:
+        return re.match(NAME_REGEX, value).group(0)
+    except:
+        raise argparse.ArgumentTypeError("String '%s' may contain only  a-z 0-9 and '-'" % value)
+
+
+def get_validation(param_name):
+    return cluster_context.current().validation_rules[param_name]
+
+
+def check_validation(restriction, value):
+    if restriction.startswith("<="):
+        return value <= int(restriction[2:])
+
+    if restriction.startswith(">="):
+        return value > int(restriction[2:])
+
+    if restriction.startswith("<"):
+        return value < int(restriction[1:])
+
+    if restriction.startswith(">"):
+        return value > int(restriction[1:])
+
+    if "-" in restriction:
+        restrict_min = int(restriction.split('-')[0])
+        restrict_max = int(restriction.split('-')[1])
+        return value >= restrict_min and value <= restrict_max
+
+    return value == int(restriction)
+
+
+def validate_size(param_name, value):
+    restrictions = get_validation(param_name)
+    for restriction in restrictions.split(','):
+        if check_validation(restriction, value):
+            return True
+    return False
+
+
+def node_limit(param_name, value):
+    as_num = None
+    try:
+        as_num = int(value)
+    except:
+        raise argparse.ArgumentTypeError("'%s' must be an integer, %s found" % (param_name, value))
+
+    if not validate_size(param_name, as_num):
+        raise argparse.ArgumentTypeError("'%s' is not in valid range %s" % (as_num, get_validation(param_name)))
+
+    return as_num
+
+
+def load_validation_rules(flavour):
+    validation_file = file('cloud-formation/%s/validation.json' % flavour)
+    cluster_context.current().validation_rules = json.load(validation_file)
+    validation_file.close()
@@ -0,0 +1,162 @@
+#   Copyright (c) 2016 Cisco and/or its affiliates.
+#   This software is licensed to you under the terms of the Apache License, Version 2.0
+#   (the "License").
+#   You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+#   Unless required by applicable law or agreed to separately in writing, software distributed
+#   under the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+#   ANY KIND, either express or implied.
+#
+#   Purpose: Bounded thread pool with adaptive ramp-up, used to run per host work such as bootstrap
+
+import time
+import threading
+import traceback
+from collections import deque
+
+PENDING = 'PENDING'
+RUNNING = 'RUNNING'
+SUCCEEDED = 'SUCCEEDED'
+FAILED = 'FAILED'
+CANCELLED = 'CANCELLED'
+
+
+class Future(object):
+    def __init__(self, key):
+        self.key = key
+        self.state = PENDING
+        self.error = None
+        self.start_time = None
+        self.end_time = None
+        self._result = None
+        self._done = threading.Event()
+
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        self._done.wait(timeout)
+        return self.done()
+
+    def result(self, timeout=None):
+        if not self.wait(timeout):
+            raise Exception('Timed out waiting for %s' % self.key)
+        if self.state == FAILED:
+            raise Exception('%s failed: %s' % (self.key, self.error))
+        if self.state == CANCELLED:
+            raise Exception('%s was cancelled' % self.key)
+        return self._result
+
+    def duration(self):
+        if self.start_time is None:
+            return 0.0
+        return (self.end_time or time.time()) - self.start_time
+
+    def _start(self):
+        self.state = RUNNING
+        self.start_time = time.time()
+
+    def _finish(self, state, result=None, error=None):
+        self.state = state
+        self._result = result
+        self.error = error
+        self.end_time = time.time()
+        self._done.set()
+
+
+class WorkerPool(object):
+    """
+    Runs submitted callables on at most max_workers threads.
+
+    Rather than starting every task at once, the number of tasks allowed to run
+    grows by one every ramp_interval seconds from initial_workers up to max_workers.
+    Each failure halves the allowance, so a struggling bastion gets some relief before
+    the pool ramps back up. With fail_fast set, the first failure cancels every task
+    that has not started yet.
+    """
+    def __init__(self, max_workers, initial_workers=2, ramp_interval=1.0, fail_fast=True):
+        self.max_workers = max(1, max_workers)
+        self.ramp_interval = ramp_interval
+        self.fail_fast = fail_fast
+        self.futures = []
+        self._limit = max(1, min(initial_workers, self.max_workers))
+        self._active = 0
+        self._last_start = 0
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._aborted = False
+        self._workers = 0
+
+    def submit(self, key, target, *args, **kwargs):
+        future = Future(key)
+        with self._cond:
+            self.futures.append(future)
+            if self._aborted:
+                future._finish(CANCELLED)
+                return future
+            self._queue.append((future, target, args, kwargs))
+            if self._workers < min(self.max_workers, len(self._queue) + self._active):
+                self._workers += 1
+                thread = threading.Thread(target=self._worker)
+                thread.daemon = True
+                thread.start()
+            self._cond.notify_all()
+        return future
+
+    def _next_task(self):
+        with self._cond:
+            while True:
+                if not self._queue:
+                    self._workers -= 1
+                    return None
+                now = time.time()
+                ramped = now - self._last_start >= self.ramp_interval
+                if self._active < self._limit:
+                    break
+                if ramped and self._limit < self.max_workers:
+                    self._limit += 1
+                    break
+                self._cond.wait(max(0.05, self.ramp_interval - (now - self._last_start)))
+            self._active += 1
+            self._last_start = time.time()
+            return self._queue.popleft()
+
+    def _worker(self):
+        while True:
+            task = self._next_task()
+            if task is None:
+                return
+            future, target, args, kwargs = task
+            future._start()
+            try:
+                future._finish(SUCCEEDED, result=target(*args, **kwargs))
+            except:
+                future._finish(FAILED, error=traceback.format_exc())
+            with self._cond:
+                self._active -= 1
+                if future.state == FAILED:
+                    self._limit = max(1, self._limit // 2)
+                    if self.fail_fast:
+                        self._cancel_pending()
+                self._cond.notify_all()
+
+    def _cancel_pending(self):
+        self._aborted = True
+        while self._queue:
+            future = self._queue.popleft()[0]
+            future._finish(CANCELLED)
+
+    def wait(self):
+        for future in list(self.futures):
+            future.wait()
+        return self.futures
+
+    def failures(self):
+        return [future for future in self.futures if future.state != SUCCEEDED]
+
+    def summary(self):
+        lines = []
+        for future in sorted(self.futures, key=lambda f: f.key):
+            lines.append('  %-40s %-10s %7.1fs' % (future.key, future.state, future.duration()))
+        succeeded = len([future for future in self.futures if future.state == SUCCEEDED])
+        lines.append('  %s of %s succeeded' % (succeeded, len(self.futures)))
+        return lines